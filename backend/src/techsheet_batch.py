@@ -0,0 +1,249 @@
+import csv, json, time, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Iterable, Union, Callable
+
+from backend.src.techsheet_processor import (
+    PIPELINE_STAGES, CATALOG_STAGES, new_request_state, run_guarded_stage,
+    mark_request_success, mark_request_partial, finish_request, lookup_catalog,
+)
+from backend.src.techsheet_browser_pool import BROWSER_POOL_SIZE
+from backend.src.techsheet_dag import StageGraphRun, STAGE_SUCCESS, STAGE_STOPPED, STAGE_ERROR, STAGE_TIMEOUT
+from backend.src.techsheet_deadline import DeadlineExceeded
+
+# ------------------------------------------------------------
+# Génération de fiches en masse (nomenclature complète)
+# ------------------------------------------------------------
+# Nombre de workers par étape : le LLM et la recherche sont limités par les
+# quotas distants. L'étape PDF passe par le pool de navigateurs partagé, qui
+# n'ouvre qu'un contexte à la fois par Chromium : au-delà de
+# BROWSER_POOL_SIZE workers, les pages attendraient dans sa file.
+DEFAULT_STAGE_WORKERS = {
+    "catalog": 2,
+    "search": 4,
+    "scrape": 8,
+    "reduce": 4,
+    "llm": 4,
+    "image": 8,
+    "docx": 2,
+    "pdf": BROWSER_POOL_SIZE,
+}
+
+# Étape d'entrée : ses workers créent l'état des produits au fil de l'eau
+ENTRY_STAGE = next(name for name, _, deps in PIPELINE_STAGES if not deps)
+
+CSV_COLUMNS = {
+    "titre": ("titre", "titre_produit", "titre/nom du produit", "nom"),
+    "marque": ("marque", "brand"),
+    "reference": ("reference", "référence", "ref", "réf"),
+    "domains": ("domains", "domaines", "nom de domaine", "sites"),
+}
+
+def _split_domains(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [d.strip() for d in value if d and d.strip()]
+    return [d.strip() for d in str(value).replace("|", ";").replace(",", ";").split(";") if d.strip()]
+
+def normalize_batch_item(item: Union[Dict[str, Any], tuple, list]) -> Dict[str, Any]:
+    if isinstance(item, dict):
+        lowered = {str(k).strip().lower(): v for k, v in item.items()}
+        fields = {}
+        for field, aliases in CSV_COLUMNS.items():
+            fields[field] = next((lowered[a] for a in aliases if a in lowered), None)
+    else:
+        values = list(item) + [None] * (4 - len(item))
+        fields = dict(zip(("titre", "marque", "reference", "domains"), values[:4]))
+    return {
+        "titre": (fields["titre"] or "").strip(),
+        "marque": (fields["marque"] or "").strip(),
+        "reference": (fields["reference"] or "").strip(),
+        "domains": _split_domains(fields["domains"]),
+    }
+
+def load_batch_csv(csv_path: str) -> List[Dict[str, Any]]:
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        return [normalize_batch_item(row) for row in reader if any((v or "").strip() for v in row.values() if isinstance(v, str))]
+
+class _BatchPipeline:
+    # Chaque étape dispose de son propre pool de threads : une requête passe
+    # à ses étapes suivantes dès que leurs dépendances sont terminées, si bien
+    # que la recherche du produit N+1 se fait pendant l'appel LLM du produit N.
+    # Les produits déjà au catalogue suivent CATALOG_STAGES : leurs étapes
+    # image/pdf/docx partagent les pools du même nom.
+    #
+    # L'état d'un produit (et son dossier techsheet/data/<uuid>) n'est créé
+    # qu'au moment où un worker de la première étape le prend en charge : un
+    # lot de mille lignes ne crée pas mille dossiers d'avance, et le temps
+    # d'exécution d'un produit ne compte pas son attente dans la file.
+    #
+    # DeadlineExceeded dérive de BaseException : non rattrapée, elle finirait
+    # dans le Future du pool, le produit ne serait jamais enregistré et
+    # wait() ne rendrait pas la main. _enter et _run la traitent explicitement.
+    def __init__(self, stage_workers: Dict[str, int], template_path: str,
+                 on_item_done: Optional[Callable[[int, Dict[str, Any]], None]] = None):
+        self.template_path = template_path
+        names = list(dict.fromkeys(name for name, _, _ in PIPELINE_STAGES + CATALOG_STAGES))
+        self.executors = {
+            name: ThreadPoolExecutor(max_workers=max(1, stage_workers.get(name, 1)), thread_name_prefix=f"batch-{name}")
+            for name in names
+        }
+        self.on_item_done = on_item_done
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self.stage_busy = {name: 0.0 for name in names}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._all_done = threading.Event()
+        self._all_done.set()
+
+    def submit(self, index: int, item: Dict[str, Any]) -> None:
+        with self._lock:
+            self._pending += 1
+            self._all_done.clear()
+        self.executors[ENTRY_STAGE].submit(self._enter, index, item)
+
+    def _enter(self, index: int, item: Dict[str, Any]) -> None:
+        # Exécuté par un worker de la première étape du pipeline
+        try:
+            state = new_request_state(item["titre"], item["marque"], item["reference"], self.template_path, item["domains"])
+            # Comme process_techsheet_request : un produit connu saute recherche, scraping et LLM
+            state["catalog_entry"] = lookup_catalog(state)
+        except DeadlineExceeded as e:
+            self._record(index, {"status": "error", "message": f"Échéance dépassée avant le traitement: {e}"})
+            return
+        except Exception as e:
+            self._record(index, {"status": "error", "message": f"Une erreur inattendue est survenue: {e}"})
+            return
+        stages = CATALOG_STAGES if state["catalog_entry"] is not None else PIPELINE_STAGES
+        graph = {name: stage for name, stage, _ in stages}
+        graph_run = StageGraphRun([(name, deps) for name, _, deps in stages])
+        for name in graph_run.start():
+            if name == ENTRY_STAGE:
+                # Déjà dans le bon pool : pas de second passage par la file
+                self._run(index, state, graph, graph_run, name)
+            else:
+                self._submit_stage(index, state, graph, graph_run, name)
+
+    def _submit_stage(self, index: int, state: Dict[str, Any], graph: Dict[str, Callable], graph_run: StageGraphRun, name: str) -> None:
+        self.executors[name].submit(self._run, index, state, graph, graph_run, name)
+
+    def _run(self, index: int, state: Dict[str, Any], graph: Dict[str, Callable], graph_run: StageGraphRun, name: str) -> None:
+        stage = graph[name]
+        try:
+            outcome = STAGE_SUCCESS if run_guarded_stage(state, name, stage) else STAGE_STOPPED
+        except DeadlineExceeded:
+            outcome = STAGE_TIMEOUT
+        except Exception:
+            outcome = STAGE_ERROR
+        with self._lock:
+            self.stage_busy[name] += state["output"]["stage_timings"].get(name, 0.0)
+
+        for next_name in graph_run.complete(name, outcome):
+            self._submit_stage(index, state, graph, graph_run, next_name)
+        if graph_run.claim_finish():
+            outcomes = graph_run.finalize()
+            state["output"]["stage_outcomes"] = outcomes
+            if graph_run.succeeded:
+                mark_request_success(state)
+            elif STAGE_TIMEOUT in outcomes.values():
+                mark_request_partial(state, outcomes)
+            self._finish(index, state)
+
+    def _finish(self, index: int, state: Dict[str, Any]) -> None:
+        self._record(index, finish_request(state))
+
+    def _record(self, index: int, output_data: Dict[str, Any]) -> None:
+        if self.on_item_done:
+            try:
+                self.on_item_done(index, output_data)
+            except Exception:
+                pass
+        with self._lock:
+            self.results[index] = output_data
+            self._pending -= 1
+            if self._pending == 0:
+                self._all_done.set()
+
+    def wait(self) -> None:
+        self._all_done.wait()
+
+    def shutdown(self) -> None:
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+
+def run_batch(items: Iterable[Union[Dict[str, Any], tuple, list]], template_path: str,
+              stage_workers: Optional[Dict[str, int]] = None,
+              on_item_done: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    workers = dict(DEFAULT_STAGE_WORKERS)
+    workers.update(stage_workers or {})
+    normalized = [normalize_batch_item(it) for it in items]
+
+    start_time = time.time()
+    pipeline = _BatchPipeline(workers, template_path, on_item_done=on_item_done)
+    try:
+        for index, item in enumerate(normalized):
+            pipeline.submit(index, item)
+        pipeline.wait()
+    finally:
+        pipeline.shutdown()
+    wall_time = time.time() - start_time
+
+    items_report = []
+    for index, item in enumerate(normalized):
+        result = pipeline.results.get(index, {})
+        items_report.append({"input": item, "result": result})
+
+    succeeded = sum(1 for r in pipeline.results.values() if r.get("status") == "success")
+    return {
+        "total": len(normalized),
+        "succeeded": succeeded,
+        "failed": len(normalized) - succeeded,
+        "wall_time": wall_time,
+        "throughput_per_minute": (len(normalized) / wall_time * 60) if wall_time > 0 else 0.0,
+        "stage_workers": workers,
+        # Temps cumulé passé dans chaque étape, toutes requêtes confondues
+        "stage_busy_time": pipeline.stage_busy,
+        "items": items_report,
+    }
+
+def run_batch_csv(csv_path: str, template_path: str, stage_workers: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    return run_batch(load_batch_csv(csv_path), template_path, stage_workers=stage_workers)
+
+def _parse_workers(values: Optional[List[str]]) -> Dict[str, int]:
+    workers = {}
+    for value in values or []:
+        name, _, count = value.partition("=")
+        if name not in DEFAULT_STAGE_WORKERS or not count.isdigit():
+            raise argparse.ArgumentTypeError(f"Valeur --workers invalide : {value}")
+        workers[name] = int(count)
+    return workers
+
+def main(argv: Optional[List[str]] = None) -> None:
+    project_root = Path(__file__).resolve().parent.parent.parent
+    parser = argparse.ArgumentParser(description="Génération de fiches techniques en masse à partir d'un CSV.")
+    parser.add_argument("csv_path", help="CSV avec les colonnes titre, marque, reference, domains")
+    parser.add_argument("--template", default=str(project_root / "techsheet" / "Fiche_Technique_Modele.docx"))
+    parser.add_argument("--workers", nargs="*", metavar="ETAPE=N", help="Ex: --workers llm=6 pdf=3")
+    parser.add_argument("--out", help="Chemin du rapport JSON")
+    args = parser.parse_args(argv)
+
+    def _progress(index, result):
+        print(f"[batch] #{index + 1} {result.get('status')} ({result.get('execution_time', 0):.1f}s) {result.get('best_url') or result.get('message')}")
+
+    items = load_batch_csv(args.csv_path)
+    report = run_batch(items, args.template, stage_workers=_parse_workers(args.workers), on_item_done=_progress)
+    print(f"\n✅ {report['succeeded']}/{report['total']} fiches générées en {report['wall_time']:.1f}s "
+          f"({report['throughput_per_minute']:.1f} fiches/min)")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,547 @@
+import os, re, io, json, math, time, zlib, struct, shutil, hashlib, argparse, tempfile, threading, mimetypes, statistics, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Callable
+
+import requests
+from requests.adapters import BaseAdapter
+from langchain_core.language_models.llms import LLM
+
+from backend.src import techsheet_processor as processor, techsheet_pdf_fetch, techsheet_catalog
+from backend.src.techsheet_batch import run_batch
+from backend.src.techsheet_blob_store import ContentStore
+from backend.src.techsheet_cache import SqliteTTLCache
+from backend.src.techsheet_http import get_http_session, http_metrics, RETRY_POLICIES
+from backend.src.techsheet_link_candidates import is_pdf_href
+
+# ------------------------------------------------------------
+# Banc de mesure hors ligne du pipeline complet
+# ------------------------------------------------------------
+# - un serveur HTTP local rejoue des captures (pages produit, images, PDF)
+#   rangées par hôte : <recordings>/<hôte>/<chemin>, plus manifest.json ;
+# - un faux DuckDuckGo (html/lite) répond à partir du manifeste ;
+# - un faux LLM déterministe à latence configurable remplace Azure OpenAI.
+# Le client HTTP partagé est redirigé vers le serveur local par un
+# adaptateur de transport ; côté Playwright, chaque contexte reçoit une
+# route qui sert les mêmes captures. Rien ne sort de la machine.
+#
+# Étape PDF (--pdf) : "http" (défaut) télécharge les liens PDF de la page
+# récupérée par le client HTTP partagé (sonde, téléchargement, magasin de
+# blobs) sans navigateur ; "playwright" rejoue l'étape complète dans
+# Chromium ; "skip" la neutralise, ce que le rapport signale (pdf_skipped).
+#
+# Usage : python -m backend.src.techsheet_bench --scenarios single,concurrent,batch --out bench.json
+# Sans --recordings, un jeu synthétique pointp/cedeo/se.com est généré.
+DDG_HOSTS = {"duckduckgo.com", "html.duckduckgo.com", "lite.duckduckgo.com"}
+STAGES = [name for name, _, _ in processor.PIPELINE_STAGES]
+
+# --- Jeu de captures synthétique -------------------------------------------------
+def _png_bytes(width: int, height: int, seed: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    color = bytes(((seed * 53) % 256, (seed * 97) % 256, (seed * 193) % 256))
+    raw = b"".join(b"\x00" + color * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b""))
+
+def _pdf_bytes(title: str, size_kb: int) -> bytes:
+    body = f"%PDF-1.4\n% {title}\n".encode("utf-8")
+    filler = hashlib.sha256(title.encode("utf-8")).hexdigest().encode("ascii")
+    return body + filler * (size_kb * 1024 // len(filler)) + b"\n%%EOF\n"
+
+_SYNTHETIC_SITES = [
+    # (hôte, chemin produit, lien PDF rendu dans la page, page de résultats du moteur interne)
+    ("www.pointp.fr", "/p/{slug}-A{num}", '<a href="{pdf}">Fiche technique</a>', "recherche@text={ref}"),
+    ("www.cedeo.fr", "/p/{slug}-A{num}", '<a href="{pdf}">Imprimer sans prix</a>', "recherche@text={ref}"),
+    ("www.se.com", "/fr/fr/product/{ref}/", '<a href="/fr/fr/download-pdf/{ref}.pdf">Fiche technique du produit</a>',
+     "fr/fr/search/index.html@q={ref}"),
+]
+
+def _search_page(host: str, path: str, titre: str, reference: str, num: int) -> str:
+    if host == "www.se.com":
+        # Résultats rendus côté client : URLs dans le JSON embarqué
+        state = {"results": [{"name": titre, "url": f"/fr/fr/product/{reference}/"},
+                             {"name": "Accessoire", "url": "/fr/fr/product/ACC-1234/"}]}
+        return ('<html><body><div id="app"></div><script>window.__STATE__='
+                + json.dumps(state).replace("/", "\\/") + "</script></body></html>")
+    cards = "".join(f'<div class="product-card"><a href="/p/produit-voisin-{k}-A{8000 + num + k}">Produit voisin {k}</a></div>'
+                    for k in range(5))
+    return (f'<html><body><div class="results"><div class="product-card"><a href="{path}">{titre}</a></div>'
+            f"{cards}</div></body></html>")
+
+_SYNTHETIC_PRODUCTS = [
+    ("Disjoncteur différentiel", "Legrand", "411632"),
+    ("Chauffe-eau électrique", "Atlantic", "153115"),
+    ("Robinet thermostatique", "Grohe", "34565000"),
+    ("Interrupteur va-et-vient", "Schneider", "NU320118"),
+]
+
+def build_synthetic_recordings(root: Path, products_per_site: int = 4, pdf_kb: int = 300) -> Path:
+    root = Path(root)
+    manifest = []
+    for site_index, (host, path_tpl, pdf_link_tpl, search_tpl) in enumerate(_SYNTHETIC_SITES):
+        media_host = "media." + host[4:]
+        for i, (titre, marque, reference) in enumerate(_SYNTHETIC_PRODUCTS[:products_per_site]):
+            num = 1000 + 10 * site_index + i
+            slug = re.sub(r"[^a-z0-9]+", "-", f"{titre} {marque} {reference}".lower()).strip("-")
+            path = path_tpl.format(slug=slug, num=num, ref=reference)
+            pdf_path = f"/documents/{reference}-fiche.pdf"
+            pdf_link = pdf_link_tpl.format(pdf=pdf_path, ref=reference)
+            if "download-pdf" in pdf_link:
+                pdf_path = f"/fr/fr/download-pdf/{reference}.pdf"
+            images = {
+                f"/p/{reference}/main.png": (800, 800),
+                f"/p/{reference}/detail.png": (600, 450),
+                f"/badges/promo-{i}.png": (48, 48),
+            }
+            for img_path, (w, h) in images.items():
+                target = root / media_host / img_path.lstrip("/")
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(_png_bytes(w, h, num + w))
+            target = root / host / pdf_path.lstrip("/")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(_pdf_bytes(f"{titre} {reference} {host}", pdf_kb))
+
+            specs = "".join(f"<tr><td>Caractéristique {k}</td><td>{(k + 1) * 7} mm</td></tr>" for k in range(25))
+            menu = "".join(f'<li><a href="/c/categorie-{k}">Catégorie {k}</a></li>' for k in range(120))
+            recos = "".join(
+                f'<div class="product-card"><a href="/p/autre-{k}-A{9000 + k}"><img src="https://{media_host}/badges/promo-{i}.png"></a>'
+                f"<span>Produit associé {k}</span><span>{k},99 €</span></div>" for k in range(30)
+            )
+            html = (
+                f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{titre} {marque} {reference}</title>'
+                f'<meta property="og:image" content="https://{media_host}/p/{reference}/main.png"></head><body>'
+                f'<header><nav class="megamenu"><ul>{menu}</ul></nav></header>'
+                f'<main class="product-page"><h1>{titre} {marque} - Réf. {reference}</h1>'
+                f'<div class="product-gallery"><img src="https://{media_host}/badges/promo-{i}.png">'
+                f'<img src="https://{media_host}/p/{reference}/main.png"><img src="https://{media_host}/p/{reference}/detail.png"></div>'
+                f'<div class="description"><p>{titre} {marque}, référence {reference}. Produit conforme aux normes NF, '
+                f'garantie 2 ans, installation en tableau ou en applique.</p></div>'
+                f'<div class="specs"><table>{specs}</table></div><div class="documents">{pdf_link}</div>'
+                f'<section class="recommendations">{recos}</section></main>'
+                f'<footer>{"".join(f"<a href=/info/{k}>Info {k}</a>" for k in range(60))}</footer></body></html>'
+            )
+            # Les chemins en "/" sont servis par leur index.html
+            target = root / host / (path.lstrip("/") + ("index.html" if path.endswith("/") else ""))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(html, encoding="utf-8")
+            search_target = root / host / search_tpl.format(ref=reference)
+            search_target.parent.mkdir(parents=True, exist_ok=True)
+            search_target.write_text(_search_page(host, path, titre, reference, num), encoding="utf-8")
+            manifest.append({
+                "titre": titre, "marque": marque, "reference": reference,
+                "domain": host[4:], "url": f"https://{host}{path}",
+            })
+    (root / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return root
+
+# --- Serveur de rejeu + faux DuckDuckGo ------------------------------------------------
+class ReplayServer:
+    # /site/<hôte>/<chemin> sert <recordings>/<hôte>/<chemin> ; /ddg/... imite DuckDuckGo
+    def __init__(self, recordings: Path, site_latency: float = 0.0, ddg_latency: float = 0.0):
+        self.recordings = Path(recordings).resolve()
+        self.manifest: List[Dict[str, Any]] = json.loads((self.recordings / "manifest.json").read_text(encoding="utf-8"))
+        self.site_latency = site_latency
+        self.ddg_latency = ddg_latency
+        self.hits: Dict[str, int] = {"site": 0, "ddg": 0, "missing": 0}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, ctype: str):
+                headers_only = self.command == "HEAD"
+                start, end = 0, len(body) - 1
+                range_header = self.headers.get("Range", "")
+                m = re.match(r"bytes=(\d+)-(\d*)$", range_header)
+                if status == 200 and m and body:
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)) if m.group(2) else end, len(body) - 1)
+                    status = 206
+                payload = body[start:end + 1]
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+                self.end_headers()
+                if not headers_only:
+                    self.wfile.write(payload)
+
+            def _route(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                if parsed.path.startswith("/ddg/"):
+                    query = urllib.parse.parse_qs(parsed.query).get("q", [""])[0]
+                    if self.command == "POST":
+                        length = int(self.headers.get("Content-Length") or 0)
+                        query = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8")).get("q", [query])[0]
+                    server._count("ddg")
+                    time.sleep(server.ddg_latency)
+                    return self._send(200, server.ddg_page(query, lite="/lite" in parsed.path), "text/html; charset=utf-8")
+                parts = parsed.path.split("/", 3)
+                if len(parts) < 3 or parts[1] != "site":
+                    server._count("missing")
+                    return self._send(404, b"not recorded", "text/plain")
+                time.sleep(server.site_latency)
+                file_path = server.resolve(parts[2], "/" + (parts[3] if len(parts) > 3 else ""), parsed.query)
+                if file_path is None:
+                    server._count("missing")
+                    return self._send(404, b"not recorded", "text/plain")
+                server._count("site")
+                ctype = mimetypes.guess_type(file_path.name.split("@")[0])[0] or "text/html; charset=utf-8"
+                return self._send(200, file_path.read_bytes(), ctype)
+
+            do_GET = do_POST = do_HEAD = _route
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="bench-replay", daemon=True)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.hits[key] += 1
+
+    def resolve(self, host: str, path: str, query: str = "") -> Optional[Path]:
+        # Une capture propre à la chaîne de requête (pages de recherche) est
+        # rangée sous "<chemin>@<requête>" ; sinon la requête est ignorée
+        relative = urllib.parse.unquote(path).lstrip("/")
+        if not relative or relative.endswith("/"):
+            relative += "index.html"
+        names = [f"{relative}@{urllib.parse.unquote_plus(query)}"] if query else []
+        for name in names + [relative]:
+            candidate = (self.recordings / host / name).resolve()
+            if self.recordings not in candidate.parents:
+                return None
+            if candidate.is_dir():
+                candidate = candidate / "index.html"
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def ddg_page(self, query: str, lite: bool = False) -> bytes:
+        q = query.lower()
+        matches = [p for p in self.manifest if p["reference"].lower() in q and f"site:{p['domain']}" in q]
+        links = []
+        for p in matches:
+            href = "//duckduckgo.com/l/?uddg=" + urllib.parse.quote(p["url"], safe="")
+            css = "" if lite else ' class="result__a"'
+            links.append(f'<a{css} href="{href}">{p["titre"]} {p["marque"]} {p["reference"]}</a>')
+        # Un résultat hors sujet, comme sur le vrai moteur
+        links.append('<a class="result__a" href="https://example.org/blog/comparatif">Comparatif</a>')
+        return f"<html><body>{''.join(links)}</body></html>".encode("utf-8")
+
+    def rewrite(self, url: str) -> str:
+        parts = urllib.parse.urlsplit(url)
+        if parts.netloc == urllib.parse.urlsplit(self.base_url).netloc:
+            return url
+        host = (parts.hostname or "").lower()
+        if host in DDG_HOSTS:
+            path = "/ddg/lite/" if "lite" in host or parts.path.startswith("/lite") else "/ddg/html/"
+            return f"{self.base_url}{path}" + (f"?{parts.query}" if parts.query else "")
+        return f"{self.base_url}/site/{host}{parts.path or '/'}" + (f"?{parts.query}" if parts.query else "")
+
+    def start(self) -> "ReplayServer":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+class ReplayAdapter(BaseAdapter):
+    # Adaptateur de transport monté sur les sessions partagées : réécrit
+    # l'URL vers le serveur local, délègue à l'adaptateur d'origine (pool,
+    # retries, métriques) et rend la réponse sous l'URL d'origine
+    def __init__(self, inner, rewrite: Callable[[str], str]):
+        super().__init__()
+        self.inner = inner
+        self.rewrite = rewrite
+
+    def send(self, request, **kwargs):
+        original = request.url
+        request.url = self.rewrite(original)
+        response = self.inner.send(request, **kwargs)
+        request.url = original
+        response.url = original
+        return response
+
+    def close(self):
+        self.inner.close()
+
+# --- Faux LLM ----------------------------------------------------------------------------
+class BenchLLM(LLM):
+    latency: float = 0.5
+    latency_per_1k_tokens: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "techsheet-bench"
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        page = prompt.split("Voici le HTML brut :", 1)[-1]
+        time.sleep(self.latency + self.latency_per_1k_tokens * len(prompt) / 3500)
+        lines = [l.strip() for l in page.splitlines() if l.strip() and not l.startswith("```")]
+        title = next((l for l in lines if "Réf." in l), lines[0] if lines else "")
+        ref = re.search(r"Réf\.\s*(\S+)", title)
+        specs = {}
+        for a, b in zip(lines, lines[1:]):
+            if a.startswith("Caractéristique") and len(specs) < 10:
+                specs[a] = b
+        data = {
+            "TITRE": title[:120],
+            "RÉFÉRENCE": ref.group(1) if ref else "",
+            "DESCRIPTION": next((l for l in lines if "référence" in l.lower()), "")[:300],
+            "AVANTAGES": ["Garantie 2 ans"],
+            "UTILISATION": "Installation en tableau ou en applique",
+            "CARACTÉRISTIQUES TECHNIQUES": specs,
+        }
+        return "```json\n" + json.dumps(data, ensure_ascii=False) + "\n```"
+
+# --- Branchement sur le pipeline -------------------------------------------------------------
+class OfflineEnvironment:
+    # Installe serveur, transport, faux LLM et routes Playwright ; tout est
+    # restauré à la sortie du bloc with
+    def __init__(self, server: ReplayServer, llm_latency: float, llm_latency_per_1k: float, pdf_mode: str, use_caches: bool,
+                 blob_dir: Optional[Path] = None, cache_dir: Optional[Path] = None):
+        self.server = server
+        self.blob_dir = blob_dir
+        self.cache_dir = cache_dir
+        self.llm_latency = llm_latency
+        self.llm_latency_per_1k = llm_latency_per_1k
+        self.pdf_mode = pdf_mode
+        self.use_caches = use_caches
+        self._restore: List[Callable[[], None]] = []
+        self._local = requests.Session()
+
+    def _patch(self, obj, name: str, value) -> None:
+        original = getattr(obj, name)
+        setattr(obj, name, value)
+        self._restore.append(lambda: setattr(obj, name, original))
+
+    def _route_playwright(self, route) -> None:
+        url = route.request.url
+        if url.startswith(("data:", "blob:")):
+            return route.continue_()
+        try:
+            r = self._local.request(route.request.method, self.server.rewrite(url), data=route.request.post_data_buffer, timeout=30)
+        except requests.exceptions.RequestException:
+            return route.abort()
+        headers = {k: v for k, v in r.headers.items() if k.lower() not in ("content-length", "transfer-encoding", "connection")}
+        route.fulfill(status=r.status_code, headers=headers, body=r.content)
+
+    def __enter__(self) -> "OfflineEnvironment":
+        for policy in RETRY_POLICIES:
+            session = get_http_session(policy)
+            inner = session.get_adapter("https://example.org/")
+            replay = ReplayAdapter(inner, self.server.rewrite)
+            session.mount("https://", replay)
+            session.mount("http://", replay)
+            self._restore.append(lambda s=session, a=inner: (s.mount("https://", a), s.mount("http://", a)))
+
+        self._patch(processor, "make_llm", lambda: BenchLLM(latency=self.llm_latency, latency_per_1k_tokens=self.llm_latency_per_1k))
+        if not self.use_caches:
+            self._patch(processor, "SEARCH_CACHE_BYPASS", True)
+            self._patch(processor, "LLM_CACHE_BYPASS", True)
+            self._patch(processor, "CATALOG_ENABLED", False)
+        elif self.cache_dir is not None:
+            # Caches de recherche / LLM et catalogue jetables : le banc ne
+            # remplit pas ceux de techsheet/cache
+            self._patch(processor, "_search_cache", SqliteTTLCache(
+                self.cache_dir / "search_cache.sqlite", ttl_seconds=processor.SEARCH_CACHE_TTL,
+                max_entries=processor.SEARCH_CACHE_MAX_ENTRIES))
+            self._patch(processor, "_llm_cache", SqliteTTLCache(
+                self.cache_dir / "llm_cache.sqlite", ttl_seconds=processor.LLM_CACHE_TTL,
+                max_entries=processor.LLM_CACHE_MAX_ENTRIES))
+            self._patch(techsheet_catalog, "CATALOG_PATH", self.cache_dir / "catalog.sqlite")
+            # Le catalogue partagé déjà ouvert est remis en place tel quel à la sortie
+            self._patch(techsheet_catalog, "_catalog", None)
+            self._restore.append(lambda: techsheet_catalog._catalog and techsheet_catalog._catalog.close())
+
+        if self.blob_dir is not None:
+            # Les PDF du banc ne vont pas dans le magasin partagé techsheet/blobs
+            store = ContentStore(self.blob_dir)
+            self._patch(processor, "get_pdf_store", lambda: store)
+            self._patch(techsheet_pdf_fetch, "get_pdf_store", lambda: store)
+
+        if self.pdf_mode == "skip":
+            self._patch(processor, "download_product_pdfs_pooled", lambda url, download_dir="downloads", **kwargs: [])
+        elif self.pdf_mode == "http":
+            self._patch(processor, "download_product_pdfs_pooled", _download_pdfs_over_http)
+        else:
+            on_page = processor._download_product_pdfs_on_page
+            env = self
+
+            def routed(page, context, *args, **kwargs):
+                context.route("**/*", env._route_playwright)
+                return on_page(page, context, *args, **kwargs)
+            self._patch(processor, "_download_product_pdfs_on_page", routed)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        while self._restore:
+            self._restore.pop()()
+        self._local.close()
+
+def _download_pdfs_over_http(url: str, download_dir: str = "downloads", snapshot=None, budget=None, **_) -> List[str]:
+    # Étape PDF sans navigateur : liens .pdf de l'instantané de la page,
+    # récupérés comme les liens découverts par Playwright (fetch_pdf_links)
+    if snapshot is None:
+        return []
+    base = snapshot.final_url
+    hrefs = [urllib.parse.urljoin(base, a["href"]) for a in snapshot.soup.find_all("a", href=True)]
+    saved: List[str] = []
+    for info in techsheet_pdf_fetch.fetch_pdf_links([h for h in hrefs if is_pdf_href(h)], referer=base, budget=budget):
+        if info.get("sha256"):
+            processor._link_pdf_into_dir(info["sha256"], processor._pdf_name_from_url(info["url"]), Path(download_dir), saved)
+    return saved
+
+# --- Scénarios et rapport ----------------------------------------------------------------------
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def summarize(outputs: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    stages = {}
+    for name in STAGES + ["total"]:
+        values = [o.get("execution_time") if name == "total" else (o.get("stage_timings") or {}).get(name) for o in outputs]
+        values = [v for v in values if v is not None]
+        stages[name] = {
+            "n": len(values),
+            "p50": round(_percentile(values, 50), 4) if values else None,
+            "p95": round(_percentile(values, 95), 4) if values else None,
+            "mean": round(statistics.mean(values), 4) if values else None,
+        }
+    succeeded = sum(1 for o in outputs if o.get("status") == "success")
+    return {
+        "requests": len(outputs),
+        "succeeded": succeeded,
+        "pdfs_downloaded": sum(len(o.get("downloaded_pdfs") or []) for o in outputs),
+        "failed": len(outputs) - succeeded,
+        "wall_time": round(wall_time, 3),
+        "throughput_per_minute": round(len(outputs) / wall_time * 60, 2) if wall_time > 0 else None,
+        "stages": stages,
+        "errors": sorted({o.get("message") for o in outputs if o.get("status") != "success" and o.get("message")}),
+    }
+
+def _requests_for(manifest: List[Dict[str, Any]], repeat: int) -> List[Dict[str, Any]]:
+    return [dict(p) for _ in range(repeat) for p in manifest]
+
+def scenario_single(items, template_path: str, **_) -> Dict[str, Any]:
+    start = time.time()
+    outputs = [processor.process_techsheet_request(p["titre"], p["marque"], p["reference"], template_path, [p["domain"]]) for p in items]
+    return summarize(outputs, time.time() - start)
+
+def scenario_concurrent(items, template_path: str, concurrency: int = 4, **_) -> Dict[str, Any]:
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outputs = list(pool.map(
+            lambda p: processor.process_techsheet_request(p["titre"], p["marque"], p["reference"], template_path, [p["domain"]]),
+            items,
+        ))
+    report = summarize(outputs, time.time() - start)
+    report["concurrency"] = concurrency
+    return report
+
+def scenario_batch(items, template_path: str, **_) -> Dict[str, Any]:
+    batch_items = [{"titre": p["titre"], "marque": p["marque"], "reference": p["reference"], "domains": [p["domain"]]} for p in items]
+    report = run_batch(batch_items, template_path)
+    out = summarize([it["result"] for it in report["items"]], report["wall_time"])
+    out["stage_workers"] = report["stage_workers"]
+    return out
+
+SCENARIOS = {"single": scenario_single, "concurrent": scenario_concurrent, "batch": scenario_batch}
+
+def run_benchmark(recordings: Optional[Path] = None, scenarios: Optional[List[str]] = None, repeat: int = 1,
+                  concurrency: int = 4, llm_latency: float = 0.5, llm_latency_per_1k: float = 0.0,
+                  site_latency: float = 0.05, ddg_latency: float = 0.2, pdf_mode: str = "http",
+                  use_caches: bool = False) -> Dict[str, Any]:
+    scenarios = scenarios or ["single", "batch"]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Scénarios inconnus: {unknown} (disponibles: {sorted(SCENARIOS)})")
+    workdir = Path(tempfile.mkdtemp(prefix="techsheet-bench-"))
+    try:
+        if recordings is None:
+            recordings = build_synthetic_recordings(workdir / "recordings")
+        # Le modèle est copié : les dossiers de sortie (data/<uuid>) sont créés à côté de lui
+        template_path = workdir / "techsheet" / "Fiche_Technique_Modele.docx"
+        template_path.parent.mkdir(parents=True)
+        shutil.copy(Path(__file__).resolve().parent.parent.parent / "techsheet" / "Fiche_Technique_Modele.docx", template_path)
+
+        server = ReplayServer(recordings, site_latency=site_latency, ddg_latency=ddg_latency).start()
+        report: Dict[str, Any] = {
+            "config": {
+                "recordings": str(recordings), "repeat": repeat, "concurrency": concurrency,
+                "llm_latency": llm_latency, "llm_latency_per_1k_tokens": llm_latency_per_1k,
+                "site_latency": site_latency, "ddg_latency": ddg_latency, "pdf_mode": pdf_mode, "use_caches": use_caches,
+            },
+            # Temps de l'étape pdf sans téléchargement : à ne pas comparer aux autres modes
+            "pdf_skipped": pdf_mode == "skip",
+            "scenarios": {},
+        }
+        try:
+            with OfflineEnvironment(server, llm_latency, llm_latency_per_1k, pdf_mode, use_caches,
+                                    blob_dir=workdir / "blobs", cache_dir=workdir / "cache"):
+                items = _requests_for(server.manifest, repeat)
+                for name in scenarios:
+                    print(f"[bench] scénario {name} ({len(items)} requêtes)...")
+                    report["scenarios"][name] = SCENARIOS[name](items, str(template_path), concurrency=concurrency)
+        finally:
+            server.close()
+        report["replay_hits"] = dict(server.hits)
+        report["http_client"] = http_metrics()
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Banc de mesure hors ligne du pipeline de fiches techniques.")
+    parser.add_argument("--recordings", help="Dossier de captures (<hôte>/<chemin> + manifest.json) ; synthétique par défaut")
+    parser.add_argument("--scenarios", default="single,batch", help=f"Parmi {','.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=1, help="Nombre de passages sur le manifeste")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Latence fixe du faux LLM (s)")
+    parser.add_argument("--llm-latency-per-1k", type=float, default=0.0, help="Latence supplémentaire par 1000 tokens (s)")
+    parser.add_argument("--site-latency", type=float, default=0.05, help="Latence des sites rejoués (s)")
+    parser.add_argument("--ddg-latency", type=float, default=0.2, help="Latence du faux DuckDuckGo (s)")
+    parser.add_argument("--pdf", choices=("http", "playwright", "skip"), default="http",
+                        help="http : liens PDF téléchargés sans navigateur ; playwright : étape PDF complète dans "
+                             "Chromium (navigateur installé requis) ; skip : étape PDF neutralisée")
+    parser.add_argument("--use-caches", action="store_true", help="Garde les caches recherche/LLM et le catalogue actifs (fichiers jetables du banc)")
+    parser.add_argument("--out", help="Chemin du rapport JSON")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        recordings=Path(args.recordings) if args.recordings else None,
+        scenarios=[s.strip() for s in args.scenarios.split(",") if s.strip()],
+        repeat=args.repeat, concurrency=args.concurrency,
+        llm_latency=args.llm_latency, llm_latency_per_1k=args.llm_latency_per_1k,
+        site_latency=args.site_latency, ddg_latency=args.ddg_latency,
+        pdf_mode=args.pdf, use_caches=args.use_caches,
+    )
+    for name, res in report["scenarios"].items():
+        total = res["stages"]["total"]
+        print(f"[bench] {name}: {res['succeeded']}/{res['requests']} ok, {res['throughput_per_minute']} req/min, "
+              f"p50 {total['p50']}s p95 {total['p95']}s, {res['pdfs_downloaded']} PDF")
+    if report["pdf_skipped"]:
+        print("[bench] ⚠️ étape PDF neutralisée (--pdf skip) : ses temps ne sont pas significatifs")
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    return 0 if all(r["failed"] == 0 for r in report["scenarios"].values()) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
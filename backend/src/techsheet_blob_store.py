@@ -0,0 +1,303 @@
+import os, json, shutil, sqlite3, argparse, threading, time, hashlib, tempfile
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple, Iterable, List
+
+# ------------------------------------------------------------
+# Stockage des PDF adressé par contenu (sha256), partagé entre requêtes
+# ------------------------------------------------------------
+# Chaque document unique est écrit une seule fois sous
+# techsheet/blobs/sha256/<2 premiers caractères>/<hash> ; les dossiers
+# techsheet/data/<uuid>/fiches_pdfs n'en contiennent que des liens physiques
+# (ou symboliques / copies si le système de fichiers ne le permet pas).
+#
+# Ramasse-miettes (collect_garbage) : quand un dossier de requête est
+# supprimé, ses blobs ne sont libérés qu'au passage suivant. Le superviseur
+# de techsheet_jobs le lance au démarrage puis toutes les
+# TECHSHEET_BLOB_GC_INTERVAL secondes ; hors file de travaux :
+#   python -m backend.src.techsheet_blob_store gc [--min-age-hours 24]
+BLOB_DIR = Path(__file__).resolve().parent.parent.parent / "techsheet" / "blobs"
+
+# Période du ramasse-miettes lancé par le superviseur des workers (0 = jamais)
+BLOB_GC_INTERVAL = float(os.getenv("TECHSHEET_BLOB_GC_INTERVAL", str(6 * 3600)))
+# Un blob non référencé n'est supprimé qu'après ce délai (une requête en cours peut encore le lier)
+BLOB_GC_MIN_AGE = float(os.getenv("TECHSHEET_BLOB_GC_MIN_AGE", str(24 * 3600)))
+
+# Budgets par défaut (octets) : par fichier et par requête ; 0 = illimité
+PDF_MAX_FILE_BYTES = int(os.getenv("TECHSHEET_PDF_MAX_FILE_BYTES", str(100 * 1024 * 1024)))
+PDF_MAX_REQUEST_BYTES = int(os.getenv("TECHSHEET_PDF_MAX_REQUEST_BYTES", str(300 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 256 * 1024
+
+LINK_HARD = "hardlink"
+LINK_SYMBOLIC = "symlink"
+LINK_COPY = "copy"
+
+class ByteBudgetExceeded(Exception):
+    pass
+
+class ByteBudget:
+    # Budget d'octets d'une requête, partagé par tous ses téléchargements (y
+    # compris concurrents). Les octets d'un fichier en cours sont réservés au
+    # fil de l'eau et rendus si le fichier est rejeté.
+    def __init__(self, max_file_bytes: Optional[int] = PDF_MAX_FILE_BYTES, max_request_bytes: Optional[int] = PDF_MAX_REQUEST_BYTES):
+        self.max_file_bytes = max_file_bytes or None
+        self.max_request_bytes = max_request_bytes or None
+        self._lock = threading.Lock()
+        self._used = 0
+        self._stats = {"bytes_streamed": 0, "bytes_kept": 0, "files_kept": 0, "files_rejected": 0}
+
+    def check_declared(self, size: Optional[int]) -> None:
+        # Taille annoncée (Content-Length, sonde HEAD) : refus avant tout téléchargement
+        if size is None:
+            return
+        if self.max_file_bytes is not None and size > self.max_file_bytes:
+            self._reject(f"{size} octets > limite par fichier ({self.max_file_bytes})")
+        with self._lock:
+            over = self.max_request_bytes is not None and self._used + size > self.max_request_bytes
+        if over:
+            self._reject(f"{size} octets dépasseraient le budget de la requête ({self.max_request_bytes})")
+
+    def consume(self, n: int, file_bytes: int) -> None:
+        with self._lock:
+            self._used += n
+            self._stats["bytes_streamed"] += n
+            over_file = self.max_file_bytes is not None and file_bytes > self.max_file_bytes
+            over_request = self.max_request_bytes is not None and self._used > self.max_request_bytes
+        if over_file:
+            raise ByteBudgetExceeded(f"fichier > {self.max_file_bytes} octets")
+        if over_request:
+            raise ByteBudgetExceeded(f"budget de la requête dépassé ({self.max_request_bytes} octets)")
+
+    def accept(self, file_bytes: int) -> None:
+        with self._lock:
+            self._stats["bytes_kept"] += file_bytes
+            self._stats["files_kept"] += 1
+
+    def refund(self, file_bytes: int) -> None:
+        with self._lock:
+            self._used -= file_bytes
+            self._stats["files_rejected"] += 1
+
+    def charge(self, size: int) -> None:
+        # Contenu déjà entièrement reçu (corps Playwright, téléchargement navigateur)
+        self.check_declared(size)
+        try:
+            self.consume(size, size)
+        except ByteBudgetExceeded:
+            self.refund(size)
+            raise
+        self.accept(size)
+
+    def _reject(self, reason: str) -> None:
+        with self._lock:
+            self._stats["files_rejected"] += 1
+        raise ByteBudgetExceeded(reason)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        out.update({"max_file_bytes": self.max_file_bytes, "max_request_bytes": self.max_request_bytes})
+        return out
+
+class ContentStore:
+    def __init__(self, root: Path = BLOB_DIR, suffix: str = ""):
+        self.root = Path(root)
+        self.suffix = suffix
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, original_name TEXT,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs ("
+            " path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, directory TEXT NOT NULL,"
+            " link_type TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_refs_dir_sha ON refs(directory, sha256)")
+        self._stats = {"puts": 0, "new_blobs": 0, "dedup_hits": 0, "bytes_written": 0, "bytes_deduplicated": 0}
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / "sha256" / sha256[:2] / f"{sha256}{self.suffix}"
+
+    def new_temp_path(self) -> Path:
+        fd, tmp = tempfile.mkstemp(dir=str(self.tmp_dir), suffix=".part")
+        os.close(fd)
+        return Path(tmp)
+
+    # --- écriture --------------------------------------------------------
+    def _register(self, sha256: str, size: int, original_name: Optional[str], tmp_path: Optional[Path],
+                  content: Optional[bytes] = None) -> Tuple[Path, bool]:
+        blob = self.blob_path(sha256)
+        now = time.time()
+        with self._lock:
+            created = not blob.exists()
+            if created:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                if tmp_path is None:
+                    tmp_path = self.new_temp_path()
+                    tmp_path.write_bytes(content or b"")
+                os.replace(str(tmp_path), str(blob))
+                self._stats["new_blobs"] += 1
+                self._stats["bytes_written"] += size
+            else:
+                if tmp_path is not None:
+                    tmp_path.unlink(missing_ok=True)
+                self._stats["dedup_hits"] += 1
+                self._stats["bytes_deduplicated"] += size
+            self._stats["puts"] += 1
+            self._conn.execute(
+                "INSERT INTO blobs (sha256, size, original_name, created_at, last_used) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(sha256) DO UPDATE SET last_used = excluded.last_used",
+                (sha256, size, original_name, now, now),
+            )
+        return blob, created
+
+    def put_bytes(self, content: bytes, original_name: Optional[str] = None) -> Tuple[str, Path, bool]:
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob, created = self._register(sha256, len(content), original_name, None, content=content)
+        return sha256, blob, created
+
+    def put_stream(self, chunks: Iterable[bytes], original_name: Optional[str] = None,
+                   budget: Optional[ByteBudget] = None) -> Tuple[str, Path, bool, int]:
+        # Écrit les morceaux dans un fichier temporaire du store en calculant le
+        # sha256 au passage, puis renomme atomiquement vers le blob final
+        h = hashlib.sha256()
+        size = 0
+        tmp = self.new_temp_path()
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if budget is not None:
+                        budget.consume(len(chunk), size)
+                    h.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            if budget is not None:
+                budget.refund(size)
+            raise
+        if budget is not None:
+            budget.accept(size)
+        blob, created = self._register(h.hexdigest(), size, original_name, tmp)
+        return h.hexdigest(), blob, created, size
+
+    def put_file(self, path: Path, original_name: Optional[str] = None, sha256: Optional[str] = None) -> Tuple[str, Path, bool]:
+        # Le fichier (temporaire, sur le même volume de préférence) est déplacé dans le store
+        path = Path(path)
+        if sha256 is None:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+            sha256 = h.hexdigest()
+        size = path.stat().st_size
+        if path.parent.resolve() != self.tmp_dir.resolve():
+            # os.replace ne traverse pas les volumes : on passe par le dossier tmp du store
+            tmp = self.new_temp_path()
+            shutil.move(str(path), str(tmp))
+            path = tmp
+        blob, created = self._register(sha256, size, original_name, path)
+        return sha256, blob, created
+
+    # --- références par requête ------------------------------------------
+    def find_ref(self, sha256: str, directory: Path) -> Optional[Path]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM refs WHERE directory = ? AND sha256 = ?", (str(Path(directory)), sha256)
+            ).fetchall()
+        for (p,) in rows:
+            if Path(p).exists():
+                return Path(p)
+        return None
+
+    def sha256_for_ref(self, path: Path) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM refs WHERE path = ?", (str(Path(path)),)).fetchone()
+        return row[0] if row else None
+
+    def has_blob(self, sha256: str) -> bool:
+        return self.blob_path(sha256).exists()
+
+    def link_into(self, sha256: str, dest: Path) -> Tuple[Path, str]:
+        blob = self.blob_path(sha256)
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(blob, dest)
+            link_type = LINK_HARD
+        except OSError:
+            try:
+                os.symlink(blob, dest)
+                link_type = LINK_SYMBOLIC
+            except OSError:
+                shutil.copyfile(blob, dest)
+                link_type = LINK_COPY
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refs (path, sha256, directory, link_type, created_at) VALUES (?, ?, ?, ?, ?)",
+                (str(dest), sha256, str(dest.parent), link_type, time.time()),
+            )
+        return dest, link_type
+
+    # --- maintenance -----------------------------------------------------
+    def collect_garbage(self, min_age_seconds: float = BLOB_GC_MIN_AGE) -> Dict[str, int]:
+        # Supprime les références dont le fichier a disparu, puis les blobs
+        # plus référencés par aucun dossier de requête
+        removed_refs = removed_blobs = freed = 0
+        with self._lock:
+            for (p,) in self._conn.execute("SELECT path FROM refs").fetchall():
+                if not os.path.lexists(p):
+                    self._conn.execute("DELETE FROM refs WHERE path = ?", (p,))
+                    removed_refs += 1
+            orphans = self._conn.execute(
+                "SELECT sha256, size FROM blobs WHERE last_used < ? AND sha256 NOT IN (SELECT sha256 FROM refs)",
+                (time.time() - min_age_seconds,),
+            ).fetchall()
+            for sha256, size in orphans:
+                self.blob_path(sha256).unlink(missing_ok=True)
+                self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                removed_blobs += 1
+                freed += size
+        return {"removed_refs": removed_refs, "removed_blobs": removed_blobs, "bytes_freed": freed}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            blobs, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            (refs,) = self._conn.execute("SELECT COUNT(*) FROM refs").fetchone()
+            out = dict(self._stats)
+        out.update({"blobs": blobs, "stored_bytes": total, "refs": refs})
+        return out
+
+_store: Optional[ContentStore] = None
+_store_lock = threading.Lock()
+
+def get_pdf_store() -> ContentStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ContentStore(BLOB_DIR)
+        return _store
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintenance du magasin de PDF adressé par contenu.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_gc = sub.add_parser("gc", help="Supprime les références disparues et les blobs orphelins")
+    p_gc.add_argument("--min-age-hours", type=float, default=BLOB_GC_MIN_AGE / 3600)
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    store = get_pdf_store()
+    if args.command == "gc":
+        print(json.dumps(store.collect_garbage(args.min_age_hours * 3600), indent=2))
+    print(json.dumps(store.stats(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
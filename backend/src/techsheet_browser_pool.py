@@ -0,0 +1,199 @@
+import os, queue, atexit, threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Optional, Dict, Any, Callable, List
+
+from playwright.sync_api import sync_playwright
+
+from backend.src import techsheet_tracing as tracing
+from backend.src.techsheet_deadline import DeadlineExceeded
+
+# ------------------------------------------------------------
+# Pool de navigateurs Chromium persistants
+# ------------------------------------------------------------
+# L'API sync de Playwright lie chaque objet au thread qui l'a créé : chaque
+# worker du pool possède donc son propre driver + navigateur, et les requêtes
+# lui sont confiées via une file. Chaque requête reçoit un contexte isolé
+# (cookies, stockage, téléchargements) ; le navigateur est relancé après
+# max_pages_per_browser pages ou s'il a planté.
+BROWSER_POOL_SIZE = int(os.getenv("TECHSHEET_BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_PAGES = int(os.getenv("TECHSHEET_BROWSER_MAX_PAGES", "50"))
+BROWSER_LAUNCH_ARGS = ["--disable-dev-shm-usage"]
+
+class BrowserPool:
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_pages_per_browser: int = BROWSER_MAX_PAGES,
+                 headless: bool = True, launch_args: Optional[List[str]] = None,
+                 context_options: Optional[Dict[str, Any]] = None, crash_retries: int = 1):
+        self.size = max(1, size)
+        self.max_pages_per_browser = max(1, max_pages_per_browser)
+        self.headless = headless
+        self.launch_args = launch_args if launch_args is not None else list(BROWSER_LAUNCH_ARGS)
+        self.context_options = {"accept_downloads": True}
+        self.context_options.update(context_options or {})
+        self.crash_retries = crash_retries
+        self._tasks: "queue.Queue" = queue.Queue()
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"launches": 0, "leases": 0, "recycled": 0, "crashes": 0, "warm_hits": 0, "errors": 0}
+
+    def _bump(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+        out["queued"] = self._tasks.qsize()
+        out["workers"] = len(self._workers)
+        return out
+
+    def start(self) -> "BrowserPool":
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BrowserPool fermé")
+            while len(self._workers) < self.size:
+                t = threading.Thread(target=self._worker_main, name=f"browser-pool-{len(self._workers)}", daemon=True)
+                self._workers.append(t)
+                t.start()
+        return self
+
+    def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        # func(page, context, *args, **kwargs) s'exécute dans un thread du pool
+        if not self._workers:
+            self.start()
+        future: Future = Future()
+        # Le span et l'échéance de l'étape appelante suivent la tâche dans le thread du navigateur
+        self._tasks.put((tracing.bind(func), args, kwargs, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # Encore en file : ne sera jamais lancée ; déjà lancée : elle se
+            # termine d'elle-même (ses attentes suivent l'échéance)
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+        for _ in workers:
+            self._tasks.put(None)
+        for t in workers:
+            t.join(timeout=10)
+
+    # --- côté worker ---------------------------------------------------
+    def _launch(self, p):
+        self._bump("launches")
+        return p.chromium.launch(headless=self.headless, args=self.launch_args)
+
+    @staticmethod
+    def _safe_close(obj) -> None:
+        if obj is None:
+            return
+        try:
+            obj.close()
+        except Exception:
+            pass
+
+    def _worker_main(self) -> None:
+        # Boucle externe : si le driver Playwright lui-même meurt, on repart de zéro
+        while not self._closed:
+            try:
+                if self._serve():
+                    return
+            except Exception as e:
+                self._bump("crashes")
+                print(f"⚠️ Pool navigateur: redémarrage du driver Playwright ({e})")
+                # Un driver qui ne démarre pas ne doit pas bloquer indéfiniment l'appelant
+                try:
+                    task = self._tasks.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if task is None:
+                    return
+                future = task[3]
+                if future.set_running_or_notify_cancel():
+                    self._bump("errors")
+                    future.set_exception(e)
+
+    def _serve(self) -> bool:
+        with sync_playwright() as p:
+            browser = None
+            spare_context = None
+            pages_served = 0
+            try:
+                while True:
+                    task = self._tasks.get()
+                    if task is None:
+                        return True
+                    func, args, kwargs, future = task
+                    if not future.set_running_or_notify_cancel():
+                        continue
+
+                    attempts = 0
+                    while True:
+                        if browser is not None and (not browser.is_connected() or pages_served >= self.max_pages_per_browser):
+                            if browser.is_connected():
+                                self._bump("recycled")
+                            self._safe_close(spare_context)
+                            self._safe_close(browser)
+                            browser, spare_context, pages_served = None, None, 0
+                        context = None
+                        try:
+                            if browser is None:
+                                browser = self._launch(p)
+                            if spare_context is not None:
+                                context, spare_context = spare_context, None
+                                self._bump("warm_hits")
+                            else:
+                                context = browser.new_context(**self.context_options)
+                            self._bump("leases")
+                            page = context.new_page()
+                            page.set_default_timeout(15000)
+                            result = func(page, context, *args, **kwargs)
+                        except (Exception, DeadlineExceeded) as e:
+                            self._safe_close(context)
+                            pages_served += 1
+                            if browser is not None and not browser.is_connected() and attempts < self.crash_retries:
+                                # Chromium a planté pendant la requête : on relance et on rejoue
+                                self._bump("crashes")
+                                attempts += 1
+                                continue
+                            self._bump("errors")
+                            future.set_exception(e)
+                            break
+                        self._safe_close(context)
+                        pages_served += 1
+                        future.set_result(result)
+                        break
+
+                    # Prépare le contexte de la prochaine requête pendant que la file est vide
+                    if browser is not None and browser.is_connected() and pages_served < self.max_pages_per_browser:
+                        try:
+                            spare_context = browser.new_context(**self.context_options)
+                        except Exception:
+                            spare_context = None
+            finally:
+                self._safe_close(spare_context)
+                self._safe_close(browser)
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+def get_browser_pool() -> BrowserPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            _pool = BrowserPool().start()
+        return _pool
+
+def close_browser_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+atexit.register(close_browser_pool)
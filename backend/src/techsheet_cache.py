@@ -0,0 +1,110 @@
+import json, sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from backend.src import techsheet_tracing as tracing
+
+# ------------------------------------------------------------
+# Cache clé/valeur persistant (SQLite) avec TTL et éviction LRU
+# ------------------------------------------------------------
+CACHE_DIR = Path(__file__).resolve().parent.parent.parent / "techsheet" / "cache"
+
+class SqliteTTLCache:
+    # Les valeurs sont sérialisées en JSON. Une entrée plus vieille que
+    # ttl_seconds est ignorée (et supprimée) ; au-delà de max_entries, les
+    # entrées les moins récemment lues sont évincées.
+    def __init__(self, path: Path, ttl_seconds: Optional[float] = None, max_entries: int = 10000):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "writes": 0}
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                tracing.add("cache_misses")
+                return None
+            value, created_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                tracing.add("cache_misses")
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self._stats["hits"] += 1
+        tracing.add("cache_hits")
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self._stats["writes"] += 1
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._stats["evictions"] += overflow
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def retain_prefix(self, prefix: str) -> int:
+        # Supprime toutes les entrées dont la clé ne commence pas par prefix
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM entries WHERE substr(key, 1, ?) != ?", (len(prefix), prefix))
+            return cur.rowcount
+
+    def purge_expired(self) -> int:
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._stats["expired"] += cur.rowcount
+            return cur.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            out = dict(self._stats)
+        out["entries"] = count
+        lookups = out["hits"] + out["misses"]
+        out["hit_ratio"] = out["hits"] / lookups if lookups else 0.0
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,356 @@
+import os, re, json, time, random, sqlite3, argparse, tempfile, threading, unicodedata, difflib
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+
+from backend.src.techsheet_cache import CACHE_DIR
+from backend.src.techsheet_domains import adapter_for_url, url_host, strip_www
+
+# ------------------------------------------------------------
+# Catalogue local des produits déjà traités (techsheet/cache/catalog.sqlite,
+# TECHSHEET_CATALOG_PATH pour un autre fichier)
+# ------------------------------------------------------------
+# Chaque requête réussie y enregistre la correspondance (marque, référence,
+# titre) -> URL produit, champs extraits, image et PDF (sha256 du magasin de
+# blobs). process_techsheet_request et run_batch le consultent avant toute
+# recherche : un produit connu saute recherche, scraping et LLM.
+#
+# Recherche, dans l'ordre :
+# 1. référence normalisée exacte (index B-tree) ;
+# 2. référence approchée : trigrammes de la référence (table de postings
+#    partitionnée par marque canonique, sans la liste "  x" du premier
+#    caractère), puis similarité vérifiée en Python derrière les bornes
+#    quick_ratio ; < 0,5 ms par recherche à 100 000 entrées (catalog bench) ;
+# 3. sans référence : titre via FTS5, marque obligatoire.
+# Les marques passent par une table d'alias ("Schneider Electric", "SE" ->
+# "schneider").
+CATALOG_PATH = Path(os.getenv("TECHSHEET_CATALOG_PATH", str(CACHE_DIR / "catalog.sqlite")))
+CATALOG_ENABLED = os.getenv("TECHSHEET_CATALOG", "1").lower() not in ("0", "false", "no")
+# Entrées plus anciennes ignorées (jours) ; 0 = jamais périmées
+CATALOG_MAX_AGE_DAYS = float(os.getenv("TECHSHEET_CATALOG_MAX_AGE_DAYS", "180"))
+# 0.8 : une faute de frappe sur une référence de 6 caractères passe encore
+CATALOG_FUZZY_MIN = float(os.getenv("TECHSHEET_CATALOG_FUZZY_MIN", "0.8"))
+CATALOG_TITLE_MIN = float(os.getenv("TECHSHEET_CATALOG_TITLE_MIN", "0.8"))
+FUZZY_CANDIDATES = 20
+
+MATCH_EXACT = "exact"
+MATCH_FUZZY_REFERENCE = "fuzzy_reference"
+MATCH_TITLE = "title"
+
+# Alias de marque livrés par défaut (normalisés) ; complétés par la table brand_aliases
+BRAND_ALIASES = {
+    "schneiderelectric": "schneider", "se": "schneider", "schneider": "schneider",
+    "legrandfrance": "legrand",
+    "grohefrance": "grohe",
+    "atlanticclimatisation": "atlantic", "groupeatlantic": "atlantic",
+    "saunierduval": "saunierduval", "sd": "saunierduval",
+    "hagerfrance": "hager",
+    "geberitfrance": "geberit",
+    "jacobdelafon": "jacobdelafon", "jdf": "jacobdelafon",
+    "thermor": "thermor", "thermorpacific": "thermor",
+    "deviller": "deville", "devillethermique": "deville",
+}
+
+def normalize_text(text: str) -> str:
+    # Minuscules, sans accents ni ponctuation, espaces simples
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").casefold()
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text).split())
+
+def normalize_reference(reference: str) -> str:
+    return normalize_text(reference).replace(" ", "")
+
+def reference_trigrams(ref_norm: str) -> List[str]:
+    padded = f"  {ref_norm} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+class ProductCatalog:
+    def __init__(self, path: Path = CATALOG_PATH, max_age_days: float = CATALOG_MAX_AGE_DAYS):
+        self.path = Path(path)
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " id INTEGER PRIMARY KEY, best_url TEXT NOT NULL UNIQUE, domain TEXT NOT NULL,"
+            " ref_norm TEXT NOT NULL, brand_norm TEXT NOT NULL, titre TEXT, marque TEXT, reference TEXT,"
+            " extracted_data TEXT NOT NULL, image_path TEXT, pdfs TEXT NOT NULL,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS idx_products_ref ON products(ref_norm);"
+            # Postings des trigrammes de référence, groupés par marque pour borner les listes
+            "CREATE TABLE IF NOT EXISTS ref_trigrams ("
+            " brand_norm TEXT NOT NULL, trigram TEXT NOT NULL, product_id INTEGER NOT NULL,"
+            " PRIMARY KEY (brand_norm, trigram, product_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS idx_ref_trigrams_product ON ref_trigrams(product_id);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(titre, tokenize='unicode61 remove_diacritics 2');"
+            "CREATE TABLE IF NOT EXISTS brand_aliases (alias TEXT PRIMARY KEY, canonical TEXT NOT NULL);"
+        )
+        self._aliases = dict(BRAND_ALIASES)
+        self._aliases.update(dict(self._conn.execute("SELECT alias, canonical FROM brand_aliases").fetchall()))
+        self._stats = {"lookups": 0, "exact": 0, "fuzzy_reference": 0, "title": 0, "misses": 0, "writes": 0}
+
+    # --- marques -----------------------------------------------------------
+    def canonical_brand(self, marque: str) -> str:
+        key = normalize_text(marque).replace(" ", "")
+        return self._aliases.get(key, key)
+
+    def add_brand_alias(self, alias: str, canonical: str) -> None:
+        alias_key = normalize_text(alias).replace(" ", "")
+        canonical_key = self.canonical_brand(canonical)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO brand_aliases (alias, canonical) VALUES (?, ?)", (alias_key, canonical_key))
+            self._aliases[alias_key] = canonical_key
+
+    # --- écriture ----------------------------------------------------------
+    def record(self, titre: str, marque: str, reference: str, best_url: str, extracted_data: Dict[str, Any],
+               image_path: Optional[str] = None, pdfs: Optional[List[Dict[str, str]]] = None) -> int:
+        # pdfs : [{"sha256": ..., "name": ...}] ; une même URL produit n'a qu'une entrée
+        ref_norm = normalize_reference(reference)
+        brand_norm = self.canonical_brand(marque)
+        adapter = adapter_for_url(best_url)
+        domain = adapter.host if adapter else url_host(best_url)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT id FROM products WHERE best_url = ?", (best_url,)).fetchone()
+                values = (domain, ref_norm, brand_norm, titre, marque, reference,
+                          json.dumps(extracted_data, ensure_ascii=False), image_path, json.dumps(pdfs or []), now)
+                if row is None:
+                    cur = self._conn.execute(
+                        "INSERT INTO products (domain, ref_norm, brand_norm, titre, marque, reference, extracted_data,"
+                        " image_path, pdfs, updated_at, best_url, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        values + (best_url, now),
+                    )
+                    product_id = cur.lastrowid
+                else:
+                    product_id = row["id"]
+                    self._conn.execute(
+                        "UPDATE products SET domain = ?, ref_norm = ?, brand_norm = ?, titre = ?, marque = ?, reference = ?,"
+                        " extracted_data = ?, image_path = ?, pdfs = ?, updated_at = ? WHERE id = ?",
+                        values + (product_id,),
+                    )
+                    self._conn.execute("DELETE FROM ref_trigrams WHERE product_id = ?", (product_id,))
+                    self._conn.execute("DELETE FROM products_fts WHERE rowid = ?", (product_id,))
+                if ref_norm:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO ref_trigrams (brand_norm, trigram, product_id) VALUES (?, ?, ?)",
+                        [(brand_norm, t, product_id) for t in reference_trigrams(ref_norm)],
+                    )
+                self._conn.execute("INSERT INTO products_fts (rowid, titre) VALUES (?, ?)", (product_id, normalize_text(titre)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._stats["writes"] += 1
+        return product_id
+
+    def delete(self, product_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ref_trigrams WHERE product_id = ?", (product_id,))
+            self._conn.execute("DELETE FROM products_fts WHERE rowid = ?", (product_id,))
+            self._conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+
+    # --- lecture -----------------------------------------------------------
+    def _usable(self, row, domains: Optional[set], now: float) -> bool:
+        if domains is not None and row["domain"] not in domains:
+            return False
+        return self.max_age is None or now - row["updated_at"] <= self.max_age
+
+    def _entry(self, row, match: str, score: float) -> Dict[str, Any]:
+        entry = {k: row[k] for k in ("id", "best_url", "domain", "titre", "marque", "reference", "image_path", "updated_at", "hits")}
+        entry["extracted_data"] = json.loads(row["extracted_data"])
+        entry["pdfs"] = json.loads(row["pdfs"])
+        entry["match"] = match
+        entry["score"] = round(score, 3)
+        return entry
+
+    def lookup(self, titre: str = "", marque: str = "", reference: str = "",
+               domains: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        ref_norm = normalize_reference(reference)
+        brand_norm = self.canonical_brand(marque)
+        allowed = {strip_www(d.lower()) for d in domains} if domains else None
+        now = time.time()
+        with self._lock:
+            self._stats["lookups"] += 1
+            found = None
+            if ref_norm:
+                found = self._lookup_reference_locked(ref_norm, brand_norm, normalize_text(titre), allowed, now)
+            elif brand_norm and titre:
+                found = self._lookup_title_locked(normalize_text(titre), brand_norm, allowed, now)
+            if found is None:
+                self._stats["misses"] += 1
+                return None
+            row, match, score = found
+            self._stats[match] += 1
+            self._conn.execute("UPDATE products SET hits = hits + 1 WHERE id = ?", (row["id"],))
+        return self._entry(row, match, score)
+
+    def _lookup_reference_locked(self, ref_norm: str, brand_norm: str, titre_norm: str, allowed: Optional[set], now: float):
+        rows = self._conn.execute("SELECT * FROM products WHERE ref_norm = ? ORDER BY updated_at DESC", (ref_norm,)).fetchall()
+        # Même marque d'abord ; une marque absente d'un côté ne disqualifie pas
+        rows = [r for r in rows if self._usable(r, allowed, now) and (not brand_norm or not r["brand_norm"] or r["brand_norm"] == brand_norm)]
+        if rows:
+            rows.sort(key=lambda r: r["brand_norm"] != brand_norm)
+            return rows[0], MATCH_EXACT, 1.0
+        if not brand_norm or len(ref_norm) < 4:
+            # Sans marque, une référence approchée est trop risquée
+            return None
+        # Le trigramme de tête "  x" ne dit que le premier caractère : sa liste
+        # couvre ~1/36 des références de la marque (la plus longue de loin),
+        # il est indexé mais pas parcouru
+        trigrams = [t for t in reference_trigrams(ref_norm) if not t.startswith("  ")]
+        placeholders = ",".join("?" * len(trigrams))
+        # Colonnes légères pour les candidats ; la fiche complète n'est lue que pour le retenu
+        candidates = self._conn.execute(
+            f"SELECT p.id, p.ref_norm, p.titre, p.domain, p.updated_at FROM (SELECT product_id, COUNT(*) AS shared"
+            f" FROM ref_trigrams WHERE brand_norm = ? AND trigram IN ({placeholders}) GROUP BY product_id"
+            f" ORDER BY shared DESC LIMIT {FUZZY_CANDIDATES}) c JOIN products p ON p.id = c.product_id",
+            [brand_norm] + trigrams,
+        ).fetchall()
+        # Une référence voisine peut être un autre produit de la gamme : le
+        # titre demandé doit aussi recouper au moins à moitié celui du catalogue
+        wanted = set(titre_norm.split())
+        # La référence demandée est analysée une seule fois (seq2) ; les bornes
+        # supérieures real_quick_ratio/quick_ratio écartent la plupart des
+        # candidats avant le calcul complet de ratio()
+        matcher = difflib.SequenceMatcher(None)
+        matcher.set_seq2(ref_norm)
+        best_id, best_score = None, CATALOG_FUZZY_MIN
+        for row in candidates:
+            matcher.set_seq1(row["ref_norm"])
+            if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                continue
+            if not self._usable(row, allowed, now):
+                continue
+            if wanted and len(wanted & set(normalize_text(row["titre"]).split())) * 2 < len(wanted):
+                continue
+            score = matcher.ratio()
+            if score > best_score or (best_id is None and score >= best_score):
+                best_id, best_score = row["id"], score
+        if best_id is None:
+            return None
+        row = self._conn.execute("SELECT * FROM products WHERE id = ?", (best_id,)).fetchone()
+        return row, MATCH_FUZZY_REFERENCE, best_score
+
+    def _lookup_title_locked(self, titre_norm: str, brand_norm: str, allowed: Optional[set], now: float):
+        words = titre_norm.split()
+        if not words:
+            return None
+        # Tous les mots du titre demandé doivent figurer (ET implicite) : les
+        # listes se recoupent vite, alors qu'un OU trié par rang parcourt
+        # toutes les fiches contenant un mot courant ("disjoncteur")
+        query = " ".join(f'"{w}"' for w in words)
+        candidates = self._conn.execute(
+            f"SELECT p.* FROM products_fts f JOIN products p ON p.id = f.rowid"
+            f" WHERE products_fts MATCH ? AND p.brand_norm = ? LIMIT {FUZZY_CANDIDATES}",
+            (query, brand_norm),
+        ).fetchall()
+        wanted = set(words)
+        best = None
+        for row in candidates:
+            if not self._usable(row, allowed, now):
+                continue
+            have = set(normalize_text(row["titre"]).split())
+            score = len(wanted & have) / len(wanted | have) if have else 0.0
+            if score >= CATALOG_TITLE_MIN and (best is None or score > best[2]):
+                best = (row, MATCH_TITLE, score)
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM products").fetchone()
+            out = dict(self._stats)
+        out["products"] = count
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_catalog: Optional[ProductCatalog] = None
+_catalog_lock = threading.Lock()
+
+def get_catalog(path: Optional[Path] = None) -> ProductCatalog:
+    # Un seul catalogue ouvert par processus ; un autre chemin le remplace
+    global _catalog
+    path = Path(path) if path is not None else CATALOG_PATH
+    with _catalog_lock:
+        if _catalog is None or _catalog.path != path:
+            if _catalog is not None:
+                _catalog.close()
+            _catalog = ProductCatalog(path)
+        return _catalog
+
+# --- CLI ---------------------------------------------------------------------------------
+def _bench(entries: int, lookups: int) -> Dict[str, Any]:
+    # Catalogue synthétique jetable : temps par recherche exacte / approchée / titre
+    rng = random.Random(42)
+    brands = ["legrand", "schneider", "grohe", "atlantic", "hager", "geberit", "thermor", "deville"]
+    words = ["disjoncteur", "prise", "robinet", "mitigeur", "chauffe", "eau", "radiateur", "interrupteur", "tableau",
+             "thermostatique", "differentiel", "module", "cable", "gaine", "boite", "encastrement", "blanc", "chrome"]
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = ProductCatalog(Path(tmp) / "catalog.sqlite", max_age_days=0)
+        products = []
+        start = time.perf_counter()
+        for i in range(entries):
+            ref = "".join(rng.choice("0123456789ABCDEFNU") for _ in range(rng.randint(6, 10)))
+            brand = rng.choice(brands)
+            titre = " ".join(rng.sample(words, 4)) + f" {i}"
+            products.append((titre, brand, ref))
+            catalog.record(titre, brand, ref, f"https://www.pointp.fr/p/produit-{i}-A{i}", {"TITRE": titre})
+        build = time.perf_counter() - start
+
+        def timed(calls):
+            t = time.perf_counter()
+            hits = sum(1 for c in calls if catalog.lookup(*c) is not None)
+            return {"mean_ms": round((time.perf_counter() - t) / len(calls) * 1000, 4), "hit_ratio": round(hits / len(calls), 3)}
+
+        sample = [rng.choice(products) for _ in range(lookups)]
+        typo = lambda r: r[:len(r) // 2] + ("X" if r[len(r) // 2] != "X" else "Y") + r[len(r) // 2 + 1:]
+        report = {
+            "entries": entries,
+            "build_s": round(build, 2),
+            "exact": timed([("", b, r) for _, b, r in sample]),
+            "fuzzy_reference": timed([("", b, typo(r)) for _, b, r in sample]),
+            "title": timed([(t, b, "") for t, b, _ in sample]),
+            "miss": timed([("", b, "ZZZZZZZZ") for _, b, _ in sample]),
+        }
+        catalog.close()
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Catalogue local des produits déjà traités.")
+    parser.add_argument("--path", type=Path, default=None, help=f"Fichier du catalogue (défaut : {CATALOG_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_lookup = sub.add_parser("lookup")
+    p_lookup.add_argument("--titre", default="")
+    p_lookup.add_argument("--marque", default="")
+    p_lookup.add_argument("--reference", default="")
+    p_lookup.add_argument("--domain", action="append")
+    p_alias = sub.add_parser("alias", help="Ajoute un alias de marque")
+    p_alias.add_argument("alias")
+    p_alias.add_argument("canonical")
+    sub.add_parser("stats")
+    p_bench = sub.add_parser("bench", help="Mesure les temps de recherche sur un catalogue synthétique")
+    p_bench.add_argument("--entries", type=int, default=100000)
+    p_bench.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        print(json.dumps(_bench(args.entries, args.lookups), indent=2))
+        return 0
+    catalog = get_catalog(args.path)
+    if args.command == "lookup":
+        entry = catalog.lookup(args.titre, args.marque, args.reference, args.domain)
+        print(json.dumps(entry, ensure_ascii=False, indent=2))
+        return 0 if entry else 1
+    if args.command == "alias":
+        catalog.add_brand_alias(args.alias, args.canonical)
+    print(json.dumps(catalog.stats(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
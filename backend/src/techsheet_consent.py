@@ -0,0 +1,233 @@
+import os, re, json, time, threading
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Pattern
+
+from backend.src.techsheet_cache import CACHE_DIR
+from backend.src.techsheet_domains import adapter_for_url, url_host
+
+# ------------------------------------------------------------
+# Bandeaux cookies : état de consentement persistant + fermeture en un appel
+# ------------------------------------------------------------
+# Une fois le bandeau d'un site accepté, le storage_state Playwright du
+# contexte (cookies + localStorage) est enregistré sous techsheet/consent/
+# <site>.json ; les contextes suivants le reçoivent avant page.goto et le CMP
+# ne s'affiche plus. Les contextes du pool étant créés avant de connaître
+# l'URL (contexte de réserve), l'état est appliqué au contexte existant :
+# add_cookies pour les cookies, script d'initialisation pour le localStorage.
+#
+# Si un bandeau apparaît malgré tout, CONSENT_SCRIPT le cherche et clique
+# dans la page en une seule évaluation (sélecteurs connus des CMP, puis
+# libellés d'acceptation), au lieu de dizaines d'allers-retours de locators.
+CONSENT_STATE_ENABLED = os.getenv("TECHSHEET_CONSENT_STATE", "1").lower() not in ("0", "false", "no")
+CONSENT_STATE_DIR = Path(os.getenv("TECHSHEET_CONSENT_DIR", str(CACHE_DIR.parent / "consent")))
+CONSENT_STATE_MAX_AGE_DAYS = float(os.getenv("TECHSHEET_CONSENT_MAX_AGE_DAYS", "30"))
+# Attente de la disparition du bandeau après le clic (une seule attente côté page)
+CONSENT_HIDE_TIMEOUT_MS = int(os.getenv("TECHSHEET_CONSENT_HIDE_TIMEOUT_MS", "2000"))
+
+# Libellés d'acceptation, ancrés sur tout le texte du bouton : "ok" ne doit
+# pas reconnaître "Bookmark", ni "accepter" "Conditions à accepter avant
+# commande". Ordre = ordre de préférence.
+_STANDALONE_LABELS = (
+    r"^\s*tout\s+accepter\s*$",
+    r"^\s*accepter(?:\s+(?:tout|et\s+fermer|&\s*fermer|les\s+cookies|tous\s+les\s+cookies))?\s*$",
+    r"^\s*j.?accepte\s*$",
+    r"^\s*accept(?:\s+all)?(?:\s+cookies)?\s*$",
+    r"^\s*accept\s*&\s*close\s*$",
+    r"^\s*(?:i\s+)?agree\s*$",
+    r"^\s*allow\s+all(?:\s+cookies)?\s*$",
+)
+# Trop génériques hors d'un conteneur de bandeau reconnu ("OK" ferme aussi
+# une alerte de stock, "Continuer sans accepter" n'a de sens que dans un CMP)
+_BANNER_ONLY_LABELS = (
+    r"^\s*ok\s*$",
+    r"^\s*continuer\s+sans\s+accepter\s*$",
+    r"^\s*necessary\s+only\s*$",
+    r"^\s*confirm\s+your\s+choices\s*$",
+)
+COOKIE_ACCEPT_LABELS = [re.compile(p, re.I) for p in _STANDALONE_LABELS + _BANNER_ONLY_LABELS]
+CONSENT_STANDALONE_LABELS = frozenset(_STANDALONE_LABELS)
+
+# Boutons "accepter" des CMP rencontrés sur les sites suivis, par ordre de préférence
+CONSENT_ACCEPT_SELECTORS = (
+    "#onetrust-accept-btn-handler",
+    "#accept-recommended-btn-handler",
+    ".save-preference-btn-handler",
+    "#axeptio_btn_acceptAll",
+    "#didomi-notice-agree-button",
+    "#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll",
+    "#tarteaucitronPersonalize2",
+    "[data-testid='uc-accept-all-button']",
+)
+
+# Conteneurs de bandeaux dont on attend la disparition après le clic
+CONSENT_BANNER_SELECTORS = (
+    "#onetrust-banner-sdk", "#onetrust-pc-sdk", ".onetrust-pc-dark-filter",
+    "#axeptio_overlay", "#didomi-popup", "#CybotCookiebotDialog", "#tarteaucitronRoot",
+)
+
+CONSENT_SCRIPT = r"""
+([selectors, labels]) => {
+  const visible = (el) => {
+    const r = el.getBoundingClientRect();
+    if (r.width < 1 || r.height < 1) return false;
+    const s = getComputedStyle(el);
+    return s.visibility !== "hidden" && s.display !== "none" && s.opacity !== "0";
+  };
+  // Parcourt aussi les shadow roots ouverts (certains CMP s'y logent)
+  const roots = [document];
+  for (let i = 0; i < roots.length; i++) {
+    for (const el of roots[i].querySelectorAll("*")) {
+      if (el.shadowRoot) roots.push(el.shadowRoot);
+    }
+  }
+  const click = (el, how) => { el.click(); return how; };
+  for (const sel of selectors) {
+    for (const root of roots) {
+      const el = root.querySelector(sel);
+      if (el && visible(el)) return click(el, sel);
+    }
+  }
+  const banner = /cookie|consent|gdpr|rgpd|didomi|onetrust|axeptio|cmp|privacy|tarteaucitron/i;
+  const inBanner = (el) => {
+    for (let n = el; n; n = n.parentElement || (n.getRootNode() && n.getRootNode().host)) {
+      if (banner.test((n.id || "") + " " + (typeof n.className === "string" ? n.className : ""))) return true;
+    }
+    return false;
+  };
+  const patterns = labels.map(([p, standalone]) => [new RegExp(p, "i"), standalone]);
+  let best = null;
+  for (const root of roots) {
+    for (const el of root.querySelectorAll("button, a, [role=button], input[type=button], input[type=submit]")) {
+      const text = (el.innerText || el.value || el.getAttribute("aria-label") || "").replace(/\s+/g, " ").trim();
+      if (!text || text.length > 60 || !visible(el)) continue;
+      const rank = patterns.findIndex(([p]) => p.test(text));
+      if (rank < 0) continue;
+      const contained = inBanner(el);
+      // Hors bandeau, seuls les libellés courts sans ambiguïté ("Tout accepter", "Accept all")
+      if (!contained && (!patterns[rank][1] || text.length > 25)) continue;
+      const score = (contained ? 0 : 100) + rank;
+      if (!best || score < best.score) best = { el, score, text };
+    }
+  }
+  return best ? click(best.el, "label:" + best.text) : null;
+}
+"""
+
+CONSENT_HIDDEN_SCRIPT = r"""
+(selectors) => selectors.every((sel) => {
+  const el = document.querySelector(sel);
+  if (!el) return true;
+  const r = el.getBoundingClientRect();
+  const s = getComputedStyle(el);
+  return r.width < 1 || r.height < 1 || s.visibility === "hidden" || s.display === "none";
+})
+"""
+
+def dismiss_consent(page, labels: Optional[List[Pattern]] = None) -> Optional[str]:
+    # -> ce qui a été cliqué (sélecteur ou "label:<texte>"), None si aucun bandeau
+    labels = labels if labels is not None else COOKIE_ACCEPT_LABELS
+    labels = [[p.pattern, p.pattern in CONSENT_STANDALONE_LABELS] for p in labels]
+    clicked = page.evaluate(CONSENT_SCRIPT, [list(CONSENT_ACCEPT_SELECTORS), labels])
+    if clicked:
+        try:
+            page.wait_for_function(CONSENT_HIDDEN_SCRIPT, arg=list(CONSENT_BANNER_SELECTORS), timeout=CONSENT_HIDE_TIMEOUT_MS)
+        except Exception:
+            pass
+    return clicked
+
+# --- État de consentement par site ------------------------------------------------------
+def consent_key(url: str) -> str:
+    # Un fichier par site marchand (www.se.com et fr.se.com partagent se.com)
+    adapter = adapter_for_url(url)
+    return adapter.host if adapter else url_host(url)
+
+_LOCAL_STORAGE_INIT = """
+(() => {
+  const origins = %s;
+  const items = origins[location.origin];
+  if (!items) return;
+  try { for (const [k, v] of items) if (localStorage.getItem(k) === null) localStorage.setItem(k, v); } catch (e) {}
+})();
+"""
+
+class ConsentStateStore:
+    def __init__(self, directory: Path = CONSENT_STATE_DIR, max_age_days: float = CONSENT_STATE_MAX_AGE_DAYS):
+        self.directory = Path(directory)
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._stats = {"applied": 0, "missing": 0, "expired": 0, "saved": 0, "errors": 0}
+
+    def _bump(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{re.sub(r'[^0-9A-Za-z._-]', '_', key)}.json"
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self.path_for(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                self._bump("expired")
+                return None
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self._bump("missing")
+        except (OSError, ValueError):
+            self._bump("errors")
+        return None
+
+    def apply(self, context, url: str) -> bool:
+        # Injecte l'état enregistré du site dans un contexte déjà créé
+        if not CONSENT_STATE_ENABLED:
+            return False
+        state = self.load(consent_key(url))
+        if not state:
+            return False
+        try:
+            now = time.time()
+            cookies = [c for c in state.get("cookies", []) if c.get("expires", -1) < 0 or c["expires"] > now]
+            if cookies:
+                context.add_cookies(cookies)
+            origins = {o["origin"]: [[i["name"], i["value"]] for i in o.get("localStorage", [])]
+                       for o in state.get("origins", []) if o.get("localStorage")}
+            if origins:
+                context.add_init_script(_LOCAL_STORAGE_INIT % json.dumps(origins))
+        except Exception as e:
+            print(f"⚠️ État de consentement inutilisable pour {url}: {e}")
+            self._bump("errors")
+            return False
+        self._bump("applied")
+        return True
+
+    def save(self, context, url: str) -> bool:
+        if not CONSENT_STATE_ENABLED:
+            return False
+        path = self.path_for(consent_key(url))
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            context.storage_state(path=str(tmp))
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"⚠️ Enregistrement du consentement impossible pour {url}: {e}")
+            self._bump("errors")
+            try: tmp.unlink()
+            except OSError: pass
+            return False
+        self._bump("saved")
+        return True
+
+_store: Optional[ConsentStateStore] = None
+_store_lock = threading.Lock()
+
+def get_consent_store() -> ConsentStateStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConsentStateStore()
+        return _store
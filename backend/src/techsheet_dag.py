@@ -0,0 +1,130 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional, Dict, Tuple, Callable, Sequence
+
+from backend.src.techsheet_deadline import Deadline, DeadlineExceeded, DEADLINE_GRACE
+
+# ------------------------------------------------------------
+# Exécution des étapes d'une requête sous forme de graphe de dépendances
+# ------------------------------------------------------------
+STAGE_SUCCESS = "success"   # l'étape a renvoyé True
+STAGE_STOPPED = "stopped"   # l'étape a renvoyé False (la requête s'arrête)
+STAGE_ERROR = "error"       # l'étape a levé une exception
+STAGE_SKIPPED = "skipped"   # jamais lancée (dépendance en échec ou requête arrêtée)
+STAGE_TIMEOUT = "timeout"   # interrompue ou abandonnée à l'échéance de la requête
+
+def validate_stage_graph(stages: Sequence[Tuple[str, Sequence[str]]]) -> None:
+    names = [name for name, _ in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Étapes en double dans le graphe: {names}")
+    deps = {name: tuple(d) for name, d in stages}
+    for name, d in deps.items():
+        missing = [x for x in d if x not in deps]
+        if missing:
+            raise ValueError(f"L'étape '{name}' dépend d'étapes inconnues: {missing}")
+    # Détection de cycle (parcours en profondeur)
+    state: Dict[str, int] = {}
+    def _visit(n: str) -> None:
+        if state.get(n) == 2:
+            return
+        if state.get(n) == 1:
+            raise ValueError(f"Cycle détecté dans le graphe d'étapes autour de '{n}'")
+        state[n] = 1
+        for d in deps[n]:
+            _visit(d)
+        state[n] = 2
+    for n in names:
+        _visit(n)
+
+class StageGraphRun:
+    # Suivi thread-safe de l'avancement d'une requête dans le graphe : quelles
+    # étapes sont prêtes, lesquelles tournent, et le résultat de chacune.
+    # Dès qu'une étape ne réussit pas, plus aucune nouvelle étape n'est lancée ;
+    # celles déjà en cours vont à leur terme.
+    def __init__(self, stages: Sequence[Tuple[str, Sequence[str]]]):
+        validate_stage_graph(stages)
+        self.order = [name for name, _ in stages]
+        self.deps = {name: tuple(d) for name, d in stages}
+        self.outcomes: Dict[str, str] = {}
+        self.halted = False
+        self._submitted = set()
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def _ready_locked(self) -> List[str]:
+        if self.halted:
+            return []
+        ready = []
+        for name in self.order:
+            if name in self._submitted:
+                continue
+            if all(self.outcomes.get(d) == STAGE_SUCCESS for d in self.deps[name]):
+                self._submitted.add(name)
+                ready.append(name)
+        return ready
+
+    def start(self) -> List[str]:
+        with self._lock:
+            return self._ready_locked()
+
+    def complete(self, name: str, outcome: str) -> List[str]:
+        with self._lock:
+            self.outcomes[name] = outcome
+            if outcome != STAGE_SUCCESS:
+                self.halted = True
+            return self._ready_locked()
+
+    def running(self) -> int:
+        with self._lock:
+            return len(self._submitted) - len(self.outcomes)
+
+    def claim_finish(self) -> bool:
+        # Vrai une seule fois, pour l'appelant qui a terminé la dernière étape en cours
+        with self._lock:
+            if self._finished or len(self._submitted) != len(self.outcomes):
+                return False
+            self._finished = True
+            return True
+
+    def finalize(self) -> Dict[str, str]:
+        with self._lock:
+            for name in self.order:
+                self.outcomes.setdefault(name, STAGE_SKIPPED)
+            return {name: self.outcomes[name] for name in self.order}
+
+    @property
+    def succeeded(self) -> bool:
+        return all(self.outcomes.get(name) == STAGE_SUCCESS for name in self.order)
+
+def run_stage_graph(stages: Sequence[Tuple[str, Callable[[], bool], Sequence[str]]],
+                    max_workers: Optional[int] = None, deadline: Optional[Deadline] = None) -> Dict[str, str]:
+    # stages : [(nom, fonction sans argument renvoyant un bool, dépendances)]
+    # Avec une échéance, les étapes encore en cours DEADLINE_GRACE secondes
+    # après celle-ci sont marquées "timeout" et laissées finir en arrière-plan.
+    funcs = {name: fn for name, fn, _ in stages}
+    run = StageGraphRun([(name, deps) for name, _, deps in stages])
+
+    pool = ThreadPoolExecutor(max_workers=max_workers or len(stages), thread_name_prefix="stage")
+    running = {}
+    try:
+        running = {pool.submit(funcs[name]): name for name in run.start()}
+        while running:
+            timeout = deadline.remaining() + DEADLINE_GRACE if deadline is not None else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                for name in running.values():
+                    run.complete(name, STAGE_TIMEOUT)
+                break
+            for future in done:
+                name = running.pop(future)
+                try:
+                    outcome = STAGE_SUCCESS if future.result() else STAGE_STOPPED
+                except DeadlineExceeded:
+                    outcome = STAGE_TIMEOUT
+                except Exception:
+                    outcome = STAGE_ERROR
+                for next_name in run.complete(name, outcome):
+                    running[pool.submit(funcs[next_name])] = next_name
+    finally:
+        pool.shutdown(wait=not running, cancel_futures=True)
+    return run.finalize()
@@ -0,0 +1,92 @@
+import os, time, contextvars
+from contextlib import contextmanager
+from typing import Optional, Iterator
+
+# ------------------------------------------------------------
+# Échéance globale d'une requête et annulation coopérative
+# ------------------------------------------------------------
+# process_techsheet_request fixe une échéance : son argument deadline ou
+# TECHSHEET_REQUEST_DEADLINE secondes (120 par défaut, 0 = sans limite).
+# 120 s laisse une large marge à une requête normale (moins d'une seconde
+# dans le banc hors ligne, quelques dizaines de secondes sur les vrais
+# sites) et borne celles qui restent bloquées sur un site. Chaque étape la rend courante via une ContextVar, comme les
+# spans de techsheet_tracing, et tracing.bind() la propage aux pools de
+# threads internes et au navigateur. Les appels bloquants demandent leur
+# délai à remaining_timeout(plafond) : jamais plus que le plafond habituel,
+# jamais plus que le temps restant. Une fois l'échéance passée, ces appels
+# lèvent DeadlineExceeded ; l'étape est marquée "timeout" et la requête
+# renvoie ce qui a déjà été produit.
+REQUEST_DEADLINE = float(os.getenv("TECHSHEET_REQUEST_DEADLINE", "120"))
+# Marge laissée aux étapes en cours pour constater l'échéance avant d'être abandonnées
+DEADLINE_GRACE = float(os.getenv("TECHSHEET_DEADLINE_GRACE", "2"))
+# Délai minimal accordé à un appel réseau lancé juste avant l'échéance
+MIN_TIMEOUT = 0.5
+
+class DeadlineExceeded(BaseException):
+    # Comme asyncio.CancelledError, dérive de BaseException : les nombreux
+    # "except Exception" des replis (bandeaux, clics, sondes) ne l'absorbent
+    # pas et l'annulation remonte jusqu'à l'exécuteur d'étapes
+    span_status = "timeout"
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self) -> None:
+        if self.expired:
+            raise DeadlineExceeded(f"Échéance de {self.budget:g}s dépassée")
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        self.check()
+        remaining = max(MIN_TIMEOUT, self.remaining())
+        return remaining if cap is None else min(cap, remaining)
+
+_current_deadline = contextvars.ContextVar("techsheet_deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+# --- Points de contrôle (sans effet hors d'une requête avec échéance) -----------------
+def check_deadline() -> None:
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+def remaining_timeout(cap: Optional[float] = None) -> Optional[float]:
+    # Délai (s) à passer à un appel bloquant ; cap si aucune échéance
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return cap
+    return deadline.timeout(cap)
+
+def clamp_timeout(timeout):
+    # Timeout requests (None, nombre ou couple connexion/lecture) borné par le temps restant
+    remaining = remaining_timeout()
+    if remaining is None:
+        return timeout
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+def remaining_timeout_ms(cap_ms: int) -> int:
+    # Variante Playwright (millisecondes, jamais 0 qui signifie "sans limite")
+    timeout = remaining_timeout(cap_ms / 1000)
+    return max(1, int(timeout * 1000))
@@ -0,0 +1,143 @@
+import io, os, threading, time, hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from docxtpl import DocxTemplate
+
+from backend.src import techsheet_tracing as tracing
+
+# ------------------------------------------------------------
+# Rendu DOCX : modèles en cache, rendu en mémoire, rendu en masse
+# ------------------------------------------------------------
+# Le fichier modèle est lu une seule fois (rechargé si son mtime ou sa taille
+# change). docxtpl modifie le document pendant le rendu : chaque rendu repart
+# donc d'un DocxTemplate neuf construit sur les octets en cache, sans accès
+# disque. Le prétraitement jinja du XML (patch_xml, la passe de regex la plus
+# coûteuse) est mémorisé par contenu ; le dézippage, la compilation jinja et
+# la recompression du .docx restent faits à chaque rendu.
+Context = Union[Dict[str, Any], Callable[[DocxTemplate], Dict[str, Any]]]
+PATCHED_XML_MAX_ENTRIES = 64
+
+class CachedDocxTemplate(DocxTemplate):
+    def __init__(self, template_file, cache: "TemplateCache"):
+        super().__init__(template_file)
+        self._template_cache = cache
+
+    def patch_xml(self, src_xml):
+        return self._template_cache.patched_xml(src_xml, super().patch_xml)
+
+class TemplateCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # chemin absolu -> (mtime_ns, taille, octets)
+        self._entries: Dict[str, Tuple[int, int, bytes]] = {}
+        # sha1 du XML source -> XML prétraité pour jinja
+        self._patched: "OrderedDict[str, str]" = OrderedDict()
+        self._stats = {"hits": 0, "loads": 0, "reloads": 0, "patch_hits": 0, "patch_misses": 0}
+
+    def get_bytes(self, template_path: Union[str, Path]) -> Tuple[bytes, bool]:
+        # (octets du modèle, True si servis depuis le cache)
+        key = str(Path(template_path).resolve())
+        st = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._stats["hits"] += 1
+                return entry[2], True
+        content = Path(key).read_bytes()
+        with self._lock:
+            self._stats["reloads" if key in self._entries else "loads"] += 1
+            self._entries[key] = (st.st_mtime_ns, st.st_size, content)
+        return content, False
+
+    def patched_xml(self, src_xml: str, patch: Callable[[str], str]) -> str:
+        key = hashlib.sha1(src_xml.encode("utf-8")).hexdigest()
+        with self._lock:
+            patched = self._patched.get(key)
+            if patched is not None:
+                self._patched.move_to_end(key)
+                self._stats["patch_hits"] += 1
+                return patched
+        patched = patch(src_xml)
+        with self._lock:
+            self._stats["patch_misses"] += 1
+            self._patched[key] = patched
+            while len(self._patched) > PATCHED_XML_MAX_ENTRIES:
+                self._patched.popitem(last=False)
+        return patched
+
+    def new_document(self, template_path: Union[str, Path]) -> Tuple[DocxTemplate, bool]:
+        content, hit = self.get_bytes(template_path)
+        return CachedDocxTemplate(io.BytesIO(content), self), hit
+
+    def invalidate(self, template_path: Optional[Union[str, Path]] = None) -> None:
+        with self._lock:
+            self._patched.clear()
+            if template_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(Path(template_path).resolve()), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["templates"] = len(self._entries)
+        return out
+
+_template_cache = TemplateCache()
+
+def get_template_cache() -> TemplateCache:
+    return _template_cache
+
+def render_docx(template_path: Union[str, Path], context: Context, persist_to: Optional[Union[str, Path]] = None) -> Dict[str, Any]:
+    # context peut être une fonction doc -> dict (nécessaire pour InlineImage,
+    # qui doit être construit sur le document rendu)
+    start = time.perf_counter()
+    doc, cache_hit = get_template_cache().new_document(template_path)
+    tracing.add("cache_hits" if cache_hit else "cache_misses")
+    values = context(doc) if callable(context) else context
+    doc.render(values)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    render_ms = (time.perf_counter() - start) * 1000
+    path = None
+    if persist_to is not None:
+        path = Path(persist_to)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(buffer.getvalue())
+    return {
+        "buffer": buffer,
+        "path": path.as_posix() if path is not None else None,
+        "bytes": buffer.getbuffer().nbytes,
+        "render_ms": round(render_ms, 2),
+        "template_cache": "hit" if cache_hit else "miss",
+    }
+
+def render_many(template_path: Union[str, Path], contexts: Iterable[Context],
+                persist_paths: Optional[Iterable[Optional[Union[str, Path]]]] = None) -> Dict[str, Any]:
+    # Rendu de plusieurs documents sur le même modèle ; une erreur sur un
+    # document n'interrompt pas les suivants
+    contexts = list(contexts)
+    paths = list(persist_paths) if persist_paths is not None else [None] * len(contexts)
+    if len(paths) != len(contexts):
+        raise ValueError("persist_paths doit contenir un chemin (ou None) par contexte")
+    start = time.perf_counter()
+    documents: List[Dict[str, Any]] = []
+    for index, (context, path) in enumerate(zip(contexts, paths)):
+        try:
+            result = render_docx(template_path, context, persist_to=path)
+        except Exception as e:
+            result = {"buffer": None, "path": None, "bytes": 0, "render_ms": None, "error": repr(e)}
+        result["index"] = index
+        documents.append(result)
+    timings = [d["render_ms"] for d in documents if d["render_ms"] is not None]
+    return {
+        "documents": documents,
+        "rendered": len(timings),
+        "failed": len(documents) - len(timings),
+        "total_ms": round((time.perf_counter() - start) * 1000, 2),
+        "mean_render_ms": round(sum(timings) / len(timings), 2) if timings else None,
+        "template_cache": get_template_cache().stats(),
+    }
@@ -0,0 +1,160 @@
+import re, functools, urllib.parse
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple, Pattern, Iterable
+
+from backend.src.techsheet_resource_policy import ResourcePolicy, DEFAULT_RESOURCE_POLICY
+
+# ------------------------------------------------------------
+# Registre des sites marchands (un DomainAdapter par site)
+# ------------------------------------------------------------
+# Tout ce qui est spécifique à un site vit ici : motifs d'URL produit,
+# libellés des liens de documentation, règle d'exclusion des vignettes et
+# stratégie de téléchargement des PDF, recherche interne du site, filtrage
+# des ressources chargées par Playwright. Les motifs sont compilés une seule
+# fois à l'import ; ajouter un site = enregistrer un nouvel adaptateur.
+def _compile_all(patterns: Iterable[str], flags: int = re.I) -> Tuple[Pattern, ...]:
+    return tuple(re.compile(p, flags) for p in patterns)
+
+# Libellés génériques des liens/boutons menant à une fiche PDF
+CANDIDATE_LABELS = _compile_all([
+    r"\bsans\s*prix\b",
+    r"\btout\s*télécharger\b",
+    r"\btélécharger\b",
+    r"\btélécharger\s*sans\s*prix\b",
+    r"\bdownload\b",
+    r"\btechnical\s*sheet\b",
+    r"\bfiche\s*technique\b",
+    r"\bfiche\s*produit\b",
+    r"\bnotice\b",
+    r"\bimprimer\s*sans\s*prix\b",
+    r"\bcatalogue\b",
+    r"\bfiche\s*technique\s*du\s*produit\b",
+    r"\bprofil\s*environnemental\b",
+])
+
+DEFAULT_THUMBNAIL_PATTERN = re.compile(r"-S\.", re.I)
+
+@dataclass(frozen=True)
+class DomainAdapter:
+    host: str
+    # Pages produit reconnues avec certitude
+    product_patterns: Tuple[Pattern, ...]
+    # URLs acceptées faute de mieux (toute page du site)
+    fallback_patterns: Tuple[Pattern, ...] = ()
+    pdf_labels: Tuple[Pattern, ...] = CANDIDATE_LABELS
+    # Nom de la stratégie de téléchargement (voir PDF_STRATEGIES dans techsheet_processor) ;
+    # None = parcours générique des libellés
+    pdf_strategy: Optional[str] = None
+    thumbnail_pattern: Pattern = DEFAULT_THUMBNAIL_PATTERN
+    aliases: Tuple[str, ...] = field(default=())
+    # Moteur de recherche du site ({query} = référence encodée) ; None = DuckDuckGo uniquement
+    search_url: Optional[str] = None
+    # Nom du lecteur de la page de résultats (voir SEARCH_PARSERS dans techsheet_retailer_search)
+    search_parser: str = "product_links"
+    # Sous-ressources interrompues lors du chargement Playwright (images, polices, traceurs…)
+    resource_policy: ResourcePolicy = DEFAULT_RESOURCE_POLICY
+
+    def is_product_page(self, url: str) -> bool:
+        return any(p.search(url) for p in self.product_patterns)
+
+    def matches(self, url: str) -> bool:
+        return self.is_product_page(url) or any(p.search(url) for p in self.fallback_patterns)
+
+def _host_prefix(domain: str) -> str:
+    return rf"https?://(?:www\.)?{re.escape(domain)}"
+
+def _retail_adapter(domain: str, **kwargs) -> DomainAdapter:
+    # Sites Saint-Gobain (Point.P, Cedeo) : /p/<slug>-A<id>
+    prefix = _host_prefix(domain)
+    return DomainAdapter(
+        host=domain,
+        product_patterns=_compile_all([rf"{prefix}/p/.+-A\d+(?:[/?#].*)?$"]),
+        fallback_patterns=_compile_all([rf"{prefix}/.*"]),
+        **kwargs,
+    )
+
+POINTP = _retail_adapter("pointp.fr", pdf_strategy="pointp", search_url="https://www.pointp.fr/recherche?text={query}")
+
+CEDEO = _retail_adapter(
+    "cedeo.fr",
+    pdf_strategy="cedeo",
+    search_url="https://www.cedeo.fr/recherche?text={query}",
+    pdf_labels=_compile_all([
+        r"\bsans\s*prix\b",
+        r"\bimprimer\s*sans\s*prix\b",
+        r"\btélécharger\s*sans\s*prix\b",
+        r"\bfiche\s*produit\b",
+        r"\bfiche\s*technique\b",
+        r"\bdocumentation\b",
+        r"\bnotice\b",
+        r"\bFDS\b|\bfiche\s*de\s*sécurité\b",
+        r"\btélécharger\b",
+    ]),
+)
+
+SE_COM = DomainAdapter(
+    host="se.com",
+    product_patterns=_compile_all([
+        r"https?://(?:www\.)?se\.com/.*/product/[A-Za-z0-9_-]+(?:[/?#].*)?$",
+        r"https?://(?:www\.)?se\.com/[a-z]{2}/[a-z]{2}/product/[A-Za-z0-9_-]+(?:[/?].*)?$",
+    ]),
+    fallback_patterns=_compile_all([r"https?://(?:www\.)?se\.com/.*"]),
+    pdf_strategy="secom",
+    # Résultats rendus côté client : les URLs produit sont lues dans le JSON embarqué
+    search_url="https://www.se.com/fr/fr/search/?q={query}",
+    search_parser="embedded_urls",
+    # Fiches servies par le CDN documentaire Schneider
+    resource_policy=ResourcePolicy(allow_hosts=("download.schneider-electric.com",)),
+    pdf_labels=_compile_all([
+        r"\bfiche\s*technique\s*du\s*produit\b",
+        r"\bfiche\s*technique\b",
+        r"\bfiche\s*produit\b",
+        r"\btout\s*télécharger\b",
+        r"\btélécharger\b",
+        r"\bdocumentation\b",
+    ]),
+)
+
+_ADAPTERS: Dict[str, DomainAdapter] = {}
+
+def register_adapter(adapter: DomainAdapter) -> DomainAdapter:
+    for host in (adapter.host,) + tuple(adapter.aliases):
+        _ADAPTERS[host.lower()] = adapter
+    return adapter
+
+for _adapter in (POINTP, CEDEO, SE_COM):
+    register_adapter(_adapter)
+
+def registered_adapters() -> Tuple[DomainAdapter, ...]:
+    return tuple(dict.fromkeys(_ADAPTERS.values()))
+
+def strip_www(host: str) -> str:
+    return host[4:] if host.startswith("www.") else host
+
+def get_adapter(domain: str) -> Optional[DomainAdapter]:
+    return _ADAPTERS.get(strip_www(domain.lower()))
+
+@functools.lru_cache(maxsize=256)
+def generic_adapter(domain: str) -> DomainAdapter:
+    # Domaine saisi par l'utilisateur mais non enregistré : mêmes règles que Point.P/Cedeo
+    return _retail_adapter(domain.lower())
+
+def adapter_for_domain(domain: str) -> DomainAdapter:
+    return get_adapter(domain) or generic_adapter(domain)
+
+def url_host(url: str) -> str:
+    try:
+        host = urllib.parse.urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+    return strip_www(host.lower())
+
+def adapter_for_url(url: str) -> Optional[DomainAdapter]:
+    # Recherche par hôte puis par suffixes (fr.se.com -> se.com)
+    host = url_host(url)
+    while host:
+        adapter = _ADAPTERS.get(host)
+        if adapter is not None:
+            return adapter
+        _, _, host = host.partition(".")
+    return None
@@ -0,0 +1,148 @@
+import os, threading
+from typing import Optional, Dict, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.src import techsheet_tracing as tracing
+from backend.src.techsheet_deadline import current_deadline, check_deadline, clamp_timeout, DeadlineExceeded
+
+# ------------------------------------------------------------
+# Client HTTP partagé par tout le processus (pool de connexions + retries)
+# ------------------------------------------------------------
+# Toutes les étapes (recherche, scraping, images) passent par la même
+# requests.Session : les connexions TCP/TLS sont réutilisées d'une étape et
+# d'une requête à l'autre, et les 403/429/5xx sont rejoués avec un backoff
+# exponentiel par urllib3 au lieu de boucles time.sleep() ad hoc.
+HTTP_POOL_CONNECTIONS = int(os.getenv("TECHSHEET_HTTP_POOL_HOSTS", "32"))
+HTTP_POOL_MAXSIZE = int(os.getenv("TECHSHEET_HTTP_POOL_MAXSIZE", "16"))
+HTTP_RETRY_TOTAL = int(os.getenv("TECHSHEET_HTTP_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(os.getenv("TECHSHEET_HTTP_BACKOFF", "1.0"))
+HTTP_RETRY_BACKOFF_MAX = float(os.getenv("TECHSHEET_HTTP_BACKOFF_MAX", "20"))
+HTTP_RETRY_STATUSES = (403, 429, 500, 502, 503, 504)
+
+# "default" : GET/HEAD/POST rejoués ; "no_retry" : pour les appels qui ont
+# déjà leur propre repli (ex. plusieurs endpoints DuckDuckGo)
+RETRY_POLICIES = ("default", "no_retry")
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Any] = {"requests": 0, "retries": 0, "retries_by_status": {}, "retries_by_error": 0, "errors": 0}
+
+def _bump(key: str, n: int = 1) -> None:
+    with _metrics_lock:
+        _metrics[key] += n
+
+class _CountingRetry(Retry):
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        with _metrics_lock:
+            _metrics["retries"] += 1
+            if response is not None and response.status:
+                by_status = _metrics["retries_by_status"]
+                by_status[response.status] = by_status.get(response.status, 0) + 1
+            else:
+                _metrics["retries_by_error"] += 1
+        tracing.add("retries")
+        # Pas de nouvel essai au-delà de l'échéance de la requête
+        check_deadline()
+        return super().increment(method=method, url=url, response=response, error=error, _pool=_pool, _stacktrace=_stacktrace)
+
+    def sleep(self, response=None):
+        # Un backoff (ou Retry-After) qui dépasserait l'échéance : abandon immédiat
+        deadline = current_deadline()
+        if deadline is not None:
+            wait = (self.get_retry_after(response) if self.respect_retry_after_header and response else None) or self.get_backoff_time()
+            if wait >= deadline.remaining():
+                raise DeadlineExceeded(f"Backoff de {wait:.1f}s au-delà de l'échéance")
+        super().sleep(response)
+
+class _CountingAdapter(HTTPAdapter):
+    def send(self, request, stream=False, timeout=None, *args, **kwargs):
+        # Tous les appels du client partagé respectent l'échéance de la requête courante
+        timeout = clamp_timeout(timeout)
+        _bump("requests")
+        tracing.add("http_calls")
+        try:
+            response = super().send(request, stream, timeout, *args, **kwargs)
+            # Octets effectivement lus, attribués à l'étape qui a émis la requête
+            tracing.count_bytes(response.raw)
+            return response
+        except Exception:
+            _bump("errors")
+            raise
+
+    def pool_counters(self) -> Dict[str, int]:
+        # Compteurs urllib3 des pools encore ouverts : connexions créées vs requêtes servies
+        connections = requests_served = 0
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests_served += pool.num_requests
+        return {"connections_opened": connections, "pool_requests": requests_served}
+
+def make_retry(policy: str = "default") -> Retry:
+    if policy == "no_retry":
+        return _CountingRetry(total=0, redirect=5, raise_on_redirect=False, raise_on_status=False)
+    return _CountingRetry(
+        total=HTTP_RETRY_TOTAL,
+        connect=HTTP_RETRY_TOTAL,
+        read=1,
+        redirect=5,
+        status=HTTP_RETRY_TOTAL,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        backoff_max=HTTP_RETRY_BACKOFF_MAX,
+        respect_retry_after_header=True,
+        raise_on_redirect=False,
+        # Après épuisement, la dernière réponse (ex. 403) est rendue à l'appelant
+        raise_on_status=False,
+    )
+
+_sessions: Dict[str, requests.Session] = {}
+_adapters: Dict[str, _CountingAdapter] = {}
+_sessions_lock = threading.Lock()
+
+def get_http_session(policy: str = "default") -> requests.Session:
+    if policy not in RETRY_POLICIES:
+        raise ValueError(f"Politique de retry inconnue: {policy}")
+    with _sessions_lock:
+        session = _sessions.get(policy)
+        if session is None:
+            session = requests.Session()
+            adapter = _CountingAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+                max_retries=make_retry(policy),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[policy] = session
+            _adapters[policy] = adapter
+        return session
+
+def http_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        out = dict(_metrics)
+        out["retries_by_status"] = dict(_metrics["retries_by_status"])
+    connections = pool_requests = 0
+    with _sessions_lock:
+        adapters = list(_adapters.values())
+    for adapter in adapters:
+        counters = adapter.pool_counters()
+        connections += counters["connections_opened"]
+        pool_requests += counters["pool_requests"]
+    out["connections_opened"] = connections
+    out["connections_reused"] = max(0, pool_requests - connections)
+    out["reuse_ratio"] = out["connections_reused"] / pool_requests if pool_requests else 0.0
+    return out
+
+def close_http_sessions() -> None:
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _adapters.clear()
@@ -0,0 +1,84 @@
+import re
+from typing import List, Dict
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+# ------------------------------------------------------------
+# Extraction des URLs d'images d'une page produit (méthode avancée)
+# ------------------------------------------------------------
+# Un seul parcours du DOM collecte og:image, les attributs des <img> et les
+# background-image des attributs style ; les motifs sont compilés une fois.
+# Les URLs sont rendues dans le même ordre que l'ancienne implémentation
+# (scripts, og:image, <img>, styles), qui sert de référence au
+# micro-benchmark techsheet_image_extract_bench.
+#
+# Les motifs "scripts" restent des passes distinctes : fusionnés en une
+# alternance, ils ne trouveraient plus les correspondances qui se
+# chevauchent (l'URL d'une liste "imageUrls": [...] n'est plus relevée par
+# le motif https://...) et l'ordre des résultats changerait ; les deux cas
+# sont vérifiés dans backend/tests/test_image_extract.py. Un balayage par
+# ancres en lookahead s'est révélé plus lent avec le moteur re.
+SCRIPT_PATTERNS = tuple(re.compile(p, re.I) for p in (
+    r'"imageUrl":\s*"([^"]+)"',
+    r'"image":\s*"([^"]+)"',
+    r'"src":\s*"([^"]+\.(?:jpg|jpeg|png|webp))"',
+    r'imageUrls?["\']\s*:\s*\[([^\]]+)\]',
+    r'productImages?["\']\s*:\s*\[([^\]]+)\]',
+    r'"url":\s*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"',
+    r'"href":\s*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"',
+    r'https://[^"\s]*\.(?:jpg|jpeg|png|webp)(?:\?[^"\s]*)?',
+    r'"media":\s*\{[^}]*"url":\s*"([^"]+)"',
+    r'"assets":\s*\[[^\]]*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"',
+))
+IMAGE_EXT_RE = re.compile(r'\.(jpg|jpeg|png|webp)', re.I)
+SCRIPT_SKIP_RE = re.compile(r"-S\.|thumb|mini|small|icon|logo", re.I)
+IMG_SKIP_RE = re.compile(r"-S\.|thumb|mini|small|icon", re.I)
+FINAL_SKIP_RE = re.compile(r'logo|icon|favicon|header|footer|nav|menu|banner', re.I)
+BACKGROUND_RE = re.compile(r'background-image:\s*url\(["\']?([^"\']+)["\']?\)')
+IMG_ATTRS = ("src", "data-src", "data-original", "data-lazy", "data-zoom-src", "data-large", "data-full")
+
+def extract_image_urls(url: str, html_text: str, soup: BeautifulSoup, limit: int = 3) -> List[str]:
+    joined: Dict[str, str] = {}
+
+    def absolute(u: str) -> str:
+        # Les mêmes chemins reviennent d'un motif à l'autre : urljoin une seule fois
+        absu = joined.get(u)
+        if absu is None:
+            absu = joined[u] = urljoin(url, u)
+        return absu
+
+    from_scripts: List[str] = []
+    for pattern in SCRIPT_PATTERNS:
+        for match in pattern.findall(html_text):
+            if isinstance(match, str) and IMAGE_EXT_RE.search(match):
+                absu = absolute(match.replace('\\/', '/').replace('\\"', '"'))
+                if not SCRIPT_SKIP_RE.search(absu):
+                    from_scripts.append(absu)
+
+    from_meta: List[str] = []
+    from_imgs: List[str] = []
+    from_styles: List[str] = []
+    for el in soup.find_all(True):
+        attrs = el.attrs
+        name = el.name
+        if name == "meta":
+            if attrs.get("property") == "og:image" and attrs.get("content"):
+                absu = absolute(attrs["content"])
+                if IMAGE_EXT_RE.search(absu):
+                    from_meta.append(absu)
+        elif name == "img":
+            for attr in IMG_ATTRS:
+                u = attrs.get(attr)
+                if u:
+                    absu = absolute(u)
+                    if IMAGE_EXT_RE.search(absu) and not IMG_SKIP_RE.search(absu):
+                        from_imgs.append(absu)
+        if "style" in attrs:
+            for match in BACKGROUND_RE.findall(attrs.get("style") or ""):
+                if IMAGE_EXT_RE.search(match):
+                    from_styles.append(absolute(match))
+
+    urls = dict.fromkeys(from_scripts + from_meta + from_imgs + from_styles)
+    filtered = [u for u in urls if not FINAL_SKIP_RE.search(u) and IMAGE_EXT_RE.search(u)]
+    return filtered[:limit]
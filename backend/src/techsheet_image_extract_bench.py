@@ -0,0 +1,136 @@
+import re, json, time, argparse, statistics
+from pathlib import Path
+from typing import List, Optional, Dict, Any
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from backend.src.techsheet_image_extract import extract_image_urls
+
+# ------------------------------------------------------------
+# Micro-benchmark : extracteur d'images en une passe vs ancienne implémentation
+# ------------------------------------------------------------
+# Usage : python -m backend.src.techsheet_image_extract_bench [pages/pointp.fr.html ...]
+# Les pages sont des captures HTML enregistrées ; sans argument, celles de
+# backend/tests/fixtures/product_pages (pointp, cedeo, se.com) sont utilisées.
+# L'URL de base est déduite du nom de fichier (pointp.fr.html ->
+# https://www.pointp.fr/) sauf --base-url. Le code de sortie est 1 si les
+# deux implémentations divergent ; backend/tests/test_image_extract.py
+# vérifie la même équivalence.
+#
+# Relevé sur ces pages (médiane de 20 appels, limit=3) :
+#   cedeo.fr  8,6 ms -> 0,70 ms ; pointp.fr 14,1 ms -> 1,10 ms ; se.com 8,1 ms -> 0,71 ms
+FIXTURE_PAGES_DIR = Path(__file__).resolve().parents[1] / "tests" / "fixtures" / "product_pages"
+
+def legacy_extract_image_urls(url, html_text, soup, limit=3):
+    # Ancienne implémentation (10 findall, 9 sélecteurs CSS, passe style), conservée comme référence
+    urls = []
+
+    script_patterns = [
+        r'"imageUrl":\s*"([^"]+)"',
+        r'"image":\s*"([^"]+)"',
+        r'"src":\s*"([^"]+\.(?:jpg|jpeg|png|webp))"',
+        r'imageUrls?["\']\s*:\s*\[([^\]]+)\]',
+        r'productImages?["\']\s*:\s*\[([^\]]+)\]',
+        r'"url":\s*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"',
+        r'"href":\s*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"',
+        r'https://[^"\s]*\.(?:jpg|jpeg|png|webp)(?:\?[^"\s]*)?',
+        r'"media":\s*\{[^}]*"url":\s*"([^"]+)"',
+        r'"assets":\s*\[[^\]]*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"'
+    ]
+    for pattern in script_patterns:
+        matches = re.findall(pattern, html_text, re.I)
+        for match in matches:
+            if isinstance(match, str) and re.search(r'\.(jpg|jpeg|png|webp)', match, re.I):
+                clean_url = match.replace('\\/', '/').replace('\\"', '"')
+                absu = urljoin(url, clean_url)
+                if not re.search(r"-S\.|thumb|mini|small|icon|logo", absu, re.I):
+                    urls.append(absu)
+
+    for meta in soup.find_all("meta", property="og:image"):
+        if meta.get("content"):
+            absu = urljoin(url, meta["content"])
+            if re.search(r'\.(jpg|jpeg|png|webp)', absu, re.I):
+                urls.append(absu)
+
+    selectors = [
+        "img",".product-image img",".gallery img","[data-role='product-image'] img",
+        ".product-media img",".product-gallery img",".image-container img",
+        "[class*='product'] img","[class*='image'] img"
+    ]
+    for selector in selectors:
+        for img in soup.select(selector):
+            for attr in ["src","data-src","data-original","data-lazy","data-zoom-src","data-large","data-full"]:
+                u = img.get(attr)
+                if u:
+                    absu = urljoin(url, u)
+                    if re.search(r'\.(jpg|jpeg|png|webp)', absu, re.I):
+                        if not re.search(r"-S\.|thumb|mini|small|icon", absu, re.I):
+                            urls.append(absu)
+
+    for elem in soup.find_all(attrs={"style": True}):
+        style = elem.get("style", "")
+        bg_matches = re.findall(r'background-image:\s*url\(["\']?([^"\']+)["\']?\)', style)
+        for match in bg_matches:
+            if re.search(r'\.(jpg|jpeg|png|webp)', match, re.I):
+                absu = urljoin(url, match)
+                urls.append(absu)
+
+    urls = list(dict.fromkeys(urls))
+    filtered_urls = []
+    for u in urls:
+        if not re.search(r'logo|icon|favicon|header|footer|nav|menu|banner', u, re.I):
+            if re.search(r'\.(jpg|jpeg|png|webp)', u, re.I):
+                filtered_urls.append(u)
+    return filtered_urls[:limit]
+
+def _base_url_for(path: Path, base_url: Optional[str]) -> str:
+    if base_url:
+        return base_url
+    host = path.name[:-len(".html")] if path.name.endswith(".html") else path.stem
+    return f"https://www.{host}/"
+
+def _time_call(func, args, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def bench_page(path: Path, base_url: Optional[str] = None, repeat: int = 20, limits=(3, 1000)) -> Dict[str, Any]:
+    html_text = path.read_text(encoding="utf-8", errors="replace")
+    soup = BeautifulSoup(html_text, "html.parser")
+    url = _base_url_for(path, base_url)
+    identical = all(
+        legacy_extract_image_urls(url, html_text, soup, limit) == extract_image_urls(url, html_text, soup, limit)
+        for limit in limits
+    )
+    legacy = _time_call(legacy_extract_image_urls, (url, html_text, soup, 3), repeat)
+    single = _time_call(extract_image_urls, (url, html_text, soup, 3), repeat)
+    legacy_ms = statistics.median(legacy) * 1000
+    single_ms = statistics.median(single) * 1000
+    return {
+        "page": path.name,
+        "bytes": len(html_text.encode("utf-8")),
+        "urls": len(extract_image_urls(url, html_text, soup, max(limits))),
+        "identical": identical,
+        "legacy_ms": round(legacy_ms, 2),
+        "single_pass_ms": round(single_ms, 2),
+        "speedup": round(legacy_ms / single_ms, 2) if single_ms else None,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare l'extracteur d'images en une passe à l'ancienne implémentation.")
+    parser.add_argument("pages", nargs="*", help="Pages HTML enregistrées (défaut : pages de référence du dépôt)")
+    parser.add_argument("--base-url", help="URL de base pour résoudre les liens relatifs")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    pages = [Path(p) for p in args.pages] or sorted(FIXTURE_PAGES_DIR.glob("*.html"))
+    results = [bench_page(p, args.base_url, args.repeat) for p in pages]
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0 if all(r["identical"] for r in results) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
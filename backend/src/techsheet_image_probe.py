@@ -0,0 +1,154 @@
+import os, re, struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple
+
+import requests
+
+from backend.src import techsheet_tracing as tracing
+from backend.src.techsheet_http import get_http_session
+
+# ------------------------------------------------------------
+# Classement des images candidates à partir de leurs seuls en-têtes
+# ------------------------------------------------------------
+# Seuls les premiers Ko de chaque image sont lus (requête Range ; lecture
+# interrompue si le serveur ignore le Range) pour obtenir le format et les
+# dimensions en pixels. Les candidates sont notées et seule la gagnante est
+# téléchargée en entier.
+IMAGE_PROBE_BYTES = int(os.getenv("TECHSHEET_IMAGE_PROBE_BYTES", "32768"))
+IMAGE_PROBE_CONCURRENCY = int(os.getenv("TECHSHEET_IMAGE_PROBE_CONCURRENCY", "6"))
+IMAGE_PROBE_TIMEOUT = float(os.getenv("TECHSHEET_IMAGE_PROBE_TIMEOUT", "10"))
+# Nombre de candidates examinées pour une image retenue
+IMAGE_CANDIDATE_POOL = int(os.getenv("TECHSHEET_IMAGE_CANDIDATES", "8"))
+
+MIN_SIDE = 200          # en dessous : pastille, picto, vignette
+IDEAL_SIDE = 1200       # au-delà, aucun gain dans une fiche Word
+MAX_BYTES = 3 * 1024 * 1024
+
+GOOD_URL_HINTS = re.compile(r"zoom|large|big|hd|full|original|product|produit|packshot|main|master", re.I)
+BAD_URL_HINTS = re.compile(r"logo|icon|picto|badge|sprite|banner|placeholder|avatar|flag|label|stars?|rating|payment|social", re.I)
+
+# Formats qu'InlineImage (python-docx) sait insérer
+DOCX_FORMATS = {"jpeg", "png", "gif", "bmp", "tiff"}
+
+# --- Lecture des dimensions ---------------------------------------------------
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        (length,) = struct.unpack(">H", data[i + 2:i + 4])
+        # SOF0..SOF15 sauf DHT (C4), JPG (C8) et DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        i += 2 + length
+    return None
+
+def _webp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    chunk = data[12:16]
+    if chunk == b"VP8X" and len(data) >= 30:
+        w = int.from_bytes(data[24:27], "little") + 1
+        h = int.from_bytes(data[27:30], "little") + 1
+        return w, h
+    if chunk == b"VP8 " and len(data) >= 30:
+        w, h = struct.unpack("<HH", data[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        b = data[21:25]
+        w = 1 + (((b[1] & 0x3F) << 8) | b[0])
+        h = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+        return w, h
+    return None
+
+def parse_image_header(data: bytes) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    # (format, largeur, hauteur) ; None quand l'en-tête est absent ou tronqué
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        w, h = struct.unpack(">II", data[16:24])
+        return "png", w, h
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        w, h = struct.unpack("<HH", data[6:10])
+        return "gif", w, h
+    if data.startswith(b"\xff\xd8"):
+        size = _jpeg_size(data)
+        return ("jpeg",) + (size or (None, None))
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        size = _webp_size(data)
+        return ("webp",) + (size or (None, None))
+    if data.startswith(b"BM") and len(data) >= 26:
+        w, h = struct.unpack("<ii", data[18:26])
+        return "bmp", w, abs(h)
+    head = data[:256].lstrip().lower()
+    if head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in data[:1024].lower()):
+        return "svg", None, None
+    return None, None, None
+
+# --- Sonde ----------------------------------------------------------------------
+def probe_image(url: str, headers: Optional[Dict[str, str]] = None, cookies=None,
+                session: Optional[requests.Session] = None) -> Dict[str, Any]:
+    session = session or get_http_session("no_retry")
+    info: Dict[str, Any] = {"url": url, "format": None, "width": None, "height": None, "size": None, "probe_bytes": 0}
+    range_headers = dict(headers or {}, Range=f"bytes=0-{IMAGE_PROBE_BYTES - 1}")
+    try:
+        with session.get(url, headers=range_headers, cookies=cookies, stream=True, timeout=IMAGE_PROBE_TIMEOUT, verify=False) as r:
+            info["status"] = r.status_code
+            if r.status_code >= 400:
+                return info
+            data = b""
+            for chunk in r.iter_content(8192):
+                data += chunk
+                if len(data) >= IMAGE_PROBE_BYTES:
+                    break
+            info["probe_bytes"] = len(data)
+            total = r.headers.get("content-range", "").rpartition("/")[2]
+            if r.status_code == 200:
+                total = r.headers.get("content-length", "")
+            info["size"] = int(total) if total.isdigit() else None
+        info["format"], info["width"], info["height"] = parse_image_header(data)
+    except requests.exceptions.RequestException as e:
+        info["error"] = repr(e)
+    return info
+
+def score_candidate(info: Dict[str, Any], rank: int = 0) -> float:
+    score = 0.0
+    fmt, w, h = info.get("format"), info.get("width"), info.get("height")
+    if fmt is None:
+        return -100.0
+    if fmt not in DOCX_FORMATS:
+        score -= 20
+    if w and h:
+        short, long_ = min(w, h), max(w, h)
+        if short < MIN_SIDE:
+            score -= 30 * (1 - short / MIN_SIDE) + 10
+        score += 25 * min(short, IDEAL_SIDE) / IDEAL_SIDE
+        ratio = long_ / short if short else 99
+        # Une photo produit est proche du carré ; les bandeaux sont très allongés
+        score -= 8 * max(0.0, ratio - 1.5)
+    else:
+        score -= 10
+    size = info.get("size")
+    if size and size > MAX_BYTES:
+        score -= 10 * min(3.0, size / MAX_BYTES - 1)
+    url = info.get("url", "")
+    if GOOD_URL_HINTS.search(url):
+        score += 4
+    if BAD_URL_HINTS.search(url):
+        score -= 15
+    # À score égal, l'ordre de la page départage (image principale en premier)
+    return score - 0.5 * rank
+
+def rank_image_candidates(urls: List[str], headers: Optional[Dict[str, str]] = None, cookies=None) -> List[Dict[str, Any]]:
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return []
+    workers = max(1, min(IMAGE_PROBE_CONCURRENCY, len(urls)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        infos = list(pool.map(tracing.bind(lambda u: probe_image(u, headers, cookies)), urls))
+    for rank, info in enumerate(infos):
+        info["score"] = round(score_candidate(info, rank), 2)
+    return sorted(infos, key=lambda i: -i["score"])
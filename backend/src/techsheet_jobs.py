@@ -0,0 +1,337 @@
+import os, json, time, sqlite3, argparse, threading, multiprocessing, uuid
+from pathlib import Path
+from typing import List, Optional, Dict, Any
+
+from backend.src.techsheet_blob_store import get_pdf_store, BLOB_GC_INTERVAL
+
+# ------------------------------------------------------------
+# File de travaux persistante (SQLite) + pool de processus workers
+# ------------------------------------------------------------
+# L'interface soumet une requête et récupère un request_id ; des processus
+# workers réclament les travaux en file et exécutent process_techsheet_request.
+# L'état survit à un rafraîchissement du navigateur (et à un redémarrage :
+# les travaux "running" d'un worker disparu sont remis en file). Le
+# superviseur lance aussi le ramasse-miettes du magasin de PDF
+# (techsheet_blob_store) au démarrage puis toutes les BLOB_GC_INTERVAL secondes.
+JOBS_DB_PATH = Path(__file__).resolve().parent.parent.parent / "techsheet" / "jobs" / "jobs.sqlite"
+JOB_WORKERS = int(os.getenv("TECHSHEET_JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("TECHSHEET_JOB_POLL_INTERVAL", "1.0"))
+JOB_MAX_ATTEMPTS = 2
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+# Échéance de la requête dépassée : résultat incomplet, étapes inachevées dans stage_outcomes
+JOB_PARTIAL = "partial"
+JOB_ERROR = "error"
+JOB_CANCELLED = "cancelled"
+FINAL_STATUSES = (JOB_DONE, JOB_PARTIAL, JOB_ERROR, JOB_CANCELLED)
+
+def _connect(db_path: Path = JOBS_DB_PATH) -> sqlite3.Connection:
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " request_id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL,"
+        " result TEXT, error TEXT, worker_pid INTEGER, attempts INTEGER NOT NULL DEFAULT 0,"
+        " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+        " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+    return conn
+
+# --- API ------------------------------------------------------------------------
+def submit(titre_produit: str, marque: str, reference: str, template_path: str, selected_domains: Optional[List[str]] = None,
+           db_path: Path = JOBS_DB_PATH) -> str:
+    request_id = str(uuid.uuid4())
+    params = {
+        "titre_produit": titre_produit,
+        "marque": marque,
+        "reference": reference,
+        "template_path": str(template_path),
+        "selected_domains": list(selected_domains or []),
+    }
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO jobs (request_id, status, params, created_at) VALUES (?, ?, ?, ?)",
+            (request_id, JOB_QUEUED, json.dumps(params, ensure_ascii=False), time.time()),
+        )
+    finally:
+        conn.close()
+    return request_id
+
+def status(request_id: str, db_path: Path = JOBS_DB_PATH) -> Optional[Dict[str, Any]]:
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT status, error, attempts, cancel_requested, created_at, started_at, finished_at FROM jobs WHERE request_id = ?",
+            (request_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job_status, error, attempts, cancel_requested, created_at, started_at, finished_at = row
+        out = {
+            "request_id": request_id,
+            "status": job_status,
+            "error": error,
+            "attempts": attempts,
+            "cancel_requested": bool(cancel_requested),
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+        if job_status == JOB_QUEUED:
+            (ahead,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (JOB_QUEUED, created_at)
+            ).fetchone()
+            out["queue_position"] = ahead + 1
+        now = finished_at or time.time()
+        out["elapsed"] = now - (started_at or created_at)
+        return out
+    finally:
+        conn.close()
+
+def result(request_id: str, db_path: Path = JOBS_DB_PATH) -> Optional[Dict[str, Any]]:
+    # Sortie de process_techsheet_request, ou None tant que le travail n'est pas terminé
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT result FROM jobs WHERE request_id = ?", (request_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or row[0] is None:
+        return None
+    return json.loads(row[0])
+
+def cancel(request_id: str, db_path: Path = JOBS_DB_PATH) -> bool:
+    # Un travail en file est annulé immédiatement ; un travail en cours est
+    # marqué, et le pool arrête le processus qui l'exécute
+    conn = _connect(db_path)
+    try:
+        now = time.time()
+        cur = conn.execute(
+            "UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE request_id = ? AND status = ?",
+            (JOB_CANCELLED, now, request_id, JOB_QUEUED),
+        )
+        if cur.rowcount:
+            return True
+        cur = conn.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE request_id = ? AND status = ?", (request_id, JOB_RUNNING)
+        )
+        return bool(cur.rowcount)
+    finally:
+        conn.close()
+
+# --- Côté worker ------------------------------------------------------------------
+def _claim_next(conn: sqlite3.Connection, pid: int) -> Optional[Dict[str, Any]]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT request_id, params FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker_pid = ?, attempts = attempts + 1, started_at = ? WHERE request_id = ?",
+            (JOB_RUNNING, pid, time.time(), row[0]),
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return {"request_id": row[0], "params": json.loads(row[1])}
+
+def _finish(conn: sqlite3.Connection, request_id: str, output: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+    if error is not None:
+        job_status = JOB_ERROR
+    else:
+        job_status = {"success": JOB_DONE, "partial": JOB_PARTIAL}.get(output.get("status"), JOB_ERROR)
+        error = None if job_status == JOB_DONE else output.get("message")
+    conn.execute(
+        "UPDATE jobs SET status = CASE WHEN cancel_requested THEN ? ELSE ? END,"
+        " result = ?, error = ?, finished_at = ? WHERE request_id = ?",
+        (JOB_CANCELLED, job_status, json.dumps(output, ensure_ascii=False, default=str) if output is not None else None,
+         error, time.time(), request_id),
+    )
+
+def _worker_main(db_path: str, poll_interval: float) -> None:
+    from backend.src.techsheet_processor import process_techsheet_request
+
+    pid = os.getpid()
+    conn = _connect(Path(db_path))
+    while True:
+        job = _claim_next(conn, pid)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        params = job["params"]
+        try:
+            output = process_techsheet_request(
+                params["titre_produit"], params["marque"], params["reference"], params["template_path"],
+                params["selected_domains"], request_id=job["request_id"],
+            )
+            _finish(conn, job["request_id"], output, None)
+        except Exception as e:
+            _finish(conn, job["request_id"], None, repr(e))
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover_stale_jobs(db_path: Path = JOBS_DB_PATH, live_pids: Optional[set] = None) -> int:
+    # Travaux "running" dont le worker a disparu : remis en file, ou en erreur
+    # après JOB_MAX_ATTEMPTS tentatives
+    conn = _connect(db_path)
+    recovered = 0
+    try:
+        rows = conn.execute(
+            "SELECT request_id, worker_pid, attempts, cancel_requested FROM jobs WHERE status = ?", (JOB_RUNNING,)
+        ).fetchall()
+        for request_id, pid, attempts, cancel_requested in rows:
+            if (live_pids is not None and pid in live_pids) or (live_pids is None and _pid_alive(pid)):
+                continue
+            if cancel_requested:
+                new_status, error = JOB_CANCELLED, None
+            elif attempts >= JOB_MAX_ATTEMPTS:
+                new_status, error = JOB_ERROR, "Worker interrompu"
+            else:
+                new_status, error = JOB_QUEUED, None
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, worker_pid = NULL, finished_at = ? WHERE request_id = ? AND status = ?",
+                (new_status, error, time.time() if new_status != JOB_QUEUED else None, request_id, JOB_RUNNING),
+            )
+            recovered += 1
+    finally:
+        conn.close()
+    return recovered
+
+class JobWorkerPool:
+    # Processus workers (spawn : le processus parent, ex. Streamlit, a déjà
+    # des threads) + thread superviseur qui redémarre les workers morts,
+    # arrête ceux dont le travail a été annulé et nettoie le magasin de PDF
+    def __init__(self, size: int = JOB_WORKERS, db_path: Path = JOBS_DB_PATH, poll_interval: float = JOB_POLL_INTERVAL):
+        self.size = max(1, size)
+        self.db_path = Path(db_path)
+        self.poll_interval = poll_interval
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List[multiprocessing.process.BaseProcess] = []
+        self._stop = threading.Event()
+        self._supervisor: Optional[threading.Thread] = None
+        self._started_at: Dict[int, float] = {}
+        # Un worker qui meurt juste après son démarrage (import cassé...) est
+        # relancé avec un délai croissant plutôt qu'en boucle ; chaque mort
+        # n'est comptée qu'une fois, les emplacements en attente sont un simple compteur
+        self._respawn_delay = 0.0
+        self._respawn_after = 0.0
+        self._pending_respawns = 0
+        # Workers arrêtés par _terminate_cancelled : pas un plantage, relance immédiate
+        self._cancelled_pids: set = set()
+        self._next_gc = 0.0
+
+    def _spawn(self):
+        proc = self._ctx.Process(target=_worker_main, args=(str(self.db_path), self.poll_interval), daemon=True)
+        proc.start()
+        self._started_at[proc.pid] = time.time()
+        return proc
+
+    def start(self) -> "JobWorkerPool":
+        recover_stale_jobs(self.db_path)
+        self._procs = [self._spawn() for _ in range(self.size)]
+        self._supervisor = threading.Thread(target=self._supervise, name="techsheet-jobs-supervisor", daemon=True)
+        self._supervisor.start()
+        return self
+
+    def _supervise(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self._terminate_cancelled()
+            self._collect_garbage()
+            self._reap_and_respawn(time.time())
+
+    def _reap_and_respawn(self, now: float) -> None:
+        dead = [p for p in self._procs if not p.is_alive()]
+        if dead:
+            crashed = False
+            for p in dead:
+                started = self._started_at.pop(p.pid, now)
+                cancelled = p.pid in self._cancelled_pids
+                self._cancelled_pids.discard(p.pid)
+                crashed = crashed or (now - started < 10 and not cancelled)
+            if crashed:
+                self._respawn_delay = min(60.0, max(self.poll_interval, self._respawn_delay * 2))
+                self._respawn_after = max(self._respawn_after, now + self._respawn_delay)
+            else:
+                self._respawn_delay = 0.0
+            self._procs = [p for p in self._procs if p.is_alive()]
+            self._pending_respawns += len(dead)
+            recover_stale_jobs(self.db_path, live_pids={p.pid for p in self._procs})
+        if self._pending_respawns and now >= self._respawn_after:
+            self._procs.extend(self._spawn() for _ in range(self._pending_respawns))
+            self._pending_respawns = 0
+
+    def _collect_garbage(self) -> None:
+        if BLOB_GC_INTERVAL <= 0 or time.time() < self._next_gc:
+            return
+        self._next_gc = time.time() + BLOB_GC_INTERVAL
+        try:
+            report = get_pdf_store().collect_garbage()
+        except Exception as e:
+            print(f"⚠️ Nettoyage du magasin de PDF impossible: {e}")
+            return
+        if report["removed_refs"] or report["removed_blobs"]:
+            print(f"[jobs] magasin de PDF : {report['removed_refs']} référence(s) disparue(s), "
+                  f"{report['removed_blobs']} blob(s) supprimé(s), {report['bytes_freed']} octets libérés")
+
+    def _terminate_cancelled(self) -> None:
+        conn = _connect(self.db_path)
+        try:
+            pids = {pid for (pid,) in conn.execute(
+                "SELECT worker_pid FROM jobs WHERE status = ? AND cancel_requested = 1", (JOB_RUNNING,)
+            ).fetchall()}
+        finally:
+            conn.close()
+        for proc in self._procs:
+            if proc.pid in pids:
+                self._cancelled_pids.add(proc.pid)
+                proc.terminate()
+                proc.join(timeout=10)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self.size, "alive": sum(p.is_alive() for p in self._procs), "pids": [p.pid for p in self._procs],
+                "pending_respawns": self._pending_respawns, "respawn_delay": self._respawn_delay}
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=5)
+        for proc in self._procs:
+            proc.terminate()
+        for proc in self._procs:
+            proc.join(timeout=10)
+        self._procs = []
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Lance les workers de la file de fiches techniques.")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args(argv)
+    pool = JobWorkerPool(args.workers).start()
+    print(f"[jobs] {args.workers} worker(s) démarré(s) sur {JOBS_DB_PATH}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os, re
+from typing import List, Dict, Any, Optional, Pattern, Sequence
+
+# ------------------------------------------------------------
+# Repérage des liens/boutons de téléchargement en une passe dans la page
+# ------------------------------------------------------------
+# SCAN_SCRIPT relève en une seule évaluation tous les éléments cliquables
+# (texte, href, rôle, visibilité) et les marque d'un attribut
+# data-techsheet-candidate ; le classement par rapport aux libellés du site
+# se fait ensuite en Python (rank_candidates, fonction pure) et seuls les
+# mieux classés sont essayés, dans un budget de temps global.
+CLICK_MAX_CANDIDATES = int(os.getenv("TECHSHEET_CLICK_MAX_CANDIDATES", "5"))
+# Budget total (s) des essais de clic d'un appel à try_click_and_download
+CLICK_BUDGET = float(os.getenv("TECHSHEET_CLICK_BUDGET", "20"))
+
+CANDIDATE_ATTR = "data-techsheet-candidate"
+
+SCAN_SCRIPT = r"""
+(attr) => {
+  document.querySelectorAll("[" + attr + "]").forEach((el) => el.removeAttribute(attr));
+  const selector = "a, button, [role=button], [role=link], [onclick], input[type=button], input[type=submit]";
+  const out = [];
+  for (const el of document.querySelectorAll(selector)) {
+    // Un bouton imbriqué dans un lien (ou l'inverse) : on garde l'élément extérieur
+    if (el.parentElement && el.parentElement.closest(selector)) continue;
+    const r = el.getBoundingClientRect();
+    const s = getComputedStyle(el);
+    const visible = r.width > 0 && r.height > 0 && s.visibility !== "hidden" && s.display !== "none";
+    const text = (el.innerText || el.value || el.textContent || "").replace(/\s+/g, " ").trim().slice(0, 200);
+    el.setAttribute(attr, String(out.length));
+    out.push({
+      index: out.length,
+      tag: el.tagName.toLowerCase(),
+      role: el.getAttribute("role") || "",
+      text,
+      label: [el.getAttribute("aria-label"), el.getAttribute("title")].filter(Boolean).join(" "),
+      href: el.href && typeof el.href === "string" ? el.href : "",
+      download: el.hasAttribute("download"),
+      visible,
+    });
+  }
+  return out;
+}
+"""
+
+_PDF_HREF_RE = re.compile(r"\.pdf(?:[?#]|$)", re.I)
+_DOWNLOAD_HREF_RE = re.compile(r"download|t[ée]l[ée]charg", re.I)
+
+def is_pdf_href(href: str) -> bool:
+    return bool(href) and bool(_PDF_HREF_RE.search(href))
+
+def score_candidate(candidate: Dict[str, Any], labels: Sequence[Pattern]) -> Optional[float]:
+    # None = écarté ; plus le score est haut, plus tôt l'élément est essayé
+    name = f"{candidate.get('text', '')} {candidate.get('label', '')}".strip()
+    href = candidate.get("href") or ""
+    rank = next((i for i, p in enumerate(labels) if p.search(name)), None)
+    pdf_href = is_pdf_href(href)
+    if rank is None and not pdf_href:
+        return None
+    if not candidate.get("visible") and not pdf_href:
+        # Un élément caché ne se clique pas ; un lien PDF caché se télécharge quand même
+        return None
+    score = 0.0
+    if rank is not None:
+        # Les libellés sont ordonnés du plus précis au plus générique
+        score += 100 - 5 * rank
+    if pdf_href:
+        score += 40
+    elif _DOWNLOAD_HREF_RE.search(href):
+        score += 15
+    if candidate.get("download"):
+        score += 10
+    # À libellé égal, un texte court ("Fiche technique") bat un paragraphe entier
+    score -= min(len(name), 200) / 20
+    return score
+
+def rank_candidates(candidates: List[Dict[str, Any]], labels: Sequence[Pattern],
+                    limit: int = CLICK_MAX_CANDIDATES) -> List[Dict[str, Any]]:
+    labels = [re.compile(p, re.I) if isinstance(p, str) else p for p in labels]
+    scored = []
+    for c in candidates:
+        score = score_candidate(c, labels)
+        if score is not None:
+            scored.append(dict(c, score=round(score, 2)))
+    scored.sort(key=lambda c: (-c["score"], c["index"]))
+    ranked, seen_hrefs = [], set()
+    for c in scored:
+        href = c.get("href") or ""
+        # Plusieurs éléments vers le même document (image + texte) : un seul essai
+        if href and not href.startswith("javascript:") and not href.endswith("#"):
+            if href in seen_hrefs:
+                continue
+            seen_hrefs.add(href)
+        ranked.append(c)
+    return ranked[:limit]
+
+def scan_candidates(page) -> List[Dict[str, Any]]:
+    return page.evaluate(SCAN_SCRIPT, CANDIDATE_ATTR)
+
+def candidate_locator(page, candidate: Dict[str, Any]):
+    return page.locator(f'[{CANDIDATE_ATTR}="{candidate["index"]}"]')
@@ -0,0 +1,138 @@
+import os, itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Iterable
+
+import requests
+
+from backend.src import techsheet_tracing as tracing
+from backend.src.techsheet_http import get_http_session
+from backend.src.techsheet_blob_store import get_pdf_store, ByteBudget, ByteBudgetExceeded, STREAM_CHUNK_SIZE
+
+# ------------------------------------------------------------
+# Récupération concurrente des liens de documentation découverts sur la page
+# ------------------------------------------------------------
+# Les objets Playwright sont liés au thread du navigateur : les liens sont
+# donc collectés dans la page, puis téléchargés en parallèle avec le client
+# HTTP partagé (cookies et User-Agent recopiés depuis le contexte). Une sonde
+# HEAD (ou GET Range 0-1023 si HEAD est refusé) classe chaque lien avant
+# d'en télécharger le corps complet.
+PDF_FETCH_CONCURRENCY = int(os.getenv("TECHSHEET_PDF_FETCH_CONCURRENCY", "6"))
+PDF_FETCH_TIMEOUT = float(os.getenv("TECHSHEET_PDF_FETCH_TIMEOUT", "30"))
+PDF_PROBE_TIMEOUT = float(os.getenv("TECHSHEET_PDF_PROBE_TIMEOUT", "10"))
+
+PDF_MAGIC = b"%PDF-"
+
+LINK_PDF = "pdf"            # document PDF confirmé (content-type ou signature)
+LINK_MAYBE = "maybe"        # type inconnu mais URL en .pdf : on télécharge et on vérifie
+LINK_NOT_PDF = "not_pdf"    # page HTML, image... : ignoré
+LINK_BLOCKED = "blocked"    # refusé hors navigateur (401/403) : à rejouer via Playwright
+LINK_ERROR = "error"
+LINK_TOO_LARGE = "too_large"  # hors budget (par fichier ou par requête) : ignoré
+
+def cookie_jar_from_context(cookies: Iterable[Dict[str, Any]]) -> requests.cookies.RequestsCookieJar:
+    jar = requests.cookies.RequestsCookieJar()
+    for c in cookies or ():
+        jar.set(c.get("name"), c.get("value"), domain=c.get("domain", ""), path=c.get("path", "/"))
+    return jar
+
+def _looks_like_pdf_url(url: str) -> bool:
+    path = url.split("?", 1)[0].split("#", 1)[0].lower()
+    return path.endswith(".pdf")
+
+def _classify(status: int, ctype: str, url: str, head_bytes: bytes = b"") -> str:
+    if status in (401, 403):
+        return LINK_BLOCKED
+    if status >= 400:
+        return LINK_ERROR
+    if "application/pdf" in ctype or head_bytes.startswith(PDF_MAGIC):
+        return LINK_PDF
+    if ctype.startswith(("text/html", "image/", "text/css", "application/json", "application/javascript")):
+        return LINK_NOT_PDF
+    return LINK_MAYBE if _looks_like_pdf_url(url) else LINK_NOT_PDF
+
+def probe_link(url: str, session: requests.Session, headers: Dict[str, str], cookies) -> Dict[str, Any]:
+    info: Dict[str, Any] = {"url": url, "final_url": url, "status": None, "content_type": "", "size": None, "probe": "head"}
+    try:
+        r = session.head(url, headers=headers, cookies=cookies, allow_redirects=True, timeout=PDF_PROBE_TIMEOUT, verify=False)
+        ctype = (r.headers.get("content-type") or "").lower()
+        head_bytes = b""
+        if r.status_code in (405, 501) or (r.ok and not ctype):
+            # HEAD non supporté ou muet : on lit seulement les premiers octets
+            info["probe"] = "range"
+            range_headers = dict(headers, Range="bytes=0-1023")
+            r = session.get(url, headers=range_headers, cookies=cookies, stream=True, timeout=PDF_PROBE_TIMEOUT, verify=False)
+            try:
+                ctype = (r.headers.get("content-type") or "").lower()
+                head_bytes = next(r.iter_content(1024), b"")
+            finally:
+                r.close()
+        info["status"] = r.status_code
+        info["final_url"] = r.url or url
+        info["content_type"] = ctype
+        length = r.headers.get("content-range", "").rpartition("/")[2] or r.headers.get("content-length")
+        info["size"] = int(length) if length and length.isdigit() else None
+        info["kind"] = _classify(r.status_code, ctype, url, head_bytes)
+    except requests.exceptions.RequestException as e:
+        info["kind"] = LINK_ERROR
+        info["error"] = repr(e)
+    return info
+
+def _download(info: Dict[str, Any], session: requests.Session, headers: Dict[str, str], cookies,
+              budget: Optional[ByteBudget]) -> Dict[str, Any]:
+    # Corps écrit en continu dans le store (sha256 calculé au fil de l'eau) :
+    # le document n'est jamais entièrement en mémoire
+    try:
+        if budget is not None:
+            budget.check_declared(info.get("size"))
+        with session.get(info["url"], headers=headers, cookies=cookies, stream=True, timeout=PDF_FETCH_TIMEOUT, verify=False) as r:
+            info["status"] = r.status_code
+            if r.status_code in (401, 403):
+                info["kind"] = LINK_BLOCKED
+                return info
+            r.raise_for_status()
+            length = r.headers.get("content-length")
+            if budget is not None and length and length.isdigit():
+                budget.check_declared(int(length))
+            chunks = r.iter_content(STREAM_CHUNK_SIZE)
+            first = next(chunks, b"")
+            if not first.lstrip().startswith(PDF_MAGIC) and "application/pdf" not in (r.headers.get("content-type") or "").lower():
+                info["kind"] = LINK_NOT_PDF
+                return info
+            name = info["url"].split("/")[-1] or "document.pdf"
+            sha256, _, _, size = get_pdf_store().put_stream(itertools.chain([first], chunks), name, budget)
+        info["kind"] = LINK_PDF
+        info["size"] = size
+        info["sha256"] = sha256
+    except ByteBudgetExceeded as e:
+        info["kind"] = LINK_TOO_LARGE
+        info["error"] = str(e)
+    except requests.exceptions.RequestException as e:
+        info["kind"] = LINK_ERROR
+        info["error"] = repr(e)
+    return info
+
+def _probe_and_download(url: str, headers: Dict[str, str], cookies, budget: Optional[ByteBudget]) -> Dict[str, Any]:
+    # Sonde et téléchargement sans retry : la politique "default" rejoue les 403
+    # avec backoff, alors qu'un lien refusé hors navigateur doit être rendu tout
+    # de suite (LINK_BLOCKED) pour que l'appelant le rejoue via Playwright
+    session = get_http_session("no_retry")
+    info = probe_link(url, session, headers, cookies)
+    if info["kind"] in (LINK_PDF, LINK_MAYBE):
+        info = _download(info, session, headers, cookies, budget)
+    return info
+
+def fetch_pdf_links(urls: List[str], cookies=None, user_agent: Optional[str] = None, referer: Optional[str] = None,
+                    max_workers: Optional[int] = None, budget: Optional[ByteBudget] = None) -> List[Dict[str, Any]]:
+    # Résultats dans l'ordre des liens (les doublons sont ignorés) ; "sha256"
+    # (blob du store) n'est présent que pour les PDF effectivement téléchargés
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return []
+    headers = {"Accept": "application/pdf,application/octet-stream;q=0.9,*/*;q=0.8"}
+    if user_agent:
+        headers["User-Agent"] = user_agent
+    if referer:
+        headers["Referer"] = referer
+    workers = max(1, min(max_workers or PDF_FETCH_CONCURRENCY, len(urls)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(tracing.bind(lambda u: _probe_and_download(u, headers, cookies, budget)), urls))
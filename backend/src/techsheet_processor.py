@@ -1,6 +1,7 @@
-import os, re, json, time, random, urllib.parse, warnings, datetime, sys, asyncio, uuid, hashlib
+import os, re, json, time, random, urllib.parse, warnings, datetime, sys, asyncio, uuid, hashlib, functools, shutil
 from pathlib import Path
-from threading import Thread
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
 from typing import List, Optional, Dict, Any
 from urllib.parse import urljoin
 
@@ -19,6 +20,33 @@ from docx.shared import Cm
 
 # --- Playwright
 from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+from backend.src import techsheet_tracing as tracing
+from backend.src.techsheet_browser_pool import get_browser_pool
+from backend.src.techsheet_dag import run_stage_graph, STAGE_SUCCESS, STAGE_TIMEOUT
+from backend.src.techsheet_deadline import (
+    Deadline, DeadlineExceeded, REQUEST_DEADLINE, deadline_scope, current_deadline, check_deadline,
+    remaining_timeout, remaining_timeout_ms,
+)
+from backend.src.techsheet_cache import SqliteTTLCache, CACHE_DIR
+from backend.src.techsheet_snapshot import PageSnapshot, SNAPSHOT_FETCHED, SNAPSHOT_REUSED, SNAPSHOT_REFETCHED
+from backend.src.techsheet_text_reducer import reduce_page_text, count_tokens, token_counter
+from backend.src.techsheet_blob_store import get_pdf_store, ByteBudget, ByteBudgetExceeded
+from backend.src.techsheet_http import get_http_session, http_metrics
+from backend.src.techsheet_docx import render_docx
+from backend.src.techsheet_image_extract import extract_image_urls
+from backend.src.techsheet_image_probe import rank_image_candidates, IMAGE_CANDIDATE_POOL
+from backend.src.techsheet_retailer_search import search_retailers, normalize_reference
+from backend.src.techsheet_catalog import get_catalog, CATALOG_ENABLED
+from backend.src.techsheet_consent import dismiss_consent, get_consent_store, COOKIE_ACCEPT_LABELS
+from backend.src.techsheet_link_candidates import (
+    scan_candidates, rank_candidates, candidate_locator, is_pdf_href, CLICK_MAX_CANDIDATES, CLICK_BUDGET,
+)
+from backend.src.techsheet_resource_policy import install_resource_policy, BlockStats
+from backend.src.techsheet_pdf_fetch import fetch_pdf_links, cookie_jar_from_context, LINK_BLOCKED, LINK_ERROR
+from backend.src.techsheet_domains import (
+    CANDIDATE_LABELS, DEFAULT_THUMBNAIL_PATTERN, POINTP, CEDEO, SE_COM,
+    adapter_for_url, adapter_for_domain, url_host, strip_www, registered_adapters,
+)
 
 # ------------------------------------------------------------
 # Préparation env & constantes (identiques)
@@ -43,75 +71,17 @@ ADVANCED_HEADERS = {
     "Cache-Control": "max-age=0"
 }
 
-PRODUCT_PATTERNS = [
-    re.compile(r"https?://(?:www\.)?pointp\.fr/p/.+-A\d+(?:[/?#].*)?$", re.I),
-    re.compile(r"https?://(?:www\.)?cedeo\.fr/p/.+-A\d+(?:[/?#].*)?$", re.I),
-    re.compile(r"https?://(?:www\.)?se\.com/.*/product/[A-Za-z0-9_-]+(?:[/?#].*)?$", re.I),
-    re.compile(r"https?://(?:www\.)?se\.com/[a-z]{2}/[a-z]{2}/product/[A-Za-z0-9_-]+(?:[/?].*)?$", re.I),
-    re.compile(r"https?://(?:www\.)?se\.com/.*/product/[A-Za-z0-9_-]+(?:[/?].*)?$", re.I),
-    re.compile(r"https?://(?:www\.)?pointp\.fr/.*", re.I),
-    re.compile(r"https?://(?:www\.)?cedeo\.fr/.*", re.I),
-    re.compile(r"https?://(?:www\.)?se\.com/.*", re.I)
-]
-
-CANDIDATE_LABELS = [
-    r"\bsans\s*prix\b",
-    r"\btout\s*télécharger\b",
-    r"\btélécharger\b",
-    r"\btélécharger\s*sans\s*prix\b",
-    r"\bdownload\b",
-    r"\btechnical\s*sheet\b",
-    r"\bfiche\s*technique\b",
-    r"\bfiche\s*produit\b",
-    r"\bnotice\b",
-    r"\bimprimer\s*sans\s*prix\b",
-    r"\bcatalogue\b",
-    r"\bfiche\s*technique\s*du\s*produit\b",
-    r"\bimprimer\s*sans\s*prix\b",
-    r"\bprofil\s*environnemental\b",
-]
-SE_COM_LABELS = [
-    r"\bfiche\s*technique\s*du\s*produit\b",
-    r"\bfiche\s*technique\b",
-    r"\bfiche\s*produit\b",
-    r"\btout\s*télécharger\b",
-    r"\btélécharger\b",
-    r"\bdocumentation\b",
-]
-CEDEO_LABELS = [
-    r"\bsans\s*prix\b",
-    r"\bimprimer\s*sans\s*prix\b",
-    r"\btélécharger\s*sans\s*prix\b",
-    r"\bfiche\s*produit\b",
-    r"\bfiche\s*technique\b",
-    r"\bdocumentation\b",
-    r"\bnotice\b",
-    r"\bFDS\b|\bfiche\s*de\s*sécurité\b",
-    r"\btélécharger\b",
-]
-COOKIE_ACCEPT_LABELS = [
-    r"tout accepter", r"accepter", r"j.?accepte", r"ok", r"continuer sans accepter",
-    r"accept all", r"agree", r"allow all", r"necessary only", r"confirm your choices",
-    r"accept & close", r"accepter & fermer"
-]
-
 # ------------------------------------------------------------
 # Search (reprend ton code)
 # ------------------------------------------------------------
 def is_product_url(u: str, domains: List[str]) -> bool:
-    dynamic_product_patterns = []
+    host = url_host(u)
+    if not host:
+        return False
     for d in domains:
-        if d == "se.com":
-            # More flexible patterns for se.com
-            dynamic_product_patterns.append(re.compile(r"https?://(?:www\.)?se\.com/.*/product/[A-Za-z0-9_-]+(?:[/?#].*)?$", re.I))
-            dynamic_product_patterns.append(re.compile(r"https?://(?:www\.)?se\.com/[a-z]{2}/[a-z]{2}/product/[A-Za-z0-9_-]+(?:[/?].*)?$", re.I))
-            dynamic_product_patterns.append(re.compile(r"https?://(?:www\.)?se\.com/.*/product/[A-Za-z0-9_-]+(?:[/?].*)?$", re.I))
-            dynamic_product_patterns.append(re.compile(r"https?://(?:www\.)?se\.com/.*", re.I))
-        else:
-            # General pattern for other domains
-            dynamic_product_patterns.append(re.compile(rf"https?://(?:www\.)?{re.escape(d)}/p/.+-A\d+(?:[/?#].*)?$", re.I))
-            dynamic_product_patterns.append(re.compile(rf"https?://(?:www\.)?{re.escape(d)}/.*", re.I))
-    return any(p.search(u) for p in dynamic_product_patterns)
+        if host == strip_www(d.lower()):
+            return adapter_for_domain(d).matches(u)
+    return False
 
 def decode_ddg_redirect(u: str) -> str:
     if not u:
@@ -122,56 +92,160 @@ def decode_ddg_redirect(u: str) -> str:
     q = urllib.parse.parse_qs(parsed.query)
     return urllib.parse.unquote(q["uddg"][0]) if "uddg" in q else u
 
-def ddg_product_urls(query: str, domains, max_results=10):
-    site_filter = " OR ".join(f"site:{d}" for d in domains)
-    q = f"{query} {site_filter}"
-
-    sess = requests.Session()
-    sess.headers.update(HEADERS)
-    tried = []
-
-    # 1) DDG HTML via POST
-    for url in ("https://duckduckgo.com/html/", "https://html.duckduckgo.com/html/"):
+# Cache disque des résultats DuckDuckGo (techsheet/cache/search_cache.sqlite)
+SEARCH_CACHE_TTL = float(os.getenv("TECHSHEET_SEARCH_CACHE_TTL", str(7 * 24 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("TECHSHEET_SEARCH_CACHE_MAX_ENTRIES", "5000"))
+SEARCH_CACHE_BYPASS = os.getenv("TECHSHEET_SEARCH_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+_search_cache: Optional[SqliteTTLCache] = None
+_search_cache_lock = Lock()
+
+def get_search_cache() -> SqliteTTLCache:
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SqliteTTLCache(CACHE_DIR / "search_cache.sqlite", ttl_seconds=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES)
+        return _search_cache
+
+def search_cache_key(query: str, domains, max_results: int) -> str:
+    normalized = " ".join(query.casefold().split())
+    raw = json.dumps([normalized, sorted({d.casefold() for d in domains}), max_results])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _cached_search(key: str, lookup, use_cache: bool = True):
+    # lookup() -> (résultats, tried) ; seuls les résultats non vides sont mis en cache
+    use_cache = use_cache and not SEARCH_CACHE_BYPASS
+    if use_cache:
         try:
-            r = sess.post(url, data={"q": q}, verify=False, timeout=15)
-            tried.append((url, r.status_code))
-            soup = BeautifulSoup(r.text, "html.parser")
-            results = []
-            for a in soup.select("a.result__a"):
-                real = decode_ddg_redirect(a.get("href"))
-                if is_product_url(real, domains):
-                    results.append((a.get_text(strip=True) or real, real))
-                if len(results) >= max_results:
-                    break
-            if results:
-                return results, tried
+            cached = get_search_cache().get(key)
         except Exception as e:
-            tried.append((url, repr(e)))
-
-    # 2) Lite fallback via GET
-    for url in (
-        f"https://duckduckgo.com/lite/?q={urllib.parse.quote_plus(q)}",
-        f"https://lite.duckduckgo.com/lite/?q={urllib.parse.quote_plus(q)}",
-    ):
+            print(f"⚠️ Cache recherche indisponible: {e}")
+            cached, use_cache = None, False
+        if cached:
+            tracing.set_tier("cache")
+            return [tuple(r) for r in cached["results"]], [("cache", "hit")]
+
+    results, tried = lookup()
+    # Only successful lookups are cached so that a transient DDG failure is retried next time
+    if use_cache and results:
         try:
-            r = sess.get(url, verify=False, timeout=15)
-            tried.append((url, r.status_code))
-            soup = BeautifulSoup(r.text, "html.parser")
-            results = []
-            for a in soup.select("a[href]"):
-                real = decode_ddg_redirect(a.get("href"))
-                if is_product_url(real, domains):
-                    title = a.get_text(strip=True) or real
-                    results.append((title, real))
-                if len(results) >= max_results:
-                    break
-            if results:
-                return results, tried
+            get_search_cache().set(key, {"results": results, "tried": tried})
         except Exception as e:
-            tried.append((url, repr(e)))
+            print(f"⚠️ Cache recherche indisponible: {e}")
+    return results, tried
+
+def ddg_product_urls(query: str, domains, max_results=10, use_cache: bool = True):
+    return _cached_search(search_cache_key(query, domains, max_results),
+                          lambda: _ddg_product_urls_uncached(query, domains, max_results), use_cache)
+
+def retailer_product_urls(reference: str, domains, max_results=10, use_cache: bool = True):
+    # Recherche directe sur les sites (techsheet_retailer_search), même cache que DuckDuckGo
+    key = search_cache_key(f"retailer:{normalize_reference(reference)}", domains, max_results)
+    return _cached_search(key, lambda: search_retailers(reference, domains, max_results), use_cache)
+
+# Les endpoints DDG sont interrogés en décalé (hedging) : chacun part
+# DDG_HEDGE_DELAY secondes après le précédent, ou dès que le précédent a
+# échoué, et le premier jeu de résultats non vide l'emporte. Les endpoints
+# pas encore lancés ne le sont jamais ; une requête déjà partie ne peut pas
+# être interrompue, elle se termine en arrière-plan et figure comme
+# "cancelled" dans tried. tried : (url, statut HTTP ou erreur, latence en ms).
+DDG_SEARCH_MODE = os.getenv("TECHSHEET_DDG_MODE", "hedged")  # "hedged" | "sequential"
+DDG_HEDGE_DELAY = float(os.getenv("TECHSHEET_DDG_HEDGE_DELAY", "1.5"))
+DDG_TIMEOUT = float(os.getenv("TECHSHEET_DDG_TIMEOUT", "15"))
+
+def _ddg_endpoints(q: str):
+    # (méthode, url, sélecteur des liens résultats), par ordre de préférence
+    lite_q = urllib.parse.quote_plus(q)
+    return [
+        ("POST", "https://duckduckgo.com/html/", "a.result__a"),
+        ("POST", "https://html.duckduckgo.com/html/", "a.result__a"),
+        ("GET", f"https://duckduckgo.com/lite/?q={lite_q}", "a[href]"),
+        ("GET", f"https://lite.duckduckgo.com/lite/?q={lite_q}", "a[href]"),
+    ]
 
+def _query_ddg_endpoint(sess, endpoint, q: str, domains, max_results: int):
+    method, url, selector = endpoint
+    start = time.perf_counter()
+    results = []
+    try:
+        if method == "POST":
+            r = sess.post(url, data={"q": q}, headers=HEADERS, verify=False, timeout=DDG_TIMEOUT)
+        else:
+            r = sess.get(url, headers=HEADERS, verify=False, timeout=DDG_TIMEOUT)
+        soup = BeautifulSoup(r.text, "html.parser")
+        for a in soup.select(selector):
+            real = decode_ddg_redirect(a.get("href"))
+            if is_product_url(real, domains):
+                results.append((a.get_text(strip=True) or real, real))
+            if len(results) >= max_results:
+                break
+        status = r.status_code
+    except Exception as e:
+        results, status = [], repr(e)
+    return results, (url, status, round((time.perf_counter() - start) * 1000, 1))
+
+def _ddg_endpoint_label(url: str) -> str:
+    parts = urllib.parse.urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+def _ddg_sequential(sess, endpoints, q: str, domains, max_results: int):
+    tried = []
+    for endpoint in endpoints:
+        results, entry = _query_ddg_endpoint(sess, endpoint, q, domains, max_results)
+        tried.append(entry)
+        if results:
+            tracing.set_tier(_ddg_endpoint_label(endpoint[1]))
+            return results, tried
     return [], tried
 
+def _ddg_hedged(sess, endpoints, q: str, domains, max_results: int):
+    tried = []
+    pool = ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix="ddg")
+    pending = {}  # future -> (url, lancement)
+    next_index, next_launch = 0, time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if next_index < len(endpoints) and (now >= next_launch or not pending):
+                endpoint = endpoints[next_index]
+                next_index += 1
+                future = pool.submit(tracing.bind(_query_ddg_endpoint), sess, endpoint, q, domains, max_results)
+                pending[future] = (endpoint[1], now)
+                next_launch = now + DDG_HEDGE_DELAY
+                continue
+            if not pending:
+                return [], tried
+            timeout = max(0.0, next_launch - now) if next_index < len(endpoints) else None
+            done, _ = wait(pending, timeout=remaining_timeout(timeout), return_when=FIRST_COMPLETED)
+            winner = None
+            for future in done:
+                url, _ = pending.pop(future)
+                results, entry = future.result()
+                tried.append(entry)
+                if results and winner is None:
+                    winner = (url, results)
+            if winner is not None:
+                for url, launched in pending.values():
+                    tried.append((url, "cancelled", round((time.monotonic() - launched) * 1000, 1)))
+                tracing.set_tier(_ddg_endpoint_label(winner[0]))
+                return winner[1], tried
+            if done:
+                # Un endpoint a échoué : le suivant part sans attendre le délai
+                next_launch = time.monotonic()
+    finally:
+        pool.shutdown(wait=False)
+
+def _ddg_product_urls_uncached(query: str, domains, max_results=10):
+    site_filter = " OR ".join(f"site:{d}" for d in domains)
+    q = f"{query} {site_filter}"
+
+    # Pas de retry automatique : les endpoints DDG suivants servent déjà de repli
+    sess = get_http_session("no_retry")
+    endpoints = _ddg_endpoints(q)
+    if DDG_SEARCH_MODE == "sequential":
+        return _ddg_sequential(sess, endpoints, q, domains, max_results)
+    return _ddg_hedged(sess, endpoints, q, domains, max_results)
+
 def pick_best_result(results, keywords):
     scored = []
     for title, url in results:
@@ -184,19 +258,27 @@ def pick_best_result(results, keywords):
 # ------------------------------------------------------------
 # Image scraping (reprend ton code)
 # ------------------------------------------------------------
-def fetch_image_urls_simple(url, limit=3):
+def fetch_image_urls_simple(url, limit=3, snapshot: Optional[PageSnapshot] = None):
     print("🔍 Essai avec la méthode SIMPLE...")
     try:
-        r = requests.get(url, headers=SIMPLE_HEADERS, timeout=15, verify=False)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
+        if snapshot is not None:
+            if not snapshot.ok:
+                raise requests.exceptions.HTTPError(f"{snapshot.status_code} Error for url: {snapshot.final_url}")
+            snapshot.record("image_simple", SNAPSHOT_REUSED)
+            soup = snapshot.soup
+        else:
+            r = get_http_session().get(url, headers=SIMPLE_HEADERS, timeout=15, verify=False)
+            r.raise_for_status()
+            soup = BeautifulSoup(r.text, "html.parser")
+        adapter = adapter_for_url(url)
+        thumbnail_pattern = adapter.thumbnail_pattern if adapter else DEFAULT_THUMBNAIL_PATTERN
         urls = []
         for img in soup.find_all("img"):
             u = img.get("src") or img.get("data-src") or img.get("data-original")
             if not u:
                 continue
             absu = urljoin(url, u)
-            if not re.search(r"-S\.", absu, re.I):
+            if not thumbnail_pattern.search(absu):
                 if re.search(r"\.(jpg|jpeg|png|webp)$", absu, re.I):
                     urls.append(absu)
         urls = list(dict.fromkeys(urls))
@@ -206,122 +288,58 @@ def fetch_image_urls_simple(url, limit=3):
         print(f"  ❌ Méthode simple échouée: {e}")
         return []
 
+CONSENT_COOKIES = {'cookieconsent_status': 'dismiss', 'accepted_cookies': 'true'}
+
 def create_session():
-    session = requests.Session()
-    session.headers.update(ADVANCED_HEADERS)
-    session.cookies.update({'cookieconsent_status': 'dismiss', 'accepted_cookies': 'true'})
-    return session
+    # Session partagée (pool de connexions + backoff sur 403/429/5xx) ; les
+    # en-têtes et cookies "avancés" sont passés à chaque appel
+    return get_http_session()
 
-def fetch_image_urls_advanced(url, limit=3, max_retries=3):
+def fetch_image_urls_advanced(url, limit=3, max_retries=3, snapshot: Optional[PageSnapshot] = None):
     print("🔍 Essai avec la méthode AVANCÉE...")
+    if snapshot is not None and snapshot.ok:
+        snapshot.record("image_advanced", SNAPSHOT_REUSED)
+        return extract_image_urls(url, snapshot.text, snapshot.soup, limit)
+    if snapshot is not None:
+        snapshot.record("image_advanced", SNAPSHOT_REFETCHED)
     session = create_session()
-    for attempt in range(max_retries):
-        try:
-            print(f"  Tentative {attempt + 1}/{max_retries}...")
-            if attempt > 0:
-                time.sleep(random.uniform(2, 5))
-            if attempt == 1:
-                try:
-                    home_url = f"https://{url.split('/')[2]}/"
-                    session.get(home_url, timeout=15)
-                    time.sleep(random.uniform(1, 3))
-                except:
-                    pass
-            headers_copy = ADVANCED_HEADERS.copy()
-            if attempt > 0:
-                headers_copy["Referer"] = f"https://{url.split('/')[2]}/"
-            r = session.get(url, headers=headers_copy, timeout=20, verify=False)
-            if r.status_code == 403:
-                if attempt < max_retries - 1:
-                    continue
-                else:
-                    raise requests.exceptions.HTTPError(f"403 Client Error après {max_retries} tentatives")
-            r.raise_for_status()
+    home_url = f"https://{url.split('/')[2]}/"
+    # Les 403/429/5xx sont déjà rejoués avec backoff par l'adaptateur HTTP ;
+    # si le site refuse encore, on passe par la page d'accueil puis on revient avec un Referer
+    r = session.get(url, headers=ADVANCED_HEADERS, cookies=CONSENT_COOKIES, timeout=20, verify=False)
+    for attempt in range(1, max_retries):
+        if r.status_code != 403:
             break
-        except requests.exceptions.RequestException as e:
-            if attempt == max_retries - 1:
-                raise
-    soup = BeautifulSoup(r.text, "html.parser")
-    urls = []
-
-    script_patterns = [
-        r'"imageUrl":\s*"([^"]+)"',
-        r'"image":\s*"([^"]+)"',
-        r'"src":\s*"([^"]+\.(?:jpg|jpeg|png|webp))"',
-        r'imageUrls?["\']\s*:\s*\[([^\]]+)\]',
-        r'productImages?["\']\s*:\s*\[([^\]]+)\]',
-        r'"url":\s*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"',
-        r'"href":\s*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"',
-        r'https://[^"\s]*\.(?:jpg|jpeg|png|webp)(?:\?[^"\s]*)?',
-        r'"media":\s*\{[^}]*"url":\s*"([^"]+)"',
-        r'"assets":\s*\[[^\]]*"([^"]*\.(?:jpg|jpeg|png|webp)[^"]*)"'
-    ]
-    for pattern in script_patterns:
-        matches = re.findall(pattern, r.text, re.I)
-        for match in matches:
-            if isinstance(match, str) and re.search(r'\.(jpg|jpeg|png|webp)', match, re.I):
-                clean_url = match.replace('\\/', '/').replace('\\"', '"')
-                absu = urljoin(url, clean_url)
-                if not re.search(r"-S\.|thumb|mini|small|icon|logo", absu, re.I):
-                    urls.append(absu)
-
-    for meta in soup.find_all("meta", property="og:image"):
-        if meta.get("content"):
-            absu = urljoin(url, meta["content"])
-            if re.search(r'\.(jpg|jpeg|png|webp)', absu, re.I):
-                urls.append(absu)
-
-    selectors = [
-        "img",".product-image img",".gallery img","[data-role='product-image'] img",
-        ".product-media img",".product-gallery img",".image-container img",
-        "[class*='product'] img","[class*='image'] img"
-    ]
-    for selector in selectors:
-        for img in soup.select(selector):
-            for attr in ["src","data-src","data-original","data-lazy","data-zoom-src","data-large","data-full"]:
-                u = img.get(attr)
-                if u:
-                    absu = urljoin(url, u)
-                    if re.search(r'\.(jpg|jpeg|png|webp)', absu, re.I):
-                        if not re.search(r"-S\.|thumb|mini|small|icon", absu, re.I):
-                            urls.append(absu)
-
-    for elem in soup.find_all(attrs={"style": True}):
-        style = elem.get("style", "")
-        bg_matches = re.findall(r'background-image:\s*url\(["\']?([^"\']+)["\']?\)', style)
-        for match in bg_matches:
-            if re.search(r'\.(jpg|jpeg|png|webp)', match, re.I):
-                absu = urljoin(url, match)
-                urls.append(absu)
-
-    urls = list(dict.fromkeys(urls))
-    filtered_urls = []
-    for u in urls:
-        if not re.search(r'logo|icon|favicon|header|footer|nav|menu|banner', u, re.I):
-            if re.search(r'\.(jpg|jpeg|png|webp)', u, re.I):
-                filtered_urls.append(u)
-    return filtered_urls[:limit]
+        print(f"  Tentative {attempt + 1}/{max_retries}...")
+        try:
+            session.get(home_url, headers=ADVANCED_HEADERS, cookies=CONSENT_COOKIES, timeout=15, verify=False)
+        except requests.exceptions.RequestException:
+            pass
+        headers_copy = ADVANCED_HEADERS.copy()
+        headers_copy["Referer"] = home_url
+        r = session.get(url, headers=headers_copy, cookies=CONSENT_COOKIES, timeout=20, verify=False)
+    if r.status_code == 403:
+        raise requests.exceptions.HTTPError(f"403 Client Error après {max_retries} tentatives")
+    r.raise_for_status()
+    return extract_image_urls(url, r.text, BeautifulSoup(r.text, "html.parser"), limit)
 
 def download_images(urls, out_dir, use_advanced=False):
     os.makedirs(out_dir, exist_ok=True)
+    session = get_http_session()
     if use_advanced:
-        session = create_session()
         headers = ADVANCED_HEADERS.copy()
         headers.update({"Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"})
     else:
-        session = requests.Session()
         headers = SIMPLE_HEADERS
 
     for i, u in enumerate(urls):
         try:
-            if use_advanced and i > 0:
-                time.sleep(random.uniform(1, 3))
             if use_advanced:
                 img_headers = headers.copy()
                 img_headers["Referer"] = u.split('/')[0] + '//' + u.split('/')[2] + '/'
             else:
                 img_headers = headers
-            r = session.get(u, headers=img_headers, timeout=20, verify=False)
+            r = session.get(u, headers=img_headers, cookies=CONSENT_COOKIES if use_advanced else None, timeout=20, verify=False)
             r.raise_for_status()
             filename = f"image{i+1}.jpg"
             path = os.path.join(out_dir, filename)
@@ -331,23 +349,47 @@ def download_images(urls, out_dir, use_advanced=False):
         except Exception as e:
             print(f"✘ Erreur téléchargement: {u} - {e}")
 
-def fetch_and_download(url, out_dir, limit=1):
+def select_images(urls, limit=1, headers=None, cookies=None):
+    # Sonde les en-têtes de chaque candidate et garde les mieux notées ; si
+    # aucune n'a pu être lue, on revient à l'ordre de la page
+    ranking = rank_image_candidates(urls, headers=headers, cookies=cookies)
+    picked = [c["url"] for c in ranking if c["format"] is not None][:limit] or list(urls)[:limit]
+    report = {
+        "candidates": len(ranking),
+        "probe_bytes": sum(c["probe_bytes"] for c in ranking),
+        "selected": picked,
+        "ranking": [{k: c.get(k) for k in ("url", "format", "width", "height", "size", "score")} for c in ranking],
+    }
+    for c in ranking[:3]:
+        print(f"  • {c['score']:>7} {c['format']} {c['width']}x{c['height']} {c['url']}")
+    return picked, report
+
+def fetch_and_download(url, out_dir, limit=1, snapshot: Optional[PageSnapshot] = None):
+    # Renvoie le rapport de sélection des images (ou None si aucune candidate)
     print(f"=== TRAITEMENT DE: {url} ===\n")
-    urls = fetch_image_urls_simple(url, limit)
+    pool_size = max(limit, IMAGE_CANDIDATE_POOL)
+    urls = fetch_image_urls_simple(url, pool_size, snapshot=snapshot)
     if urls and len(urls) >= 1:
         print(f"\n✅ Méthode SIMPLE réussie !")
-        download_images(urls, out_dir, use_advanced=False)
-        return
+        tracing.set_tier("simple")
+        picked, report = select_images(urls, limit, headers=SIMPLE_HEADERS)
+        download_images(picked, out_dir, use_advanced=False)
+        return report
     print("\n⚠️ Méthode simple insuffisante, passage à la méthode AVANCÉE...")
     try:
-        urls = fetch_image_urls_advanced(url, limit)
+        urls = fetch_image_urls_advanced(url, pool_size, snapshot=snapshot)
         if not urls:
             print("❌ Aucune image trouvée avec les deux méthodes")
-            return
+            return None
         print(f"\n✅ Méthode AVANCÉE réussie !")
-        download_images(urls, out_dir, use_advanced=True)
+        tracing.set_tier("advanced")
+        probe_headers = dict(ADVANCED_HEADERS, Referer=url)
+        picked, report = select_images(urls, limit, headers=probe_headers, cookies=CONSENT_COOKIES)
+        download_images(picked, out_dir, use_advanced=True)
+        return report
     except Exception as e:
         print(f"❌ Erreur avec méthode avancée: {e}")
+        return None
 
 # ------------------------------------------------------------
 # Playwright PDF (reprend ton code)
@@ -364,164 +406,199 @@ def _get_unique_filepath(directory: Path, filename: str) -> Path:
         counter += 1
     return path
 
-# Dictionary to store hashes of downloaded PDFs and their paths within a single request
-_downloaded_pdf_info = {}
-
-def _process_and_save_pdf_content(content_bytes: bytes, suggested_filename: str, download_dir: Path, saved: List[str]) -> bool:
-    pdf_hash = hashlib.sha256(content_bytes).hexdigest()
-
-    if pdf_hash in _downloaded_pdf_info:
-        # File with this content already exists, add its path to saved and skip saving again
-        saved.append(str(_downloaded_pdf_info[pdf_hash]))
+# Les PDF sont écrits une seule fois dans le store adressé par contenu
+# (techsheet/blobs) ; le dossier de la requête n'en reçoit qu'un lien.
+def _link_pdf_into_dir(sha256: str, suggested_filename: str, download_dir: Path, saved: List[str], force_pdf_ext: bool = True) -> bool:
+    store = get_pdf_store()
+    download_dir = Path(download_dir)
+    existing = store.find_ref(sha256, download_dir)
+    if existing is not None:
+        # File with this content already exists in this request, reuse its path
+        saved.append(str(existing))
         return True
 
-    # If not duplicated, generate a unique filename for the new download
-    if not suggested_filename.lower().endswith(".pdf"):
+    if force_pdf_ext and not suggested_filename.lower().endswith(".pdf"):
         suggested_filename += ".pdf"
     unique_path = _get_unique_filepath(download_dir, suggested_filename)
-
-    unique_path.parent.mkdir(parents=True, exist_ok=True)
-    unique_path.write_bytes(content_bytes)
-    
-    _downloaded_pdf_info[pdf_hash] = unique_path # Store path of the first instance
-    saved.append(str(unique_path))
+    dest, _ = store.link_into(sha256, unique_path)
+    saved.append(str(dest))
     return True
 
-
-def _wait_onetrust_gone(page, timeout_ms=4000):
-    for sel in ("#onetrust-banner-sdk", "#onetrust-pc-sdk",".onetrust-pc-dark-filter", "#onetrust-consent-sdk"):
+def _process_and_save_pdf_content(content_bytes: bytes, suggested_filename: str, download_dir: Path, saved: List[str],
+                                  budget: Optional[ByteBudget] = None) -> bool:
+    # Corps déjà reçu par le navigateur : hors compteurs du client HTTP
+    tracing.add("bytes", len(content_bytes))
+    try:
+        if budget is not None:
+            budget.charge(len(content_bytes))
+    except ByteBudgetExceeded as e:
+        print(f"⚠️ PDF ignoré ({suggested_filename}): {e}")
+        return False
+    sha256, _, _ = get_pdf_store().put_bytes(content_bytes, suggested_filename)
+    return _link_pdf_into_dir(sha256, suggested_filename, download_dir, saved)
+
+def _read_response_body(resp, budget: Optional[ByteBudget] = None) -> Optional[bytes]:
+    # Les réponses Playwright ne se lisent pas en flux : on refuse d'après
+    # Content-Length avant de charger le corps en mémoire
+    if budget is not None:
+        length = resp.headers.get("content-length")
         try:
-            page.wait_for_selector(sel, state="hidden", timeout=timeout_ms)
-        except Exception:
-            pass
+            budget.check_declared(int(length) if length and length.isdigit() else None)
+        except ByteBudgetExceeded as e:
+            print(f"⚠️ PDF ignoré ({resp.url}): {e}")
+            return None
+    return resp.body()
+
+def _save_download_to_dir(dl, download_dir: Path, saved: List[str], budget: Optional[ByteBudget] = None) -> bool:
+    # Playwright écrit lui-même le téléchargement sur disque : seule la taille finale est contrôlée
+    store = get_pdf_store()
+    tmp = store.new_temp_path()
+    try:
+        dl.save_as(str(tmp))
+        size = tmp.stat().st_size
+        tracing.add("bytes", size)
+        if budget is not None:
+            try:
+                budget.charge(size)
+            except ByteBudgetExceeded as e:
+                print(f"⚠️ PDF ignoré ({dl.suggested_filename}): {e}")
+                return False
+        sha256, _, _ = store.put_file(tmp, dl.suggested_filename)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return _link_pdf_into_dir(sha256, dl.suggested_filename, download_dir, saved, force_pdf_ext=False)
+
+def _pdf_name_from_url(url: str) -> str:
+    return url.split("/")[-1] or "document.pdf"
+
+def _fetch_discovered_pdfs(page, context, anchors, download_dir: Path, saved: List[str], limit: Optional[int] = None,
+                           budget: Optional[ByteBudget] = None) -> None:
+    # Liens collectés en une passe dans la page, puis sondés et téléchargés en
+    # parallèle hors navigateur ; ceux que le site refuse hors navigateur sont
+    # rejoués un par un via context.request.
+    hrefs = anchors.evaluate_all("els => els.map(e => e.href).filter(Boolean)")
+    if limit is not None:
+        hrefs = hrefs[:limit]
+    _fetch_pdf_hrefs(page, context, hrefs, download_dir, saved, budget)
+
+def _fetch_pdf_hrefs(page, context, hrefs: List[str], download_dir: Path, saved: List[str],
+                     budget: Optional[ByteBudget] = None) -> None:
+    if not hrefs:
+        return
+    try:
+        user_agent = page.evaluate("() => navigator.userAgent")
+    except Exception:
+        user_agent = None
+    cookies = cookie_jar_from_context(context.cookies())
+    for info in fetch_pdf_links(hrefs, cookies=cookies, user_agent=user_agent, referer=page.url, budget=budget):
+        if info.get("sha256"):
+            _link_pdf_into_dir(info["sha256"], _pdf_name_from_url(info["url"]), download_dir, saved)
+        elif info["kind"] in (LINK_BLOCKED, LINK_ERROR):
+            try:
+                resp = context.request.get(info["url"], verify=False)
+            except Exception:
+                continue
+            if resp.ok and ("application/pdf" in (resp.headers.get("content-type","").lower()) or info["url"].lower().endswith(".pdf")):
+                body = _read_response_body(resp, budget)
+                if body is not None:
+                    _process_and_save_pdf_content(body, _pdf_name_from_url(info["url"]), download_dir, saved, budget)
 
 def click_cookie_consent(page):
-    clicked = False
-    for sel in ("#onetrust-accept-btn-handler",
-                ".ot-sdk-container #onetrust-accept-btn-handler",
-                "#accept-recommended-btn-handler",
-                ".save-preference-btn-handler",
-                "#axeptio_btn_acceptAll", "button#axeptio_btn_acceptAll"):
-        try:
-            loc = page.locator(sel)
-            if loc.is_visible(timeout=800):
-                loc.click()
-                clicked = True
-                break
-        except Exception:
-            pass
-    if not clicked:
-        for pat in COOKIE_ACCEPT_LABELS:
-            for getter in (
-                lambda: page.get_by_role("button", name=re.compile(pat, re.I)),
-                lambda: page.get_by_role("link",   name=re.compile(pat, re.I)),
-                lambda: page.get_by_text(re.compile(pat, re.I)),
-            ):
-                try:
-                    el = getter()
-                    if el and el.count() > 0:
-                        el.first.click(timeout=1200)
-                        clicked = True
-                        break
-                except Exception:
-                    pass
-            if clicked:
-                break
-    _wait_onetrust_gone(page)
-    return clicked
-
-def _save_pdf_response_to_dir(resp, download_dir, saved):
+    # Une seule évaluation dans la page ; l'état du site est enregistré pour
+    # que les contextes suivants n'aient plus de bandeau
+    clicked = dismiss_consent(page, COOKIE_ACCEPT_LABELS)
+    if clicked:
+        tracing.set_attribute("consent_clicked", clicked)
+        get_consent_store().save(page.context, page.url)
+    return bool(clicked)
+
+def _save_pdf_response_to_dir(resp, download_dir, saved, budget: Optional[ByteBudget] = None):
     ctype = (resp.headers.get("content-type") or "").lower()
     if "application/pdf" in ctype:
-        body = resp.body()
-        name = resp.url.split("/")[-1] or "document.pdf"
-        if not name.lower().endswith(".pdf"):
-            name += ".pdf"
-        
-        path = _get_unique_filepath(Path(download_dir), name)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_bytes(body)
-        saved.append(str(path))
-        return True
+        body = _read_response_body(resp, budget)
+        if body is None:
+            return False
+        return _process_and_save_pdf_content(body, _pdf_name_from_url(resp.url), Path(download_dir), saved, budget)
     return False
 
-def try_click_and_download(page, context, download_dir, labels):
+def _click_for_pdf(page, context, target, download_dir: Path, saved: List[str], budget: Optional[ByteBudget], deadline: float) -> None:
+    # Même cascade qu'avant (téléchargement, réponse PDF, navigation vers un .pdf),
+    # chaque attente étant bornée par le temps restant du budget
+    def remaining_ms(cap: int) -> int:
+        return max(0, min(cap, int((deadline - time.monotonic()) * 1000)))
+
+    try:
+        target.scroll_into_view_if_needed(timeout=remaining_ms(1500) or 1)
+    except Exception:
+        pass
+    try:
+        with page.expect_download(timeout=remaining_ms(8000) or 1) as dl_info:
+            target.click(timeout=remaining_ms(5000) or 1)
+        _save_download_to_dir(dl_info.value, download_dir, saved, budget)
+        return
+    except PWTimeout:
+        pass
+    if not remaining_ms(6000):
+        return
+    try:
+        with page.expect_response(
+            lambda r: "application/pdf" in (r.headers.get("content-type","").lower()),
+            timeout=remaining_ms(6000)
+        ) as resp_info:
+            target.click(timeout=remaining_ms(5000) or 1)
+        if _save_pdf_response_to_dir(resp_info.value, download_dir, saved, budget):
+            return
+    except PWTimeout:
+        pass
+    if not remaining_ms(4000):
+        return
+    try:
+        target.click(timeout=remaining_ms(5000) or 1)
+        page.wait_for_url(re.compile(r"\.pdf($|\?)"), timeout=remaining_ms(4000) or 1)
+        resp = context.request.get(page.url, verify=False)
+        if resp.ok:
+            body = _read_response_body(resp, budget)
+            if body is not None:
+                _process_and_save_pdf_content(body, _pdf_name_from_url(page.url), download_dir, saved, budget)
+    except PWTimeout:
+        pass
+
+def try_click_and_download(page, context, download_dir, labels, budget: Optional[ByteBudget] = None,
+                           max_candidates: int = CLICK_MAX_CANDIDATES, time_budget: float = CLICK_BUDGET):
+    # Une évaluation relève les éléments cliquables, classés ensuite par
+    # rapport aux libellés ; les liens PDF directs sont téléchargés sans clic,
+    # les autres candidats sont cliqués tant que le budget de temps le permet
     download_dir = Path(download_dir); download_dir.mkdir(parents=True, exist_ok=True)
     saved = []
-    for pat in labels:
-        for getter in (
-            lambda: page.get_by_role("link",   name=re.compile(pat, re.I)),
-            lambda: page.get_by_role("button", name=re.compile(pat, re.I)),
-            lambda: page.get_by_text(re.compile(pat, re.I)),
-        ):
-            try:
-                locator = getter()
-                if not locator or locator.count() == 0:
-                    continue
-            except Exception:
-                continue
-            try:
-                target = locator.first.locator("xpath=ancestor-or-self::a | ancestor-or-self::button").first
-                if not target or target.count() == 0:
-                    target = locator.first
-            except Exception:
-                target = locator.first
-            try:
-                target.scroll_into_view_if_needed(timeout=1500)
-            except Exception:
-                pass
-            try:
-                with page.expect_download(timeout=8000) as dl_info:
-                    target.click()
-                dl = dl_info.value
-                dest = _get_unique_filepath(Path(download_dir), dl.suggested_filename)
-                dl.save_as(str(dest))
-                saved.append(str(dest))
-                continue
-            except PWTimeout:
-                try:
-                    with page.expect_response(
-                        lambda r: "application/pdf" in (r.headers.get("content-type","").lower()),
-                        timeout=6000
-                    ) as resp_info:
-                        target.click()
-                    if _save_pdf_response_to_dir(resp_info.value, download_dir, saved):
-                        continue
-                except PWTimeout:
-                    try:
-                        target.click()
-                        page.wait_for_url(re.compile(r"\.pdf($|\?)"), timeout=4000)
-                        resp = context.request.get(page.url, verify=False) # Add verify=False here as well if needed
-                        if resp.ok:
-                            name = page.url.split("/")[-1] or "document.pdf"
-                            if not name.lower().endswith(".pdf"):
-                                name += ".pdf"
-                            path = _get_unique_filepath(Path(download_dir), name)
-                            path.write_bytes(resp.body())
-                            saved.append(str(path))
-                    except PWTimeout:
-                        pass
-            except Exception:
-                pass
+    deadline = time.monotonic() + time_budget
+    try:
+        scanned = scan_candidates(page)
+    except Exception:
+        return saved
+    ranked = rank_candidates(scanned, labels, max_candidates)
+    direct = [c["href"] for c in ranked if is_pdf_href(c["href"])]
+    to_click = [c for c in ranked if not is_pdf_href(c["href"])]
+    tracing.set_attribute("click_candidates", {"scanned": len(scanned), "direct": len(direct), "clicked": len(to_click)})
+    try:
+        _fetch_pdf_hrefs(page, context, direct, download_dir, saved, budget)
+    except Exception:
+        pass
+    for candidate in to_click:
+        if time.monotonic() >= deadline:
+            print(f"⚠️ Budget de clics épuisé ({time_budget:.0f}s)")
+            break
+        try:
+            _click_for_pdf(page, context, candidate_locator(page, candidate), download_dir, saved, budget, deadline)
+        except Exception:
+            pass
     return saved
 
-def try_click_and_download_secom(page, context, download_dir):
+def try_click_and_download_secom(page, context, download_dir, budget: Optional[ByteBudget] = None):
     saved = []; download_dir = Path(download_dir); download_dir.mkdir(parents=True, exist_ok=True)
     try: click_cookie_consent(page)
     except Exception: pass
     try:
-        anchors = page.locator('a[href*="download-pdf"]')
-        for i in range(anchors.count()):
-            href = anchors.nth(i).get_attribute("href")
-            if not href: continue
-            abs_url = urljoin(page.url, href)
-            resp = context.request.get(abs_url, verify=False)
-            if resp.ok and ("application/pdf" in (resp.headers.get("content-type","").lower()) or abs_url.lower().endswith(".pdf")):
-                name = abs_url.split("/")[-1] or "document.pdf"
-                if not name.lower().endswith(".pdf"): name += ".pdf"
-                unique_path = _get_unique_filepath(download_dir, name)
-                unique_path.write_bytes(resp.body())
-                saved.append(str(unique_path))
+        _fetch_discovered_pdfs(page, context, page.locator('a[href*="download-pdf"]'), download_dir, saved, budget=budget)
     except Exception:
         pass
     if not saved:
@@ -531,18 +608,15 @@ def try_click_and_download_secom(page, context, download_dir):
                 try:
                     with page.expect_download(timeout=8000) as dl_info:
                         all_btn.first.click()
-                    dl = dl_info.value
-                    dest = _get_unique_filepath(download_dir, dl.suggested_filename)
-                    dl.save_as(str(dest))
-                    saved.append(str(dest))
+                    _save_download_to_dir(dl_info.value, download_dir, saved, budget)
                 except PWTimeout:
                     with page.expect_response(lambda r: "application/pdf" in (r.headers.get("content-type","").lower()), timeout=6000) as ri:
                         all_btn.first.click()
-                    _save_pdf_response_to_dir(ri.value, download_dir, saved)
+                    _save_pdf_response_to_dir(ri.value, download_dir, saved, budget)
         except Exception:
             pass
     if not saved:
-        saved.extend(try_click_and_download(page, context, download_dir, SE_COM_LABELS))
+        saved.extend(try_click_and_download(page, context, download_dir, SE_COM.pdf_labels, budget))
     if not saved:
         try:
             see_all = page.get_by_role("link", name=re.compile(r"\bvoir\s*tous?\s*les\s*documents\b", re.I))
@@ -551,26 +625,16 @@ def try_click_and_download_secom(page, context, download_dir):
         except Exception:
             pass
         if not saved:
-            saved.extend(try_click_and_download(page, context, download_dir, SE_COM_LABELS))
+            saved.extend(try_click_and_download(page, context, download_dir, SE_COM.pdf_labels, budget))
     return saved
 
-def try_click_and_download_cedeo(page, context, download_dir):
+def try_click_and_download_cedeo(page, context, download_dir, budget: Optional[ByteBudget] = None):
     saved = []; download_dir = Path(download_dir); download_dir.mkdir(parents=True, exist_ok=True)
     try: click_cookie_consent(page)
     except Exception: pass
     try:
         links = page.locator('a', has_text=re.compile(r"\bsans\s*prix\b", re.I))
-        for i in range(links.count()):
-            href = links.nth(i).get_attribute("href")
-            if not href: continue
-            abs_url = urljoin(page.url, href)
-            resp = context.request.get(abs_url, verify=False)
-            if resp.ok and ("application/pdf" in (resp.headers.get("content-type","").lower()) or abs_url.lower().endswith(".pdf")):
-                name = abs_url.split("/")[-1] or "document.pdf"
-                if not name.lower().endswith(".pdf"): name += ".pdf"
-                unique_path = _get_unique_filepath(download_dir, name)
-                unique_path.write_bytes(resp.body())
-                saved.append(str(unique_path))
+        _fetch_discovered_pdfs(page, context, links, download_dir, saved, budget=budget)
     except Exception:
         pass
     if not saved:
@@ -582,40 +646,26 @@ def try_click_and_download_cedeo(page, context, download_dir):
                 try:
                     with page.expect_download(timeout=6000) as dl_info:
                         target.first.click()
-                    dl = dl_info.value
-                    dest = _get_unique_filepath(download_dir, dl.suggested_filename)
-                    dl.save_as(str(dest))
-                    saved.append(str(dest))
+                    _save_download_to_dir(dl_info.value, download_dir, saved, budget)
                 except PWTimeout:
                     try:
                         with page.expect_response(lambda r: "application/pdf" in (r.headers.get("content-type","").lower()), timeout=6000) as ri:
                             target.first.click()
-                        _save_pdf_response_to_dir(ri.value, download_dir, saved)
+                        _save_pdf_response_to_dir(ri.value, download_dir, saved, budget)
                     except Exception:
                         pass
         except Exception:
             pass
     if not saved:
-        saved.extend(try_click_and_download(page, context, download_dir, CEDEO_LABELS))
+        saved.extend(try_click_and_download(page, context, download_dir, CEDEO.pdf_labels, budget))
     return saved
 
-def try_click_and_download_pointp(page, context, download_dir):
+def try_click_and_download_pointp(page, context, download_dir, budget: Optional[ByteBudget] = None):
     saved = []; download_dir = Path(download_dir); download_dir.mkdir(parents=True, exist_ok=True)
     try: click_cookie_consent(page)
     except Exception: pass
     try:
-        anchors = page.locator('a[href$=".pdf"], a[href*=".pdf?"]')
-        for i in range(min(25, anchors.count())):
-            href = anchors.nth(i).get_attribute("href")
-            if not href: continue
-            abs_url = urljoin(page.url, href)
-            resp = context.request.get(abs_url, verify=False)
-            if resp.ok:
-                if "application/pdf" in (resp.headers.get("content-type","").lower()) or abs_url.lower().endswith(".pdf"):
-                    name = abs_url.split("/")[-1] or "document.pdf"
-                    unique_path = _get_unique_filepath(download_dir, name)
-                    unique_path.write_bytes(resp.body())
-                    saved.append(str(unique_path))
+        _fetch_discovered_pdfs(page, context, page.locator('a[href$=".pdf"], a[href*=".pdf?"]'), download_dir, saved, limit=25, budget=budget)
     except Exception:
         pass
     if not saved:
@@ -627,54 +677,112 @@ def try_click_and_download_pointp(page, context, download_dir):
                 try:
                     with page.expect_download(timeout=7000) as dl_info:
                         link.first.click()
-                    dl = dl_info.value
-                    dest = _get_unique_filepath(download_dir, dl.suggested_filename)
-                    dl.save_as(str(dest))
-                    saved.append(str(dest))
+                    _save_download_to_dir(dl_info.value, download_dir, saved, budget)
                 except PWTimeout:
                     try:
                         with page.expect_response(lambda r: "application/pdf" in (r.headers.get("content-type","").lower()), timeout=6000) as ri:
                             link.first.click()
-                        _save_pdf_response_to_dir(ri.value, download_dir, saved)
+                        _save_pdf_response_to_dir(ri.value, download_dir, saved, budget)
                     except Exception:
                         pass
         except Exception:
             pass
     if not saved:
-        saved.extend(try_click_and_download(page, context, download_dir, CANDIDATE_LABELS))
+        saved.extend(try_click_and_download(page, context, download_dir, POINTP.pdf_labels, budget))
     return saved
 
-def download_product_pdfs_sync(url: str, download_dir: str = "downloads", headless: bool = True):
+# Stratégies de téléchargement référencées par DomainAdapter.pdf_strategy
+PDF_STRATEGIES = {
+    "pointp": try_click_and_download_pointp,
+    "cedeo": try_click_and_download_cedeo,
+    "secom": try_click_and_download_secom,
+}
+
+# Sert le document principal depuis l'instantané au lieu de le retélécharger ;
+# les sous-ressources (scripts, XHR des boutons de téléchargement) restent chargées normalement.
+PLAYWRIGHT_REUSE_SNAPSHOT = os.getenv("TECHSHEET_PLAYWRIGHT_REUSE_SNAPSHOT", "1").lower() not in ("0", "false", "no")
+_SNAPSHOT_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+def _route_document_from_snapshot(page, snapshot: PageSnapshot) -> bool:
+    if not (PLAYWRIGHT_REUSE_SNAPSHOT and snapshot.ok and snapshot.is_html and snapshot.content):
+        return False
+    target = snapshot.final_url
+    headers = {k: v for k, v in snapshot.headers.items() if k.lower() not in _SNAPSHOT_DROP_HEADERS}
+    served = []
+
+    def _fulfill(route):
+        if served or route.request.resource_type != "document":
+            route.continue_()
+            return
+        served.append(True)
+        route.fulfill(status=snapshot.status_code, headers=headers, body=snapshot.content)
+
+    page.route(lambda u: u == target, _fulfill)
+    return True
+
+def _download_product_pdfs_on_page(page, context, url: str, download_dir: str, snapshot: Optional[PageSnapshot] = None,
+                                   budget: Optional[ByteBudget] = None, block_stats: Optional[BlockStats] = None):
+    if snapshot is not None and _route_document_from_snapshot(page, snapshot):
+        snapshot.record("pdf", SNAPSHOT_REUSED)
+        url = snapshot.final_url
+    elif snapshot is not None:
+        snapshot.record("pdf", SNAPSHOT_REFETCHED)
+    adapter = adapter_for_url(url)
+    # Aucune attente Playwright ne dépasse l'échéance de la requête
+    page.set_default_timeout(remaining_timeout_ms(15000))
+    tracing.set_attribute("consent_state_reused", get_consent_store().apply(context, url))
+    # Enregistrée après la route de l'instantané : elle passe la première et lui laisse le document
+    block_stats = install_resource_policy(page, adapter.resource_policy if adapter else None, block_stats)
+    start = time.perf_counter()
+    page.goto(url, wait_until="domcontentloaded", timeout=remaining_timeout_ms(10000))
+    block_stats.goto_ms = round((time.perf_counter() - start) * 1000, 1)
+    try: click_cookie_consent(page)
+    except Exception: pass
+    saved = []
+    strategy = PDF_STRATEGIES.get(adapter.pdf_strategy) if adapter else None
+    if strategy:
+        try: saved.extend(strategy(page, context, download_dir, budget))
+        except Exception: pass
+        if saved:
+            tracing.set_tier(adapter.pdf_strategy)
+    if not saved:
+        labels = adapter.pdf_labels if adapter else CANDIDATE_LABELS
+        saved.extend(try_click_and_download(page, context, download_dir, labels, budget, time_budget=remaining_timeout(CLICK_BUDGET)))
+        if saved:
+            tracing.set_tier("click")
+    # Deduplicate paths while preserving order
+    return list(dict.fromkeys(saved))
+
+def download_product_pdfs_sync(url: str, download_dir: str = "downloads", headless: bool = True, budget: Optional[ByteBudget] = None,
+                               block_stats: Optional[BlockStats] = None):
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=headless, args=["--disable-dev-shm-usage"])
-        context = browser.new_context(accept_downloads=True)
-        page = context.new_page()
-        page.set_default_timeout(15000)
-        page.goto(url, wait_until="domcontentloaded", timeout=10000)
-        try: click_cookie_consent(page)
-        except Exception: pass
-        saved = []
-        if re.search(r"\bse\.com\b", url):
-            try: saved.extend(try_click_and_download_secom(page, context, download_dir))
-            except Exception: pass
-        elif re.search(r"\bcedeo\.fr\b", url):
-            try: saved.extend(try_click_and_download_cedeo(page, context, download_dir))
-            except Exception: pass
-        elif re.search(r"\bpointp\.fr\b", url):
-            try: saved.extend(try_click_and_download_pointp(page, context, download_dir))
-            except Exception: pass
-        if not saved:
-            saved.extend(try_click_and_download(page, context, download_dir, CANDIDATE_LABELS))
-        browser.close()
-        # Deduplicate paths while preserving order
-        return list(dict.fromkeys(saved))
+        try:
+            context = browser.new_context(accept_downloads=True)
+            page = context.new_page()
+            page.set_default_timeout(15000)
+            return _download_product_pdfs_on_page(page, context, url, download_dir, budget=budget, block_stats=block_stats)
+        finally:
+            browser.close()
+
+def download_product_pdfs_pooled(url: str, download_dir: str = "downloads", snapshot: Optional[PageSnapshot] = None,
+                                 budget: Optional[ByteBudget] = None, block_stats: Optional[BlockStats] = None):
+    # Même traitement que download_product_pdfs_sync, sur un navigateur déjà lancé ;
+    # l'attente du pool est bornée par l'échéance (la tâche s'y plie aussi côté navigateur)
+    try:
+        return get_browser_pool().run(_download_product_pdfs_on_page, url, download_dir, snapshot=snapshot, budget=budget,
+                                      block_stats=block_stats, timeout=remaining_timeout())
+    except FutureTimeout:
+        raise DeadlineExceeded("Téléchargement des PDF interrompu à l'échéance")
 
 def run_in_thread(func, *args, **kwargs):
     out, err = {}, {}
     def _runner():
+        # BaseException : une DeadlineExceeded levée dans le thread doit remonter à l'appelant
         try: out["result"] = func(*args, **kwargs)
-        except Exception as e: err["error"] = e
-    t = Thread(target=_runner, daemon=True); t.start(); t.join()
+        except BaseException as e: err["error"] = e
+    t = Thread(target=tracing.bind(_runner), daemon=True); t.start(); t.join(remaining_timeout())
+    if t.is_alive(): raise DeadlineExceeded(f"{getattr(func, '__name__', func)} toujours en cours à l'échéance")
     if "error" in err: raise err["error"]
     return out.get("result")
 
@@ -700,7 +808,12 @@ Voici le HTML brut :
 Merci de retourner uniquement le JSON dans un bloc ```json sans aucune explication autour.
 """)
 
+LLM_TIMEOUT = float(os.getenv("TECHSHEET_LLM_TIMEOUT", "60"))
+
 def make_llm():
+    # Sous échéance : un seul essai, borné par le temps restant (les retries
+    # du client OpenAI repartiraient chacun pour un délai complet)
+    deadline = current_deadline()
     return AzureChatOpenAI(
         openai_api_version="2023-05-15",
         azure_endpoint=os.getenv("AZURE_OPENAI_LLM_ENDPOINT"),
@@ -708,22 +821,56 @@ def make_llm():
         model=os.getenv("AZURE_OPENAI_LLM_MODEL"),
         api_key=os.getenv("AZURE_OPENAI_LLM_API_KEY"),
         validate_base_url=False,
+        timeout=remaining_timeout(LLM_TIMEOUT) if deadline is not None else None,
+        max_retries=0 if deadline is not None else 2,
     )
 
 # ------------------------------------------------------------
-# Streamlit-compatible processing function
+# Cache des extractions LLM (techsheet/cache/llm_cache.sqlite)
+# ------------------------------------------------------------
+# La version du prompt fait partie de la clé : modifier PROMPT invalide
+# automatiquement toutes les entrées précédentes (purgées à l'ouverture).
+PROMPT_VERSION = hashlib.sha256(PROMPT.template.encode("utf-8")).hexdigest()[:16]
+LLM_CACHE_TTL = float(os.getenv("TECHSHEET_LLM_CACHE_TTL", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("TECHSHEET_LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_BYPASS = os.getenv("TECHSHEET_LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+_llm_cache: Optional[SqliteTTLCache] = None
+_llm_cache_lock = Lock()
+
+def get_llm_cache() -> SqliteTTLCache:
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = SqliteTTLCache(CACHE_DIR / "llm_cache.sqlite", ttl_seconds=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+            stale = _llm_cache.retain_prefix(f"{PROMPT_VERSION}:")
+            if stale:
+                print(f"♻️ Cache LLM: {stale} entrées invalidées (PROMPT modifié)")
+        return _llm_cache
+
+def llm_cache_key(page_text: str) -> str:
+    normalized = "\n".join(" ".join(line.split()) for line in page_text.splitlines() if line.strip())
+    deployment = f"{os.getenv('AZURE_OPENAI_LLM_DEPLOYMENT') or ''}|{os.getenv('AZURE_OPENAI_LLM_MODEL') or ''}"
+    digest = hashlib.sha256(f"{deployment}\n{normalized}".encode("utf-8")).hexdigest()
+    return f"{PROMPT_VERSION}:{digest}"
+
 # ------------------------------------------------------------
-def process_techsheet_request(titre_produit: str, marque: str, reference: str, template_path: str, selected_domains: List[str]) -> Dict[str, Any]:
-    start_time = time.time()
-    req_id = str(uuid.uuid4())
-    
+# Étapes du pipeline (partagées par le mode unitaire et le mode batch)
+# ------------------------------------------------------------
+DEFAULT_DOMAINS = [adapter.host for adapter in registered_adapters()]
+
+def new_request_state(titre_produit: str, marque: str, reference: str, template_path: str, selected_domains: Optional[List[str]],
+                      request_id: Optional[str] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    # request_id est fourni par la file de travaux (techsheet_jobs) ; sinon un nouvel identifiant
+    req_id = request_id or str(uuid.uuid4())
+    tracing.ensure_metrics_server()
+
     # Use the template_path passed from the frontend (which is already absolute)
     # and derive base_dir from it, assuming 'techsheet' is parent of 'data'
     base_dir = Path(template_path).parent / "data" / req_id
-    
+
     images_dir = base_dir/"fiches_images"
     pdfs_dir = base_dir/"fiches_pdfs"
-    out_docx = base_dir/"Fiche_Technique_Filled.docx"
 
     images_dir.mkdir(parents=True, exist_ok=True)
     pdfs_dir.mkdir(parents=True, exist_ok=True)
@@ -738,118 +885,404 @@ def process_techsheet_request(titre_produit: str, marque: str, reference: str, t
         "downloaded_pdfs": [],
         "image_path": None,
         "execution_time": 0,
+        "stage_timings": {},
+        "stage_outcomes": {},
+        "spans": [],
         "request_id": req_id
     }
 
-    try:
-        if not titre_produit:
-            raise ValueError("Le titre/nom du produit est obligatoire.")
-
-        search = " ".join(filter(None, [titre_produit, marque, reference]))
+    return {
+        "titre_produit": titre_produit,
+        "marque": marque,
+        "reference": reference,
+        "template_path": template_path,
         # Use selected_domains if provided, otherwise default to all domains
-        domains_to_search = selected_domains if selected_domains else [
-            "pointp.fr", "cedeo.fr", "se.com"
-        ]
-
-        print("\n[1/6] Recherche de l'URL produit...")
-        results, tried = ddg_product_urls(search, domains_to_search, max_results=10)
-        best_url = pick_best_result(results, search.split()) if results and any(is_product_url(url, domains_to_search) for _, url in results) else None
-        output_data["tried_endpoints"] = tried
-
-        if not best_url:
-            output_data["message"] = "Aucune URL produit trouvée."
-            return output_data
-        output_data["best_url"] = best_url
-        output_data["url_source"] = urllib.parse.urlparse(best_url).netloc
-        print(f"  → URL détectée : {best_url}")
-
-        print("\n[2/6] Scraping de la page HTML...")
-        response = requests.get(best_url, verify=False, timeout=20)
-        html_content = response.text
-        soup = BeautifulSoup(html_content, 'html.parser')
-        text_only = soup.get_text(separator="\n", strip=True)
-
-        print("\n[3/6] Extraction LLM (Azure OpenAI via LangChain)...")
+        "domains": list(selected_domains) if selected_domains else list(DEFAULT_DOMAINS),
+        "images_dir": images_dir,
+        "pdfs_dir": pdfs_dir,
+        "out_docx": base_dir/"Fiche_Technique_Filled.docx",
+        "image1_path": images_dir/"image1.jpg",
+        "best_url": None,
+        "text_only": None,
+        "snapshot": None,
+        "catalog_entry": None,
+        # Échéance globale (None = sans limite, cas des lots de techsheet_batch)
+        "deadline": deadline,
+        "start_time": time.time(),
+        "output": output_data,
+    }
+
+# Chaque étape renvoie True pour continuer, False si la requête s'arrête
+# (le message d'erreur est alors déjà renseigné dans state["output"]).
+def stage_search(state: Dict[str, Any]) -> bool:
+    output_data = state["output"]
+    if not state["titre_produit"]:
+        raise ValueError("Le titre/nom du produit est obligatoire.")
+
+    search = " ".join(filter(None, [state["titre_produit"], state["marque"], state["reference"]]))
+    domains_to_search = state["domains"]
+
+    print("\n[1/6] Recherche de l'URL produit...")
+    # Moteurs internes des sites d'abord (référence requise), DuckDuckGo si tous ratent
+    results, tried = retailer_product_urls(state["reference"], domains_to_search, max_results=10) if state["reference"] else ([], [])
+    output_data["search_source"] = "retailer"
+    if not results:
+        results, ddg_tried = ddg_product_urls(search, domains_to_search, max_results=10)
+        tried = tried + ddg_tried
+        output_data["search_source"] = "ddg"
+    best_url = pick_best_result(results, search.split()) if results and any(is_product_url(url, domains_to_search) for _, url in results) else None
+    output_data["tried_endpoints"] = tried
+
+    if not best_url:
+        output_data["message"] = "Aucune URL produit trouvée."
+        return False
+    state["best_url"] = best_url
+    output_data["best_url"] = best_url
+    output_data["url_source"] = urllib.parse.urlparse(best_url).netloc
+    print(f"  → URL détectée : {best_url}")
+    return True
+
+def stage_scrape(state: Dict[str, Any]) -> bool:
+    print("\n[2/6] Scraping de la page HTML...")
+    # La page est téléchargée une seule fois ; image et PDF consomment le même instantané
+    snapshot = PageSnapshot.fetch(state["best_url"], session=get_http_session(), headers=SIMPLE_HEADERS, timeout=20)
+    snapshot.record("scrape", SNAPSHOT_FETCHED)
+    tracing.set_tier("http")
+    state["snapshot"] = snapshot
+    state["output"]["page_snapshot"] = snapshot.summary()
+    state["text_only"] = snapshot.soup.get_text(separator="\n", strip=True)
+    return True
+
+# Budget de tokens envoyé au LLM (0 = pas de réduction, texte brut complet)
+LLM_TOKEN_BUDGET = int(os.getenv("TECHSHEET_LLM_TOKEN_BUDGET", "6000"))
+
+def stage_reduce(state: Dict[str, Any]) -> bool:
+    output_data = state["output"]
+    print("\n[2b/6] Réduction du texte avant l'appel LLM...")
+    full_text = state["text_only"] or ""
+    tokens_before = count_tokens(full_text)
+    reduced, stats = full_text, {}
+    if LLM_TOKEN_BUDGET > 0 and state.get("snapshot") is not None:
+        reduced, stats = reduce_page_text(
+            state["snapshot"].soup, LLM_TOKEN_BUDGET,
+            reference=state["reference"] or "", titre=state["titre_produit"] or "", marque=state["marque"] or "",
+        )
+        if not reduced.strip():
+            # Rien de pertinent détecté : on garde le texte complet plutôt qu'un prompt vide
+            reduced, stats["fallback"] = full_text, True
+            stats["tokens"] = tokens_before
+    # Compté par reduce_page_text avec le même compteur qui a fait respecter le budget
+    tokens_after = stats.pop("tokens", tokens_before)
+    counter = token_counter()
+    state["text_only"] = reduced
+    output_data["llm_tokens"] = dict(stats, before=tokens_before, after=tokens_after, token_counter=counter)
+    print(f"  → Texte LLM : {tokens_before} → {tokens_after} tokens (budget {LLM_TOKEN_BUDGET}, compteur {counter})")
+    return True
+
+def stage_llm(state: Dict[str, Any]) -> bool:
+    output_data = state["output"]
+    print("\n[3/6] Extraction LLM (Azure OpenAI via LangChain)...")
+    cache_key = llm_cache_key(state["text_only"]) if not LLM_CACHE_BYPASS else None
+    data = None
+    if cache_key:
+        try:
+            data = get_llm_cache().get(cache_key)
+        except Exception as e:
+            print(f"⚠️ Cache LLM indisponible: {e}")
+            cache_key = None
+    output_data["llm_cache"] = "hit" if data is not None else ("miss" if cache_key else "bypass")
+
+    if data is None:
+        tracing.set_tier("llm")
         llm = make_llm()
         chain = LLMChain(llm=llm, prompt=PROMPT)
-        llm_response = chain.run(html=text_only)
+        result = chain.generate([{"html": state["text_only"]}])
+        llm_response = result.generations[0][0].text
         print("llm_response:", llm_response)
+        # Comptage renvoyé par l'API si disponible, sinon estimé avec le tokenizer local
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        tracing.add("prompt_tokens", usage.get("prompt_tokens") or count_tokens(PROMPT.format(html=state["text_only"])))
+        tracing.add("completion_tokens", usage.get("completion_tokens") or count_tokens(llm_response))
 
         match = re.search(r"```json\n(.*?)```", llm_response, re.DOTALL)
         if not match:
             output_data["message"] = f"Aucun bloc JSON trouvé dans la réponse LLM. Réponse brute: {llm_response}"
-            return output_data
+            return False
 
         data = json.loads(match.group(1))
+        if cache_key:
+            try:
+                get_llm_cache().set(cache_key, data)
+            except Exception as e:
+                print(f"⚠️ Cache LLM indisponible: {e}")
+    else:
+        tracing.set_tier("cache")
+        print("  → Extraction servie depuis le cache LLM")
+
+    # Ensure UTILISATION is always a list of strings
+    utilisation_data = data.get("UTILISATION")
+    if isinstance(utilisation_data, str):
+        utilisation_data = [utilisation_data]
+    elif utilisation_data is None:
+        utilisation_data = []
+
+    output_data["extracted_data"] = {
+        "TITRE": data.get("TITRE"),
+        "REFERENCE": data.get("RÉFÉRENCE"),
+        "DESCRIPTION": data.get("DESCRIPTION"),
+        "AVANTAGES": data.get("AVANTAGES") or [],
+        "UTILISATION": utilisation_data,
+        "CARACTERISTIQUES TECHNIQUES": data.get("CARACTÉRISTIQUES TECHNIQUES", {}) or {}
+    }
+    return True
 
-        # Ensure UTILISATION is always a list of strings
-        utilisation_data = data.get("UTILISATION")
-        if isinstance(utilisation_data, str):
-            utilisation_data = [utilisation_data]
-        elif utilisation_data is None:
-            utilisation_data = []
-
-        output_data["extracted_data"] = {
-            "TITRE": data.get("TITRE"),
-            "REFERENCE": data.get("RÉFÉRENCE"),
-            "DESCRIPTION": data.get("DESCRIPTION"),
-            "AVANTAGES": data.get("AVANTAGES") or [],
-            "UTILISATION": utilisation_data,
-            "CARACTERISTIQUES TECHNIQUES": data.get("CARACTÉRISTIQUES TECHNIQUES", {}) or {}
-        }
-
-        print("\n[4/6] Récupération image produit...")
-        fetch_and_download(best_url, str(images_dir), limit=1)
-        image1_path = images_dir/"image1.jpg"
-        has_image = image1_path.exists()
-        if has_image:
-            output_data["image_path"] = image1_path.as_posix()
-
-        print("\n[5/6] Génération DOCX (docxtpl) ...")
-        if not Path(template_path).exists():
-            output_data["message"] = f"Modèle DOCX introuvable : {template_path}"
-            return output_data
+def stage_image(state: Dict[str, Any]) -> bool:
+    print("\n[4/6] Récupération image produit...")
+    selection = fetch_and_download(state["best_url"], str(state["images_dir"]), limit=1, snapshot=state.get("snapshot"))
+    if selection is not None:
+        state["output"]["image_selection"] = selection
+    image1_path = state["image1_path"]
+    if image1_path.exists():
+        state["output"]["image_path"] = image1_path.as_posix()
+    return True
 
+def docx_context(extracted_data: Dict[str, Any], image_path: Optional[Path] = None):
+    # Contexte docxtpl d'une fiche ; renvoie une fonction doc -> dict car
+    # InlineImage doit être construit sur le document en cours de rendu
     # Ensure 'CARACTERISTIQUES TECHNIQUES' is a dictionary, even if missing from LLM response
-        caracteristiques_to_process = output_data["extracted_data"].get("CARACTERISTIQUES TECHNIQUES", {})
-        caracteristiques_list = [{"titre": k, "valeur": v} for k, v in caracteristiques_to_process.items()]
-        caracteristiques_grouped = []
-        for i in range(0, len(caracteristiques_list), 2):
-            item1 = caracteristiques_list[i]
-            item2 = caracteristiques_list[i+1] if i+1 < len(caracteristiques_list) else {"titre": "", "valeur": ""}
-            caracteristiques_grouped.append({"item1": item1, "item2": item2})
-
-        doc = DocxTemplate(str(template_path))
-        context = {
-            "TITRE": output_data["extracted_data"]["TITRE"] or "",
-            "REFERENCE": output_data["extracted_data"]["REFERENCE"] or "",
-            "DESCRIPTION": output_data["extracted_data"]["DESCRIPTION"] or "",
-            "AVANTAGES": "\n".join(output_data["extracted_data"]["AVANTAGES"]) if output_data["extracted_data"]["AVANTAGES"] else "",
-            "UTILISATION": output_data["extracted_data"]["UTILISATION"] or "",
-            "IMAGE": InlineImage(doc, str(image1_path), width=Cm(3)) if has_image else None,
+    caracteristiques_to_process = extracted_data.get("CARACTERISTIQUES TECHNIQUES", {})
+    caracteristiques_list = [{"titre": k, "valeur": v} for k, v in caracteristiques_to_process.items()]
+    caracteristiques_grouped = []
+    for i in range(0, len(caracteristiques_list), 2):
+        item1 = caracteristiques_list[i]
+        item2 = caracteristiques_list[i+1] if i+1 < len(caracteristiques_list) else {"titre": "", "valeur": ""}
+        caracteristiques_grouped.append({"item1": item1, "item2": item2})
+    has_image = image_path is not None and Path(image_path).exists()
+
+    def build(doc):
+        return {
+            "TITRE": extracted_data["TITRE"] or "",
+            "REFERENCE": extracted_data["REFERENCE"] or "",
+            "DESCRIPTION": extracted_data["DESCRIPTION"] or "",
+            "AVANTAGES": "\n".join(extracted_data["AVANTAGES"]) if extracted_data["AVANTAGES"] else "",
+            "UTILISATION": extracted_data["UTILISATION"] or "",
+            "IMAGE": InlineImage(doc, str(image_path), width=Cm(3)) if has_image else None,
             "CARACTERISTIQUES": caracteristiques_grouped,
             "DATE": datetime.date.today().strftime("%d/%m/%Y"),
         }
-        doc.render(context)
-        doc.save(str(out_docx))
-        output_data["generated_docx"] = out_docx.as_posix()
+    return build
+
+def stage_docx(state: Dict[str, Any]) -> bool:
+    output_data = state["output"]
+    template_path = state["template_path"]
+    print("\n[5/6] Génération DOCX (docxtpl) ...")
+    if not Path(template_path).exists():
+        output_data["message"] = f"Modèle DOCX introuvable : {template_path}"
+        return False
+
+    out_docx = state["out_docx"]
+    rendered = render_docx(template_path, docx_context(output_data["extracted_data"], state["image1_path"]), persist_to=out_docx)
+    output_data["generated_docx"] = rendered["path"]
+    output_data["docx_render"] = {k: rendered[k] for k in ("bytes", "render_ms", "template_cache")}
+    return True
 
-        print("\n[6/6] Téléchargement des PDF originaux (Playwright) ...")
-        try:
-            pdf_saved = run_in_thread(download_product_pdfs_sync, best_url, download_dir=str(pdfs_dir), headless=True)
-            output_data["downloaded_pdfs"] = [p for p in pdf_saved]
-        except Exception as e:
-            print(f"⚠️ Erreur Playwright: {e}")
-            output_data["message"] += f" Erreur lors du téléchargement des PDFs: {e}"
+def stage_pdf(state: Dict[str, Any]) -> bool:
+    output_data = state["output"]
+    print("\n[6/6] Téléchargement des PDF originaux (Playwright) ...")
+    budget = ByteBudget()
+    block_stats = BlockStats()
+    try:
+        pdf_saved = download_product_pdfs_pooled(state["best_url"], download_dir=str(state["pdfs_dir"]), snapshot=state.get("snapshot"),
+                                                 budget=budget, block_stats=block_stats)
+        output_data["downloaded_pdfs"] = [p for p in pdf_saved]
+    except Exception as e:
+        # Une attente Playwright coupée par l'échéance relève du timeout, pas d'une erreur du site
+        check_deadline()
+        print(f"⚠️ Erreur Playwright: {e}")
+        output_data["message"] += f" Erreur lors du téléchargement des PDFs: {e}"
+    finally:
+        output_data["pdf_bytes"] = budget.report()
+        output_data["pdf_resources"] = block_stats.report()
+        tracing.set_attribute("resources_blocked", output_data["pdf_resources"]["blocked"])
+    return True
+
+# (nom, fonction, dépendances) : une fois la page récupérée (instantané partagé),
+# l'extraction LLM, l'image et les PDF sont indépendants ; seul le DOCX attend le LLM et l'image.
+PIPELINE_STAGES = [
+    ("search", stage_search, ()),
+    ("scrape", stage_scrape, ("search",)),
+    ("reduce", stage_reduce, ("scrape",)),
+    ("llm", stage_llm, ("reduce",)),
+    ("image", stage_image, ("scrape",)),
+    ("pdf", stage_pdf, ("scrape",)),
+    ("docx", stage_docx, ("llm", "image")),
+]
+
+# ------------------------------------------------------------
+# Produits déjà connus du catalogue local (techsheet_catalog)
+# ------------------------------------------------------------
+# URL, champs extraits, image et PDF sont repris de l'entrée : ni recherche,
+# ni scraping, ni LLM. L'image et les PDF ne sont retéléchargés que si
+# leurs fichiers ont disparu (ou si aucun PDF n'avait été trouvé).
+def lookup_catalog(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not CATALOG_ENABLED:
+        return None
+    try:
+        return get_catalog().lookup(state["titre_produit"], state["marque"], state["reference"], state["domains"])
+    except Exception as e:
+        print(f"⚠️ Catalogue indisponible: {e}")
+        return None
 
-        output_data["status"] = "success"
-        output_data["message"] = "Fiche technique générée avec succès."
+def record_in_catalog(state: Dict[str, Any]) -> None:
+    output_data = state["output"]
+    if not CATALOG_ENABLED or state["catalog_entry"] is not None or output_data["status"] != "success":
+        return
+    try:
+        store = get_pdf_store()
+        pdfs = []
+        for path in output_data["downloaded_pdfs"]:
+            sha256 = store.sha256_for_ref(Path(path))
+            if sha256:
+                pdfs.append({"sha256": sha256, "name": Path(path).name})
+        get_catalog().record(state["titre_produit"], state["marque"], state["reference"], output_data["best_url"],
+                             output_data["extracted_data"], image_path=output_data["image_path"], pdfs=pdfs)
+    except Exception as e:
+        print(f"⚠️ Catalogue indisponible: {e}")
+
+def stage_catalog(state: Dict[str, Any]) -> bool:
+    entry = state["catalog_entry"]
+    output_data = state["output"]
+    print(f"\n[1/3] Produit connu du catalogue ({entry['match']}, score {entry['score']}) : {entry['best_url']}")
+    state["best_url"] = entry["best_url"]
+    output_data["best_url"] = entry["best_url"]
+    output_data["url_source"] = urllib.parse.urlparse(entry["best_url"]).netloc
+    output_data["search_source"] = "catalog"
+    output_data["extracted_data"] = entry["extracted_data"]
+    output_data["catalog"] = {k: entry[k] for k in ("id", "match", "score", "updated_at")}
+    tracing.set_tier(entry["match"])
+    return True
+
+def stage_catalog_image(state: Dict[str, Any]) -> bool:
+    source = state["catalog_entry"]["image_path"]
+    if not source or not Path(source).exists():
+        return stage_image(state)
+    print("\n[2/3] Image reprise du catalogue")
+    shutil.copyfile(source, state["image1_path"])
+    state["output"]["image_path"] = state["image1_path"].as_posix()
+    tracing.set_tier("catalog")
+    return True
+
+def stage_catalog_pdf(state: Dict[str, Any]) -> bool:
+    pdfs = state["catalog_entry"]["pdfs"]
+    store = get_pdf_store()
+    if not pdfs or not all(store.has_blob(p["sha256"]) for p in pdfs):
+        return stage_pdf(state)
+    print("\n[3/3] PDF repris du catalogue")
+    saved = []
+    for p in pdfs:
+        _link_pdf_into_dir(p["sha256"], p["name"], state["pdfs_dir"], saved, force_pdf_ext=False)
+    state["output"]["downloaded_pdfs"] = list(dict.fromkeys(saved))
+    tracing.set_tier("catalog")
+    return True
+
+CATALOG_STAGES = [
+    ("catalog", stage_catalog, ()),
+    ("image", stage_catalog_image, ("catalog",)),
+    ("pdf", stage_catalog_pdf, ("catalog",)),
+    ("docx", stage_docx, ("catalog", "image")),
+]
+
+def run_stage(state: Dict[str, Any], name: str, stage) -> bool:
+    output_data = state["output"]
+    span = None
+    try:
+        with deadline_scope(state["deadline"]), tracing.start_span(name, output_data["request_id"]) as span:
+            check_deadline()
+            try:
+                ok = stage(state)
+            except Exception as e:
+                # Un échec survenu après l'échéance lui est imputé (timeout réseau raccourci...)
+                if state["deadline"] is not None and state["deadline"].expired:
+                    raise DeadlineExceeded(f"Étape '{name}' interrompue par l'échéance") from e
+                raise
+            if not ok:
+                check_deadline()
+                span.status = tracing.SPAN_STOPPED
+            return ok
+    finally:
+        if span is not None:
+            output_data["stage_timings"][name] = span.duration
+            output_data["spans"].append(span.to_dict())
+
+def run_guarded_stage(state: Dict[str, Any], name: str, stage) -> bool:
+    # Une exception est consignée dans le message de la requête puis propagée
+    # pour que l'exécuteur marque l'étape en erreur
+    try:
+        return run_stage(state, name, stage)
+    except Exception as e:
+        mark_request_error(state, e)
+        raise
+
+def mark_request_success(state: Dict[str, Any]) -> None:
+    state["output"]["status"] = "success"
+    state["output"]["message"] = "Fiche technique générée avec succès."
+
+def mark_request_error(state: Dict[str, Any], e: Exception) -> None:
+    state["output"]["message"] = f"Une erreur inattendue est survenue: {e}"
+    import traceback
+    print(traceback.format_exc())
+
+def mark_request_partial(state: Dict[str, Any], outcomes: Dict[str, str]) -> None:
+    # Échéance dépassée : on renvoie ce qui est prêt, étapes inachevées signalées
+    unfinished = [name for name, outcome in outcomes.items() if outcome != STAGE_SUCCESS]
+    budget = f" de {state['deadline'].budget:g}s" if state["deadline"] is not None else ""
+    state["output"]["status"] = "partial"
+    state["output"]["message"] = f"Échéance{budget} dépassée ; étapes non terminées : {', '.join(unfinished)}."
+
+def finish_request(state: Dict[str, Any]) -> Dict[str, Any]:
+    output_data = state["output"]
+    if STAGE_TIMEOUT in output_data["stage_outcomes"].values():
+        # Des étapes abandonnées tournent encore en arrière-plan : le résultat
+        # renvoyé est une copie qu'elles ne modifieront plus
+        output_data = dict(output_data, spans=list(output_data["spans"]), stage_timings=dict(output_data["stage_timings"]),
+                           downloaded_pdfs=list(output_data["downloaded_pdfs"]))
+    output_data["execution_time"] = time.time() - state["start_time"]
+    output_data["spans"].sort(key=lambda s: s["start"])
+    if state["deadline"] is not None:
+        output_data["deadline"] = {"budget": state["deadline"].budget, "remaining": round(state["deadline"].remaining(), 3),
+                                   "expired": state["deadline"].expired}
+    record_in_catalog(state)
+    # Compteurs du client HTTP partagé (cumulés depuis le démarrage du processus)
+    output_data["http_client"] = http_metrics()
+    return output_data
+
+# ------------------------------------------------------------
+# Streamlit-compatible processing function
+# ------------------------------------------------------------
+def process_techsheet_request(titre_produit: str, marque: str, reference: str, template_path: str, selected_domains: List[str],
+                              request_id: Optional[str] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+    # deadline : budget total en secondes (défaut TECHSHEET_REQUEST_DEADLINE, 0 = sans limite)
+    seconds = REQUEST_DEADLINE if deadline is None else deadline
+    state = new_request_state(titre_produit, marque, reference, template_path, selected_domains, request_id=request_id,
+                              deadline=Deadline(seconds) if seconds > 0 else None)
+    output_data = state["output"]
+
+    try:
+        # Produit déjà traité : le catalogue remplace recherche, scraping et LLM
+        state["catalog_entry"] = lookup_catalog(state)
+        stages = CATALOG_STAGES if state["catalog_entry"] is not None else PIPELINE_STAGES
+        outcomes = run_stage_graph([
+            (name, functools.partial(run_guarded_stage, state, name, stage), deps)
+            for name, stage, deps in stages
+        ], deadline=state["deadline"])
+        output_data["stage_outcomes"] = outcomes
+        if all(outcome == STAGE_SUCCESS for outcome in outcomes.values()):
+            mark_request_success(state)
+        elif STAGE_TIMEOUT in outcomes.values():
+            mark_request_partial(state, outcomes)
 
     except Exception as e:
-        output_data["message"] = f"Une erreur inattendue est survenue: {e}"
-        import traceback
-        print(traceback.format_exc())
+        mark_request_error(state, e)
 
     finally:
-        output_data["execution_time"] = time.time() - start_time
-        return output_data
+        return finish_request(state)
@@ -0,0 +1,113 @@
+import os, re, threading, urllib.parse
+from dataclasses import dataclass, field
+from typing import Dict, Any, Tuple, Pattern, FrozenSet, Optional
+
+# ------------------------------------------------------------
+# Filtrage des sous-ressources chargées par Playwright
+# ------------------------------------------------------------
+# Pour trouver et télécharger les PDF, seuls le DOM, les scripts du site et
+# ses appels XHR comptent : images, polices, vidéos et traceurs sont
+# interrompus (route.abort) avant d'être téléchargés. Les documents, les
+# URLs de téléchargement et les hôtes autorisés passent toujours. Une
+# ressource bloquée n'étant jamais reçue, sa taille est inconnue : le
+# rapport donne le nombre de requêtes bloquées par type et par raison.
+RESOURCE_BLOCKING_ENABLED = os.getenv("TECHSHEET_BLOCK_RESOURCES", "1").lower() not in ("0", "false", "no")
+
+BLOCK_TYPE = "type"
+BLOCK_TRACKER = "tracker"
+
+def _compile_all(patterns, flags: int = re.I) -> Tuple[Pattern, ...]:
+    return tuple(re.compile(p, flags) for p in patterns)
+
+# Mesure d'audience, publicité, replay de session : jamais utiles aux téléchargements
+TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "facebook.net", "facebook.com", "hotjar.com", "criteo.com", "criteo.net",
+    "bat.bing.com", "clarity.ms", "contentsquare.net", "abtasty.com", "kameleoon.eu", "kameleoon.io",
+    "tiqcdn.com", "omtrdc.net", "demdex.net", "cquotient.com", "licdn.com", "ads.linkedin.com",
+    "ct.pinterest.com", "ads-twitter.com", "analytics.tiktok.com", "scorecardresearch.com",
+    "quantserve.com", "nr-data.net", "newrelic.com", "mouseflow.com", "smartlook.com", "yandex.ru",
+    "trustpilot.com", "bazaarvoice.com", "youtube.com", "ytimg.com", "vimeo.com",
+)
+
+# Liens de documentation : toujours laissés passer, quel que soit leur type
+DOWNLOAD_URL_PATTERNS = _compile_all([
+    r"\.pdf(?:[?#]|$)",
+    r"download",
+    r"t[ée]l[ée]charg",
+    r"/documents?/",
+])
+
+@dataclass(frozen=True)
+class ResourcePolicy:
+    blocked_types: FrozenSet[str] = frozenset({"image", "media", "font"})
+    tracker_hosts: Tuple[str, ...] = TRACKER_HOSTS
+    # Hôtes (et sous-domaines) jamais bloqués
+    allow_hosts: Tuple[str, ...] = field(default=())
+    allow_url_patterns: Tuple[Pattern, ...] = DOWNLOAD_URL_PATTERNS
+
+    def decide(self, url: str, resource_type: str) -> Optional[str]:
+        # None = laisser passer, sinon la raison du blocage
+        if resource_type == "document" or any(p.search(url) for p in self.allow_url_patterns):
+            return None
+        host = (urllib.parse.urlsplit(url).hostname or "").lower()
+        if _host_in(host, self.allow_hosts):
+            return None
+        if _host_in(host, self.tracker_hosts):
+            return BLOCK_TRACKER
+        if resource_type in self.blocked_types:
+            return BLOCK_TYPE
+        return None
+
+def _host_in(host: str, suffixes: Tuple[str, ...]) -> bool:
+    return any(host == s or host.endswith("." + s) for s in suffixes)
+
+DEFAULT_RESOURCE_POLICY = ResourcePolicy()
+
+class BlockStats:
+    # Compteurs d'une requête, éventuellement cumulés sur plusieurs pages
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.blocked: Dict[str, int] = {}
+        self.blocked_by_reason: Dict[str, int] = {}
+        self.goto_ms: Optional[float] = None
+
+    def record(self, resource_type: str, reason: Optional[str]) -> None:
+        with self._lock:
+            if reason is None:
+                self.allowed += 1
+                return
+            self.blocked[resource_type] = self.blocked.get(resource_type, 0) + 1
+            self.blocked_by_reason[reason] = self.blocked_by_reason.get(reason, 0) + 1
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": RESOURCE_BLOCKING_ENABLED,
+                "allowed": self.allowed,
+                "blocked": sum(self.blocked.values()),
+                "blocked_by_type": dict(self.blocked),
+                "blocked_by_reason": dict(self.blocked_by_reason),
+                "goto_ms": self.goto_ms,
+            }
+
+def install_resource_policy(target, policy: Optional[ResourcePolicy] = None, stats: Optional[BlockStats] = None) -> BlockStats:
+    # target : BrowserContext ou Page. Les ressources autorisées passent par
+    # route.fallback() pour laisser agir les autres routes (instantané, banc)
+    policy = policy or DEFAULT_RESOURCE_POLICY
+    stats = stats if stats is not None else BlockStats()
+    if not RESOURCE_BLOCKING_ENABLED:
+        return stats
+
+    def _handle(route):
+        request = route.request
+        reason = policy.decide(request.url, request.resource_type)
+        stats.record(request.resource_type, reason)
+        if reason is None:
+            route.fallback()
+        else:
+            route.abort("blockedbyclient")
+
+    target.route("**/*", _handle)
+    return stats
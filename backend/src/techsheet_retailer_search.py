@@ -0,0 +1,150 @@
+import os, re, json, time, argparse, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Dict, Tuple, Callable, Iterable
+
+import requests
+from bs4 import BeautifulSoup
+
+from backend.src import techsheet_tracing as tracing
+from backend.src.techsheet_http import get_http_session
+from backend.src.techsheet_domains import DomainAdapter, adapter_for_domain
+
+# ------------------------------------------------------------
+# Recherche directe sur les moteurs internes des sites marchands
+# ------------------------------------------------------------
+# Quand la référence est connue, chaque site qui déclare un search_url est
+# interrogé en parallèle avec cette référence ; le lien produit est lu dans
+# la page de résultats (ou c'est la page produit elle-même si le site
+# redirige directement). DuckDuckGo ne sert plus que de repli quand tous
+# les sites font chou blanc. Les lecteurs de pages (SEARCH_PARSERS) sont
+# des fonctions pures : ils se testent sur des pages enregistrées, voir main()
+# et backend/tests/test_retailer_search.py.
+RETAILER_SEARCH_ENABLED = os.getenv("TECHSHEET_RETAILER_SEARCH", "1").lower() not in ("0", "false", "no")
+RETAILER_SEARCH_TIMEOUT = float(os.getenv("TECHSHEET_RETAILER_SEARCH_TIMEOUT", "10"))
+RETAILER_SEARCH_CONCURRENCY = int(os.getenv("TECHSHEET_RETAILER_SEARCH_CONCURRENCY", "4"))
+
+SEARCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "fr-FR,fr;q=0.9,en;q=0.8",
+}
+
+# Issue d'une recherche sur un site
+MATCH_REDIRECT = "redirect"     # le moteur a renvoyé directement la page produit
+MATCH_REFERENCE = "reference"   # lien(s) produit contenant la référence
+MATCH_SINGLE = "single"         # un seul produit dans les résultats
+MATCH_AMBIGUOUS = "ambiguous"   # plusieurs produits, aucun ne porte la référence
+MATCH_NONE = "none"             # aucun lien produit
+
+def normalize_reference(reference: str) -> str:
+    # "NU 3201-18" et "nu320118" désignent la même référence
+    return re.sub(r"[^0-9a-z]", "", (reference or "").casefold())
+
+# --- Lecture des pages de résultats ---------------------------------------------------
+def _clean_url(base_url: str, href: str) -> str:
+    return urllib.parse.urljoin(base_url, href.strip()).split("#", 1)[0]
+
+def parse_product_links(adapter: DomainAdapter, html: str, base_url: str) -> List[Tuple[str, str]]:
+    # Liens <a> vers une page produit, dans l'ordre de la page : (titre, url)
+    links: Dict[str, str] = {}
+    for a in BeautifulSoup(html, "html.parser").find_all("a", href=True):
+        url = _clean_url(base_url, a["href"])
+        if links.get(url, url) != url or not adapter.is_product_page(url):
+            continue
+        # Une carte produit commence souvent par un lien-image sans texte : le
+        # titre est pris sur le premier lien du même produit qui en porte un
+        links[url] = a.get_text(" ", strip=True) or a.get("title") or url
+    return [(title, url) for url, title in links.items()]
+
+_EMBEDDED_URL_RE = re.compile(r"""["'](https?://[^"'\s<>]+|/[^"'\s<>]*)["']""")
+
+def parse_embedded_urls(adapter: DomainAdapter, html: str, base_url: str) -> List[Tuple[str, str]]:
+    # Pages rendues côté client : les URLs produit figurent dans le JSON
+    # embarqué (échappé "\/" ou "/") plutôt que dans des <a>
+    links = dict((url, title) for title, url in parse_product_links(adapter, html, base_url))
+    text = html.replace("\\u002F", "/").replace("\\/", "/")
+    for href in _EMBEDDED_URL_RE.findall(text):
+        url = _clean_url(base_url, href)
+        if url not in links and adapter.is_product_page(url):
+            links[url] = url
+    return [(title, url) for url, title in links.items()]
+
+SEARCH_PARSERS: Dict[str, Callable[[DomainAdapter, str, str], List[Tuple[str, str]]]] = {
+    "product_links": parse_product_links,
+    "embedded_urls": parse_embedded_urls,
+}
+
+def pick_product_links(adapter: DomainAdapter, html: str, final_url: str, reference: str) -> Tuple[List[Tuple[str, str]], str]:
+    if adapter.is_product_page(final_url):
+        title = BeautifulSoup(html, "html.parser").title
+        return [((title.get_text(strip=True) if title else "") or final_url, final_url)], MATCH_REDIRECT
+    links = SEARCH_PARSERS[adapter.search_parser](adapter, html, final_url)
+    ref = normalize_reference(reference)
+    if ref:
+        matching = [(t, u) for t, u in links if ref in normalize_reference(f"{t} {urllib.parse.unquote(u)}")]
+        if matching:
+            return matching, MATCH_REFERENCE
+    if len(links) == 1:
+        return links, MATCH_SINGLE
+    # Plusieurs produits sans la référence : mieux vaut laisser DuckDuckGo trancher
+    return [], MATCH_AMBIGUOUS if links else MATCH_NONE
+
+# --- Interrogation des sites ------------------------------------------------------------
+def search_retailer(adapter: DomainAdapter, reference: str, session: Optional[requests.Session] = None):
+    # -> (résultats [(titre, url)], (url, statut HTTP ou erreur, latence en ms, issue))
+    session = session or get_http_session("no_retry")
+    url = adapter.search_url.format(query=urllib.parse.quote_plus(reference.strip()))
+    start = time.perf_counter()
+    results, match = [], MATCH_NONE
+    try:
+        r = session.get(url, headers=SEARCH_HEADERS, timeout=RETAILER_SEARCH_TIMEOUT, verify=False)
+        status = r.status_code
+        if r.ok:
+            results, match = pick_product_links(adapter, r.text, r.url, reference)
+    except requests.exceptions.RequestException as e:
+        status = repr(e)
+    return results, (url, status, round((time.perf_counter() - start) * 1000, 1), match)
+
+def searchable_adapters(domains: Iterable[str]) -> List[DomainAdapter]:
+    adapters = [adapter_for_domain(d) for d in domains]
+    return [a for a in dict.fromkeys(adapters) if a.search_url]
+
+def search_retailers(reference: str, domains: Iterable[str], max_results: int = 10):
+    # -> (résultats dans l'ordre des domaines, tried) ; résultats vides si tous les sites ratent
+    adapters = searchable_adapters(domains)
+    if not RETAILER_SEARCH_ENABLED or not normalize_reference(reference) or not adapters:
+        return [], []
+    workers = max(1, min(RETAILER_SEARCH_CONCURRENCY, len(adapters)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retailer-search") as pool:
+        outcomes = list(pool.map(tracing.bind(lambda a: search_retailer(a, reference)), adapters))
+    results, tried = [], []
+    for adapter, (found, entry) in zip(adapters, outcomes):
+        tried.append(entry)
+        if found and not results:
+            tracing.set_tier(f"retailer:{adapter.host}")
+        results.extend(r for r in found if r not in results)
+    return results[:max_results], tried
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recherche directe d'une référence sur un site marchand.")
+    parser.add_argument("--domain", required=True, help="ex. pointp.fr")
+    parser.add_argument("--reference", required=True)
+    parser.add_argument("--html", help="Page de résultats enregistrée à analyser (aucun accès réseau)")
+    parser.add_argument("--url", help="URL finale de la page enregistrée (défaut : search_url du site)")
+    args = parser.parse_args(argv)
+
+    adapter = adapter_for_domain(args.domain)
+    if not adapter.search_url:
+        parser.error(f"Aucune recherche directe déclarée pour {adapter.host}")
+    if args.html:
+        url = args.url or adapter.search_url.format(query=urllib.parse.quote_plus(args.reference))
+        results, match = pick_product_links(adapter, Path(args.html).read_text(encoding="utf-8", errors="replace"), url, args.reference)
+        entry = (url, None, None, match)
+    else:
+        results, entry = search_retailer(adapter, args.reference)
+    print(json.dumps({"results": results, "tried": entry}, ensure_ascii=False, indent=2))
+    return 0 if results else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,90 @@
+import threading
+from typing import Optional, Dict, Any
+
+import requests
+from bs4 import BeautifulSoup
+
+# ------------------------------------------------------------
+# Instantané de la page produit, partagé par toutes les étapes d'une requête
+# ------------------------------------------------------------
+SNAPSHOT_FETCHED = "fetched"      # l'étape a téléchargé la page pour créer l'instantané
+SNAPSHOT_REUSED = "reused"        # l'étape a consommé l'instantané existant
+SNAPSHOT_REFETCHED = "refetched"  # l'instantané n'était pas exploitable, l'étape a refait la requête
+
+class PageSnapshot:
+    # Octets bruts + en-têtes + URL finale ; le texte décodé et la soupe
+    # BeautifulSoup ne sont construits qu'à la première demande (une seule fois,
+    # même si plusieurs étapes les réclament en parallèle).
+    def __init__(self, url: str, final_url: str, status_code: int, headers: Dict[str, str],
+                 content: bytes, encoding: Optional[str] = None):
+        self.url = url
+        self.final_url = final_url or url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.content = content or b""
+        self.encoding = encoding
+        self.usage: Dict[str, str] = {}
+        self._text: Optional[str] = None
+        self._soup: Optional[BeautifulSoup] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_response(cls, url: str, response: requests.Response) -> "PageSnapshot":
+        return cls(
+            url=url,
+            final_url=response.url,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            content=response.content,
+            encoding=response.encoding or response.apparent_encoding,
+        )
+
+    @classmethod
+    def fetch(cls, url: str, session: Optional[requests.Session] = None, headers: Optional[Dict[str, str]] = None,
+              timeout: float = 20) -> "PageSnapshot":
+        getter = session.get if session is not None else requests.get
+        response = getter(url, headers=headers, timeout=timeout, verify=False)
+        return cls.from_response(url, response)
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    @property
+    def is_html(self) -> bool:
+        ctype = (self.headers.get("content-type") or "").lower()
+        return not ctype or "html" in ctype
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            with self._lock:
+                if self._text is None:
+                    try:
+                        self._text = self.content.decode(self.encoding or "utf-8", errors="replace")
+                    except LookupError:
+                        self._text = self.content.decode("utf-8", errors="replace")
+        return self._text
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            text = self.text
+            with self._lock:
+                if self._soup is None:
+                    self._soup = BeautifulSoup(text, "html.parser")
+        return self._soup
+
+    def record(self, stage: str, how: str) -> None:
+        with self._lock:
+            self.usage[stage] = how
+
+    def summary(self) -> Dict[str, Any]:
+        # usage est partagé : les étapes suivantes complètent le même dict
+        return {
+            "url": self.url,
+            "final_url": self.final_url,
+            "status_code": self.status_code,
+            "bytes": len(self.content),
+            "usage": self.usage,
+        }
@@ -0,0 +1,209 @@
+import re, math, threading
+from typing import List, Optional, Dict, Any, Tuple
+
+from bs4 import BeautifulSoup, NavigableString, Tag, Comment
+
+# ------------------------------------------------------------
+# Réduction du texte de la page avant l'appel LLM
+# ------------------------------------------------------------
+# La soupe est partagée avec les autres étapes (instantané de page) : elle
+# n'est jamais modifiée, les sous-arbres parasites sont simplement ignorés
+# pendant le parcours.
+DROP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "canvas", "video", "audio", "picture", "select", "option"}
+BOILERPLATE_TAGS = {"nav", "footer", "aside", "dialog"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "dialog", "alertdialog", "search", "menu", "menubar"}
+BOILERPLATE_TOKENS = {
+    "cookie", "cookies", "consent", "onetrust", "axeptio", "gdpr", "rgpd", "didomi",
+    "nav", "navbar", "navigation", "menu", "megamenu", "breadcrumb", "breadcrumbs", "fil", "ariane",
+    "footer", "header", "newsletter", "social", "share", "partage",
+    "recommendation", "recommendations", "recommended", "related", "similar", "upsell", "crosssell", "cross",
+    "carousel", "slider", "recently", "viewed", "reviews", "avis", "cart", "minicart", "panier",
+    "login", "account", "compte", "modal", "popup", "banner", "promo", "promotion", "skip", "sticky",
+}
+PRODUCT_TOKENS = {
+    "product", "produit", "pdp", "spec", "specs", "specification", "specifications", "caracteristique",
+    "caracteristiques", "characteristics", "description", "fiche", "technical", "technique", "details",
+    "detail", "attributes", "attribute", "features", "avantages", "title", "titre", "reference", "ref",
+}
+BLOCK_TAGS = {
+    "p", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "dt", "dd", "td", "th", "caption", "figcaption",
+    "div", "section", "article", "main", "body", "blockquote", "pre", "label",
+}
+TABLE_TAGS = {"table", "dl", "tr", "td", "th", "dt", "dd"}
+SPEC_KEYWORDS_RE = re.compile(
+    r"caract[ée]ristique|dimension|poids|puissance|tension|intensit[ée]|mat[ée]ri|r[ée]f[ée]rence|description|"
+    r"avantage|utilisation|garantie|norme|certif|indice|classe|couleur|hauteur|largeur|longueur|diam[èe]tre|"
+    r"\bIP\s?\d{2}\b|\b\d+(?:[.,]\d+)?\s?(?:mm|cm|m|kg|g|w|kw|v|a|ma|bar|°c|l)\b",
+    re.I,
+)
+TOKEN_SPLIT_RE = re.compile(r"[\s_\-]+")
+
+# --- Comptage de tokens -----------------------------------------------------
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # tiktoken absent ou fichier d'encodage non téléchargeable : estimation
+                _encoding_failed = True
+    return _encoding
+
+def estimate_tokens(text: str) -> int:
+    # ~3.5 caractères par token pour du français avec chiffres et unités
+    return int(math.ceil(len(text) / 3.5))
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def token_counter() -> str:
+    # Compteur utilisé par count_tokens, à afficher avec les nombres de tokens
+    return "tiktoken" if _get_encoding() is not None else "estimation"
+
+# --- Parcours du DOM ----------------------------------------------------------
+def _attr_tokens(el: Tag) -> set:
+    values = []
+    for attr in ("id", "class", "data-role", "data-testid", "aria-label"):
+        v = el.get(attr)
+        if not v:
+            continue
+        values.extend(v if isinstance(v, list) else [v])
+    tokens = set()
+    for v in values:
+        tokens.update(t for t in TOKEN_SPLIT_RE.split(str(v).lower()) if t)
+    return tokens
+
+def _is_boilerplate(el: Tag, tokens: set) -> bool:
+    if el.name in BOILERPLATE_TAGS:
+        return True
+    if (el.get("role") or "").lower() in BOILERPLATE_ROLES:
+        return True
+    if el.get("aria-hidden") == "true" or el.has_attr("hidden"):
+        return True
+    if el.name == "header" and el.find("h1") is None:
+        return True
+    return bool(tokens & BOILERPLATE_TOKENS) and not (tokens & PRODUCT_TOKENS)
+
+def _collect_blocks(soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    blocks: Dict[int, Dict[str, Any]] = {}
+    root = soup.body or soup
+    # (élément, bloc courant, dans un tableau, indice produit, dans un lien, niveau de titre)
+    stack: List[Tuple[Any, Optional[Dict[str, Any]], bool, bool, bool, str]] = [(root, None, False, False, False, "")]
+    order = 0
+    position = 0
+    while stack:
+        node, block, in_table, product_hint, in_link, heading = stack.pop()
+        if isinstance(node, Comment):
+            continue
+        if isinstance(node, NavigableString):
+            text = " ".join(str(node).split())
+            if not text or block is None:
+                continue
+            if not block["lines"]:
+                # L'ordre d'un bloc est celui de son premier texte dans le document
+                position += 1
+                block["position"] = position
+            block["lines"].append(text)
+            block["chars"] += len(text)
+            if in_link:
+                block["link_chars"] += len(text)
+            continue
+        if not isinstance(node, Tag) or node.name in DROP_TAGS:
+            continue
+        tokens = _attr_tokens(node)
+        if node is not root and _is_boilerplate(node, tokens):
+            continue
+        product_hint = product_hint or bool(tokens & PRODUCT_TOKENS)
+        in_table = in_table or node.name in TABLE_TAGS
+        in_link = in_link or node.name == "a"
+        if node.name in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            heading = node.name
+        if node.name in BLOCK_TAGS or block is None:
+            order += 1
+            block = {"order": order, "position": 0, "tag": node.name, "lines": [], "chars": 0, "link_chars": 0,
+                     "in_table": in_table, "product_hint": product_hint, "heading": heading}
+            blocks[order] = block
+        for child in reversed(node.contents):
+            stack.append((child, block, in_table, product_hint, in_link, heading))
+    return [b for b in sorted(blocks.values(), key=lambda b: b["position"]) if b["lines"]]
+
+def _score_block(block: Dict[str, Any], text: str, hints: List[str]) -> float:
+    score = 1.0
+    if block["heading"] == "h1":
+        score += 6
+    elif block["heading"] in ("h2", "h3"):
+        score += 1.5
+    if block["in_table"]:
+        score += 3
+    if block["product_hint"]:
+        score += 2
+    lowered = text.lower()
+    for i, hint in enumerate(hints):
+        if hint and hint in lowered:
+            score += 5 if i == 0 else 3
+    score += min(3.0, 0.5 * len(SPEC_KEYWORDS_RE.findall(text)))
+    if block["chars"]:
+        score -= 4 * (block["link_chars"] / block["chars"])
+    if block["chars"] < 3:
+        score -= 1
+    return score
+
+def reduce_page_text(soup: BeautifulSoup, token_budget: int, reference: str = "", titre: str = "", marque: str = "") -> Tuple[str, Dict[str, Any]]:
+    # Hints : la référence d'abord (plus discriminante), puis les mots du titre et la marque
+    hints = [reference.strip().lower()] if reference and reference.strip() else [""]
+    hints += [w for w in re.split(r"\W+", f"{titre} {marque}".lower()) if len(w) > 3]
+
+    blocks = _collect_blocks(soup)
+    seen = set()
+    candidates = []
+    for block in blocks:
+        # Les lignes répétées (menus dupliqués, mentions légales) ne sont gardées qu'une fois
+        lines = [l for l in block["lines"] if l not in seen]
+        seen.update(lines)
+        if not lines:
+            continue
+        text = "\n".join(lines)
+        candidates.append({
+            "order": block["position"],
+            "text": text,
+            "score": _score_block(block, text, hints),
+            # Même compteur que celui qui rapporte le résultat (count_tokens)
+            "tokens": count_tokens(text),
+        })
+
+    kept = []
+    used = 0
+    for cand in sorted(candidates, key=lambda c: (-c["score"], c["order"])):
+        if cand["score"] <= 0:
+            continue
+        if used + cand["tokens"] > token_budget:
+            continue
+        kept.append(cand)
+        used += cand["tokens"]
+    kept.sort(key=lambda c: c["order"])
+    reduced = "\n".join(c["text"] for c in kept)
+    tokens = count_tokens(reduced)
+    # Les sauts de ligne entre blocs comptent aussi : on retire les blocs les
+    # moins utiles jusqu'à ce que le texte final tienne dans le budget
+    while tokens > token_budget and kept:
+        kept.remove(min(kept, key=lambda c: (c["score"], -c["order"])))
+        reduced = "\n".join(c["text"] for c in kept)
+        tokens = count_tokens(reduced)
+    return reduced, {
+        "blocks_total": len(candidates),
+        "blocks_kept": len(kept),
+        "token_budget": token_budget,
+        "tokens": tokens,
+        "token_counter": token_counter(),
+    }
@@ -0,0 +1,280 @@
+import os, json, time, argparse, threading, contextvars
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable, Iterator
+
+# ------------------------------------------------------------
+# Traces par étape : durée, octets, appels HTTP, retries, caches, tokens
+# ------------------------------------------------------------
+# Chaque étape d'une requête ouvre un span ; le span courant est porté par
+# une ContextVar, si bien que le client HTTP, les caches et le LLM y
+# ajoutent leurs compteurs sans qu'on ait à le passer en paramètre. Les
+# pools de threads internes à une étape (sondes d'images, PDF, navigateur)
+# doivent propager le span avec bind(), qui transmet aussi l'échéance de la
+# requête (techsheet_deadline).
+#
+# Les spans terminés sont joints à output_data["spans"], agrégés pour
+# l'export Prometheus (start_metrics_server) et, si TECHSHEET_TRACE_JSONL
+# est défini, ajoutés à ce fichier JSON lines (un span par ligne).
+TRACE_JSONL_PATH = os.getenv("TECHSHEET_TRACE_JSONL", "")
+METRICS_PORT = int(os.getenv("TECHSHEET_METRICS_PORT", "0"))
+
+SPAN_COUNTERS = ("bytes", "http_calls", "retries", "cache_hits", "cache_misses", "prompt_tokens", "completion_tokens")
+SPAN_OK = "ok"
+SPAN_STOPPED = "stopped"
+SPAN_ERROR = "error"
+SPAN_TIMEOUT = "timeout"
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf"))
+
+class Span:
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status = SPAN_OK
+        self.tier: Optional[str] = None
+        self.counters: Dict[str, int] = dict.fromkeys(SPAN_COUNTERS, 0)
+        self.attributes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def add(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            attributes = dict(self.attributes)
+        return dict(
+            {"trace_id": self.trace_id, "span": self.name, "start": round(self.start, 6),
+             "duration": round(self.duration, 6), "status": self.status, "tier": self.tier},
+            **counters, attributes=attributes,
+        )
+
+_current_span = contextvars.ContextVar("techsheet_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+# --- Instrumentation (sans effet hors d'un span) -----------------------------------
+def add(counter: str, n: int = 1) -> None:
+    span = _current_span.get()
+    if span is not None and n:
+        span.add(counter, n)
+
+def set_tier(tier: str) -> None:
+    # Niveau de repli qui a abouti (ex. "ddg_html", "simple", "advanced")
+    span = _current_span.get()
+    if span is not None:
+        span.tier = tier
+
+def set_attribute(key: str, value: Any) -> None:
+    span = _current_span.get()
+    if span is not None:
+        with span._lock:
+            span.attributes[key] = value
+
+def count_bytes(raw) -> None:
+    # Compte les octets lus sur une réponse urllib3 (streamée ou non) au
+    # profit du span courant au moment de l'envoi, même si la lecture se
+    # fait plus tard
+    span = _current_span.get()
+    if span is None or raw is None or not hasattr(raw, "read"):
+        return
+    read = raw.read
+
+    def counting_read(*args, **kwargs):
+        data = read(*args, **kwargs)
+        if data:
+            span.add("bytes", len(data))
+        return data
+    raw.read = counting_read
+
+def bind(func: Callable) -> Callable:
+    # Rattache func au contexte courant (span, échéance) lorsqu'elle
+    # s'exécutera dans un autre thread ; une copie par appel, car un même
+    # Context ne peut être actif dans deux threads à la fois
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return bound
+
+@contextmanager
+def start_span(name: str, trace_id: Optional[str] = None) -> Iterator[Span]:
+    span = Span(name, trace_id)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        # Une exception peut préciser le statut (ex. DeadlineExceeded -> "timeout")
+        span.status = getattr(e, "span_status", SPAN_ERROR)
+        raise
+    finally:
+        span.end = time.time()
+        _current_span.reset(token)
+        record_span(span)
+
+# --- Agrégation Prometheus ------------------------------------------------------------
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # étape -> compteurs cumulés
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._tiers: Dict[tuple, int] = {}
+
+    def observe(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            stage = self._stages.setdefault(span["span"], {
+                "count": {}, "duration_sum": 0.0, "buckets": [0] * len(DURATION_BUCKETS),
+                "counters": dict.fromkeys(SPAN_COUNTERS, 0),
+            })
+            stage["count"][span["status"]] = stage["count"].get(span["status"], 0) + 1
+            stage["duration_sum"] += span["duration"]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span["duration"] <= bound:
+                    stage["buckets"][i] += 1
+            for counter in SPAN_COUNTERS:
+                stage["counters"][counter] += span.get(counter) or 0
+            if span.get("tier"):
+                key = (span["span"], span["tier"])
+                self._tiers[key] = self._tiers.get(key, 0) + 1
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            stages = {name: {"count": dict(s["count"]), "duration_sum": s["duration_sum"],
+                             "buckets": list(s["buckets"]), "counters": dict(s["counters"])}
+                      for name, s in self._stages.items()}
+            tiers = dict(self._tiers)
+        lines = [
+            "# HELP techsheet_stage_duration_seconds Durée des étapes du pipeline",
+            "# TYPE techsheet_stage_duration_seconds histogram",
+        ]
+        for name, s in sorted(stages.items()):
+            for bound, n in zip(DURATION_BUCKETS, s["buckets"]):
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f'techsheet_stage_duration_seconds_bucket{{stage="{name}",le="{le}"}} {n}')
+            lines.append(f'techsheet_stage_duration_seconds_sum{{stage="{name}"}} {s["duration_sum"]:.6f}')
+            lines.append(f'techsheet_stage_duration_seconds_count{{stage="{name}"}} {sum(s["count"].values())}')
+        lines += ["# HELP techsheet_stage_runs_total Étapes terminées par statut", "# TYPE techsheet_stage_runs_total counter"]
+        for name, s in sorted(stages.items()):
+            for status, n in sorted(s["count"].items()):
+                lines.append(f'techsheet_stage_runs_total{{stage="{name}",status="{status}"}} {n}')
+        for counter in SPAN_COUNTERS:
+            metric = f"techsheet_stage_{counter}_total"
+            lines += [f"# HELP {metric} Cumul de {counter} par étape", f"# TYPE {metric} counter"]
+            for name, s in sorted(stages.items()):
+                lines.append(f'{metric}{{stage="{name}"}} {s["counters"][counter]}')
+        lines += ["# HELP techsheet_stage_tier_total Niveau de repli ayant abouti", "# TYPE techsheet_stage_tier_total counter"]
+        for (name, tier), n in sorted(tiers.items()):
+            lines.append(f'techsheet_stage_tier_total{{stage="{name}",tier="{tier}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+_registry = MetricsRegistry()
+_jsonl_lock = threading.Lock()
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
+
+def export_jsonl(spans: List[Dict[str, Any]], path) -> None:
+    if not spans:
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = "".join(json.dumps(s, ensure_ascii=False) + "\n" for s in spans)
+    with _jsonl_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(payload)
+
+def record_span(span: Span) -> Dict[str, Any]:
+    data = span.to_dict()
+    _registry.observe(data)
+    if TRACE_JSONL_PATH:
+        try:
+            export_jsonl([data], TRACE_JSONL_PATH)
+        except OSError as e:
+            print(f"⚠️ Export des traces impossible: {e}")
+    return data
+
+# --- Endpoint /metrics ------------------------------------------------------------------
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0",
+                         registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    registry = registry or _registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="techsheet-metrics", daemon=True).start()
+    return server
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+def ensure_metrics_server() -> None:
+    # Démarré une seule fois par processus si TECHSHEET_METRICS_PORT est défini
+    global _metrics_server
+    if not METRICS_PORT:
+        return
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = start_metrics_server(METRICS_PORT)
+            except OSError as e:
+                print(f"⚠️ Endpoint /metrics indisponible sur le port {METRICS_PORT}: {e}")
+                _metrics_server = False
+
+def _follow_jsonl(path: Path, registry: MetricsRegistry, interval: float) -> None:
+    # Agrège les spans écrits par d'autres processus (workers de techsheet_jobs)
+    offset = 0
+    while True:
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                f.seek(offset)
+                while True:
+                    line = f.readline()
+                    if not line.endswith("\n"):
+                        break
+                    offset += len(line.encode("utf-8"))
+                    try:
+                        registry.observe(json.loads(line))
+                    except (ValueError, KeyError):
+                        pass
+        time.sleep(interval)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Expose au format Prometheus les spans écrits en JSON lines.")
+    parser.add_argument("--jsonl", default=TRACE_JSONL_PATH, required=not TRACE_JSONL_PATH, help="Fichier de spans (TECHSHEET_TRACE_JSONL)")
+    parser.add_argument("--port", type=int, default=METRICS_PORT or 9464)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--interval", type=float, default=5.0, help="Période de relecture du fichier (s)")
+    args = parser.parse_args(argv)
+    registry = MetricsRegistry()
+    start_metrics_server(args.port, args.host, registry)
+    print(f"Endpoint Prometheus : http://{args.host}:{args.port}/metrics ({args.jsonl})")
+    try:
+        _follow_jsonl(Path(args.jsonl), registry, args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
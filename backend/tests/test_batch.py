@@ -0,0 +1,30 @@
+import pytest
+
+from backend.src import techsheet_batch as batch
+from backend.src.techsheet_deadline import DeadlineExceeded
+from backend.src.techsheet_dag import STAGE_SUCCESS, STAGE_TIMEOUT
+
+def _search(state):
+    return True
+
+def _scrape(state):
+    raise DeadlineExceeded("Échéance de 1s dépassée")
+
+@pytest.fixture
+def timeout_pipeline(monkeypatch):
+    monkeypatch.setattr(batch, "PIPELINE_STAGES", [("search", _search, ()), ("scrape", _scrape, ("search",))])
+    monkeypatch.setattr(batch, "lookup_catalog", lambda state: None)
+    monkeypatch.setattr(batch, "finish_request", lambda state: state["output"])
+
+def test_stage_deadline_is_recorded_as_partial(timeout_pipeline, tmp_path):
+    report = batch.run_batch([("Disjoncteur", "Legrand", "411632")], str(tmp_path / "modele.docx"))
+    result = report["items"][0]["result"]
+    assert result["status"] == "partial"
+    assert result["stage_outcomes"] == {"search": STAGE_SUCCESS, "scrape": STAGE_TIMEOUT}
+
+def test_deadline_before_first_stage_is_recorded(timeout_pipeline, monkeypatch, tmp_path):
+    def expired(state):
+        raise DeadlineExceeded("Échéance de 1s dépassée")
+    monkeypatch.setattr(batch, "lookup_catalog", expired)
+    report = batch.run_batch([("Disjoncteur", "Legrand", "411632"), ("Prise", "Legrand", "077111")], str(tmp_path / "modele.docx"))
+    assert [item["result"]["status"] for item in report["items"]] == ["error", "error"]
@@ -0,0 +1,26 @@
+import pytest
+
+from backend.src.techsheet_consent import COOKIE_ACCEPT_LABELS, CONSENT_STANDALONE_LABELS
+
+def _match(text: str):
+    return next((p for p in COOKIE_ACCEPT_LABELS if p.search(text)), None)
+
+@pytest.mark.parametrize("text", [
+    "Tout accepter", "Accepter", "ACCEPTER & FERMER", "J'accepte", "Accept all", "Accept all cookies",
+    "I agree", "Allow all", "OK", "Continuer sans accepter",
+])
+def test_accept_labels(text):
+    assert _match(text) is not None
+
+@pytest.mark.parametrize("text", [
+    "Bookmark", "Ajouter au panier", "Conditions à accepter avant commande", "Agree to terms of sale",
+    "Cookies non acceptés", "Look book",
+])
+def test_labels_are_anchored(text):
+    assert _match(text) is None
+
+@pytest.mark.parametrize("text, standalone", [
+    ("Tout accepter", True), ("Accept all", True), ("OK", False), ("Continuer sans accepter", False),
+])
+def test_generic_labels_need_a_banner(text, standalone):
+    assert (_match(text).pattern in CONSENT_STANDALONE_LABELS) is standalone
@@ -0,0 +1,49 @@
+import re
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from backend.src.techsheet_image_extract import extract_image_urls, SCRIPT_PATTERNS
+from backend.src.techsheet_image_extract_bench import legacy_extract_image_urls, FIXTURE_PAGES_DIR, _base_url_for
+
+PAGES = sorted(FIXTURE_PAGES_DIR.glob("*.html"))
+
+def _load(path: Path):
+    html_text = path.read_text(encoding="utf-8")
+    return _base_url_for(path, None), html_text, BeautifulSoup(html_text, "html.parser")
+
+def test_fixture_pages_present():
+    assert {p.name for p in PAGES} >= {"pointp.fr.html", "cedeo.fr.html", "se.com.html"}
+
+@pytest.mark.parametrize("path", PAGES, ids=lambda p: p.name)
+@pytest.mark.parametrize("limit", [1, 3, 1000])
+def test_matches_legacy_extractor(path, limit):
+    url, html_text, soup = _load(path)
+    assert extract_image_urls(url, html_text, soup, limit) == legacy_extract_image_urls(url, html_text, soup, limit)
+
+def _script_matches(patterns, text):
+    found = []
+    for pattern in patterns:
+        for m in pattern.finditer(text):
+            found.append(next((g for g in m.groups() if g is not None), m.group(0)))
+    return found
+
+def test_combined_alternation_loses_overlapping_matches():
+    # Pourquoi SCRIPT_PATTERNS reste en passes distinctes : fusionnés en une
+    # alternance, le motif "imageUrls: [...]" consomme la liste et l'URL
+    # qu'elle contient n'est plus relevée par le motif https://...
+    combined = re.compile("|".join(f"(?:{p.pattern})" for p in SCRIPT_PATTERNS), re.I)
+    text = '{"imageUrls": ["https://media.pointp.fr/p/411632/411632-2.jpg"]}'
+    separate = _script_matches(SCRIPT_PATTERNS, text)
+    merged = _script_matches([combined], text)
+    assert "https://media.pointp.fr/p/411632/411632-2.jpg" in separate
+    assert "https://media.pointp.fr/p/411632/411632-2.jpg" not in merged
+
+def test_combined_alternation_changes_order():
+    # L'ordre de sortie (donc les `limit` premières images) suit l'ordre des
+    # motifs, pas l'ordre d'apparition dans la page
+    combined = re.compile("|".join(f"(?:{p.pattern})" for p in SCRIPT_PATTERNS), re.I)
+    text = '{"url": "https://cdn.example/b.jpg", "imageUrl": "https://cdn.example/a.jpg"}'
+    assert _script_matches(SCRIPT_PATTERNS, text)[0] == "https://cdn.example/a.jpg"
+    assert _script_matches([combined], text)[0] == "https://cdn.example/b.jpg"
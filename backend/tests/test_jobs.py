@@ -0,0 +1,40 @@
+import time
+
+from backend.src.techsheet_jobs import JobWorkerPool
+
+POLL = 0.3
+
+def _wait_for(predicate, timeout: float) -> float:
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if predicate():
+            return time.monotonic() - start
+        time.sleep(0.02)
+    raise AssertionError(f"condition non atteinte en {timeout}s")
+
+def test_young_worker_crash_is_respawned_quickly(tmp_path):
+    pool = JobWorkerPool(1, db_path=tmp_path / "jobs.sqlite", poll_interval=POLL).start()
+    try:
+        first = pool._procs[0]
+        first.kill()
+        first.join(5)
+        # Backoff appliqué une seule fois (un poll_interval), pas doublé à chaque tour
+        elapsed = _wait_for(lambda: any(p.pid != first.pid and p.is_alive() for p in pool._procs), 2 * POLL + 1.0)
+        assert elapsed <= 2 * POLL + 0.5
+        assert pool.stats()["pending_respawns"] == 0
+        assert pool.stats()["respawn_delay"] == POLL
+        assert len(pool._procs) == 1
+    finally:
+        pool.close()
+
+def test_repeated_crashes_back_off(tmp_path):
+    pool = JobWorkerPool(1, db_path=tmp_path / "jobs.sqlite", poll_interval=POLL).start()
+    try:
+        for expected_delay in (POLL, 2 * POLL):
+            proc = pool._procs[0]
+            proc.kill()
+            proc.join(5)
+            _wait_for(lambda: pool._procs and pool._procs[0].pid != proc.pid, 4 * expected_delay + 2)
+            assert pool.stats()["respawn_delay"] == expected_delay
+    finally:
+        pool.close()
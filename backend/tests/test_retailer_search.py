@@ -0,0 +1,88 @@
+import urllib.parse
+from pathlib import Path
+
+import pytest
+
+from backend.src.techsheet_domains import POINTP, CEDEO, SE_COM
+from backend.src.techsheet_retailer_search import (
+    parse_product_links, parse_embedded_urls, pick_product_links, searchable_adapters, main,
+    MATCH_REFERENCE, MATCH_SINGLE, MATCH_AMBIGUOUS, MATCH_NONE, MATCH_REDIRECT,
+)
+
+SEARCH_PAGES_DIR = Path(__file__).resolve().parent / "fixtures" / "search_pages"
+
+def _page(adapter) -> str:
+    return (SEARCH_PAGES_DIR / f"{adapter.host}.html").read_text(encoding="utf-8")
+
+def _search_url(adapter, reference: str = "411632") -> str:
+    return adapter.search_url.format(query=reference)
+
+# --- search_url -----------------------------------------------------------------------
+@pytest.mark.parametrize("adapter, expected", [
+    (POINTP, "https://www.pointp.fr/recherche?text=NU+3201-18"),
+    (CEDEO, "https://www.cedeo.fr/recherche?text=NU+3201-18"),
+    (SE_COM, "https://www.se.com/fr/fr/search/?q=NU+3201-18"),
+], ids=lambda a: getattr(a, "host", ""))
+def test_search_url(adapter, expected):
+    assert adapter.search_url.format(query=urllib.parse.quote_plus("NU 3201-18")) == expected
+
+def test_searchable_adapters_keep_domain_order_once():
+    assert searchable_adapters(["se.com", "pointp.fr", "www.pointp.fr", "cedeo.fr"]) == [SE_COM, POINTP, CEDEO]
+
+# --- parse_product_links --------------------------------------------------------------
+def test_parse_product_links_pointp():
+    links = parse_product_links(POINTP, _page(POINTP), _search_url(POINTP))
+    assert links == [
+        ("Disjoncteur différentiel Legrand 411632", "https://www.pointp.fr/p/disjoncteur-differentiel-legrand-411632-A1000"),
+        ("Disjoncteur différentiel Legrand 411633", "https://www.pointp.fr/p/disjoncteur-differentiel-legrand-411633-A1001"),
+        ("Peigne d'alimentation Legrand", "https://www.pointp.fr/p/peigne-alimentation-legrand-A1002"),
+    ]
+
+def test_parse_product_links_cedeo():
+    links = parse_product_links(CEDEO, _page(CEDEO), _search_url(CEDEO))
+    assert links == [("Chauffe-eau électrique vertical 150 L", "https://www.cedeo.fr/p/chauffe-eau-electrique-vertical-150-l-A2000")]
+
+def test_parse_product_links_ignores_other_sites_pages():
+    # Le lien absolu vers Point.P n'est pas une page produit Cedeo
+    urls = [url for _, url in parse_product_links(CEDEO, _page(POINTP), _search_url(CEDEO))]
+    assert len(urls) == 2 and all(u.startswith("https://www.cedeo.fr/p/") for u in urls)
+
+# --- parse_embedded_urls --------------------------------------------------------------
+def test_parse_embedded_urls_secom():
+    links = parse_embedded_urls(SE_COM, _page(SE_COM), _search_url(SE_COM))
+    assert [url for _, url in links] == [
+        "https://www.se.com/fr/fr/product/NU320118/",
+        "https://www.se.com/fr/fr/product/NU400218/",
+        "https://www.se.com/fr/fr/product/NU320418/",
+    ]
+
+def test_parse_embedded_urls_keeps_anchor_titles():
+    html = '<a href="/fr/fr/product/NU320118/">Interrupteur</a><script>x={"u":"\\/fr\\/fr\\/product\\/NU320118\\/"}</script>'
+    assert parse_embedded_urls(SE_COM, html, _search_url(SE_COM)) == [("Interrupteur", "https://www.se.com/fr/fr/product/NU320118/")]
+
+# --- pick_product_links ---------------------------------------------------------------
+def test_pick_by_reference():
+    links, match = pick_product_links(POINTP, _page(POINTP), _search_url(POINTP), "411 632")
+    assert match == MATCH_REFERENCE
+    assert [url for _, url in links] == ["https://www.pointp.fr/p/disjoncteur-differentiel-legrand-411632-A1000"]
+
+def test_pick_by_reference_in_embedded_url():
+    links, match = pick_product_links(SE_COM, _page(SE_COM), _search_url(SE_COM), "NU 3201-18")
+    assert (match, [url for _, url in links]) == (MATCH_REFERENCE, ["https://www.se.com/fr/fr/product/NU320118/"])
+
+def test_pick_single_result():
+    links, match = pick_product_links(CEDEO, _page(CEDEO), _search_url(CEDEO), "153115")
+    assert match == MATCH_SINGLE and len(links) == 1
+
+def test_pick_ambiguous_and_none():
+    assert pick_product_links(POINTP, _page(POINTP), _search_url(POINTP), "999999") == ([], MATCH_AMBIGUOUS)
+    assert pick_product_links(POINTP, "<html><body>Aucun résultat</body></html>", _search_url(POINTP), "999999") == ([], MATCH_NONE)
+
+def test_pick_redirect_to_product_page():
+    html = "<html><head><title>Disjoncteur 411632</title></head><body></body></html>"
+    url = "https://www.pointp.fr/p/disjoncteur-differentiel-legrand-411632-A1000"
+    assert pick_product_links(POINTP, html, url, "411632") == ([("Disjoncteur 411632", url)], MATCH_REDIRECT)
+
+def test_main_reads_saved_page(capsys):
+    assert main(["--domain", "se.com", "--reference", "NU320118", "--html", str(SEARCH_PAGES_DIR / "se.com.html")]) == 0
+    assert "NU320118" in capsys.readouterr().out
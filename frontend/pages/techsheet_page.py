@@ -1,24 +1,37 @@
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import time
 import streamlit as st
 from pathlib import Path
-from backend.src.techsheet_processor import process_techsheet_request
+from backend.src.techsheet_processor import DEFAULT_DOMAINS
+from backend.src.techsheet_jobs import (
+    JobWorkerPool, JOB_WORKERS, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_PARTIAL, JOB_CANCELLED,
+    submit as submit_job, status as job_status, result as job_result, cancel as cancel_job,
+)
 
 # Calculate project root dynamically based on this file's location
 # Assumes techsheet_page.py is in frontend/pages
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 TEMPLATE_DOCX_PATH = PROJECT_ROOT / "techsheet" / "Fiche_Technique_Modele.docx"
 
-# Define available domains
-domains = [
-    "pointp.fr", "cedeo.fr", "se.com"
-]
+# Define available domains (one per registered retailer adapter)
+domains = list(DEFAULT_DOMAINS)
+
+# Polling interval while a job is queued/running (seconds)
+POLL_INTERVAL = 2
 
 # Initialize session state for results
 if 'result' not in st.session_state:
     st.session_state.result = None
 
+@st.cache_resource
+def get_job_workers():
+    # One worker pool per Streamlit server process, shared by every session
+    return JobWorkerPool(JOB_WORKERS).start()
+
+get_job_workers()
+
 st.set_page_config(
     page_title="Générateur de Fiche Technique",
     page_icon="📄",
@@ -87,53 +100,83 @@ with st.form("techsheet_form"):
         if not titre_produit:
             st.error("Veuillez entrer le titre/nom du produit.")
         else:
-            with st.spinner("Génération de la fiche technique en cours..."):
-                try:
-                    result = process_techsheet_request(
-                        titre_produit, marque, reference, str(TEMPLATE_DOCX_PATH), selected_domains
-                    )
-                    st.session_state.result = result # Store result in session state
-
-                    if result["status"] == "success":
-                        st.success("Fiche technique générée avec succès !")
-                        st.write("### Récapitulatif de la recherche")
-                        st.markdown(f"**Site source**: {result['url_source']}")
-                        st.markdown(f"**URL produit**: [{result['best_url']}]({result['best_url']})")
-                        st.markdown(f"**Temps d'exécution**: {result['execution_time']:.2f} secondes")
-                        st.markdown(f"**ID de la requête**: {result['request_id']}")
-
-                        st.write("### Données extraites")
-                        data = result["extracted_data"]
-                        if data.get("TITRE"):
-                            st.markdown(f"**Titre**: {data['TITRE']}")
-                        if data.get("REFERENCE"):
-                            st.markdown(f"**Référence**: {data['REFERENCE']}")
-                        if data.get("DESCRIPTION"):
-                            st.markdown(f"**Description**: {data['DESCRIPTION']}")
-                        if data.get("AVANTAGES"):
-                            st.markdown("**Avantages**:")
-                            for item in data["AVANTAGES"]:
-                                st.markdown(f"- {item}")
-                        if data.get("UTILISATION"):
-                            st.markdown("**Utilisation**:")
-                            for item in data["UTILISATION"]:
-                                st.markdown(f"- {item}")
-                        if data.get("CARACTERISTIQUES TECHNIQUES"):
-                            st.markdown("**Caractéristiques techniques**:")
-                            for k, v in data["CARACTERISTIQUES TECHNIQUES"].items():
-                                st.markdown(f"- **{k}**: {v}")
-
-                    else:
-                        st.error(f"Erreur lors de la génération: {result['message']}")
-                        st.session_state.result = None # Clear result on error
-
-                except Exception as e:
-                    st.error(f"Une erreur inattendue est survenue: {e}")
-                    st.exception(e)
-                    st.session_state.result = None # Clear result on error
+            # The request runs in a background worker; the job id lives in the URL so a refresh keeps it
+            job_id = submit_job(titre_produit, marque, reference, str(TEMPLATE_DOCX_PATH), selected_domains)
+            st.session_state.result = None
+            st.query_params["job"] = job_id
+            st.rerun()
+
+# Statuts de requête dont les fichiers produits sont affichés
+DISPLAYABLE_STATUSES = ("success", "partial")
+
+def show_summary(result):
+    if result["status"] == "partial":
+        # Échéance dépassée : on montre ce qui a été produit et ce qui manque
+        unfinished = [name for name, outcome in result.get("stage_outcomes", {}).items() if outcome != "success"]
+        st.warning("Fiche technique incomplète : délai de traitement dépassé.")
+        st.markdown("**Étapes non terminées**: " + ", ".join(
+            f"{name} ({result['stage_outcomes'][name]})" for name in unfinished))
+    else:
+        st.success("Fiche technique générée avec succès !")
+    st.write("### Récapitulatif de la recherche")
+    st.markdown(f"**Site source**: {result['url_source']}")
+    st.markdown(f"**URL produit**: [{result['best_url']}]({result['best_url']})")
+    st.markdown(f"**Temps d'exécution**: {result['execution_time']:.2f} secondes")
+    st.markdown(f"**ID de la requête**: {result['request_id']}")
+
+    st.write("### Données extraites")
+    data = result["extracted_data"]
+    if data.get("TITRE"):
+        st.markdown(f"**Titre**: {data['TITRE']}")
+    if data.get("REFERENCE"):
+        st.markdown(f"**Référence**: {data['REFERENCE']}")
+    if data.get("DESCRIPTION"):
+        st.markdown(f"**Description**: {data['DESCRIPTION']}")
+    if data.get("AVANTAGES"):
+        st.markdown("**Avantages**:")
+        for item in data["AVANTAGES"]:
+            st.markdown(f"- {item}")
+    if data.get("UTILISATION"):
+        st.markdown("**Utilisation**:")
+        for item in data["UTILISATION"]:
+            st.markdown(f"- {item}")
+    if data.get("CARACTERISTIQUES TECHNIQUES"):
+        st.markdown("**Caractéristiques techniques**:")
+        for k, v in data["CARACTERISTIQUES TECHNIQUES"].items():
+            st.markdown(f"- **{k}**: {v}")
+
+# Poll the current job (if any) and show its status or result
+job_id = st.query_params.get("job")
+if job_id:
+    info = job_status(job_id)
+    if info is None:
+        st.warning(f"Travail introuvable : {job_id}")
+    elif info["status"] in (JOB_QUEUED, JOB_RUNNING):
+        if info["status"] == JOB_QUEUED:
+            st.info(f"En file d'attente (position {info.get('queue_position', '?')})...")
+        elif info["cancel_requested"]:
+            st.info("Annulation en cours...")
+        else:
+            st.info(f"Génération de la fiche technique en cours... ({info['elapsed']:.0f} s)")
+        if st.button("Annuler"):
+            cancel_job(job_id)
+            st.rerun()
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+    elif info["status"] == JOB_CANCELLED:
+        st.warning("Génération annulée.")
+    else:
+        result = job_result(job_id)
+        if info["status"] in (JOB_DONE, JOB_PARTIAL) and result and result["status"] in DISPLAYABLE_STATUSES:
+            st.session_state.result = result # Store result in session state
+            show_summary(result)
+        else:
+            message = (result or {}).get("message") or info.get("error")
+            st.error(f"Erreur lors de la génération: {message}")
+            st.session_state.result = None # Clear result on error
 
 # Display download buttons outside the form, after processing
-if st.session_state.result and st.session_state.result["status"] == "success":
+if st.session_state.result and st.session_state.result["status"] in DISPLAYABLE_STATUSES:
     result = st.session_state.result
     st.write("### Fichiers générés")
     if result["image_path"] and os.path.exists(result["image_path"]):